@@ -1,34 +1,233 @@
-from flask import Flask, render_template, request , redirect
-from markupsafe import escape
-from urllib.parse import urlparse
+import base64
+import functools
+import itertools
+import json
+import os
+from datetime import datetime, timezone
+import mimetypes
+from flask import Flask, Response, abort, jsonify, make_response, render_template, request , redirect, send_from_directory, stream_template, stream_with_context, url_for
+from markupsafe import Markup, escape
+from urllib.parse import urlencode, urlparse
+from werkzeug.security import safe_join
 from flask_paginate import Pagination, get_page_parameter
-from utils.update_template import get_recent_events, get_last_updated_date
+from utils.update_template import db_path as updates_db_path, get_recent_events, get_last_updated_date
 
 import db
-from models import Channel
+from utils.submission_queue import SubmissionQueue
+from utils.suggest import SuggestIndexes
+from utils.fragment_cache import FragmentCache
+from utils.reference_data import reference_data
+from utils.search_log import SKIP_HEADER as SKIP_SEARCH_LOG_HEADER, SearchLog
+from utils import assets, compression, metrics, profiling, sprites, static_pages
 
 app = Flask(__name__)
+app.config.from_mapping(
+    DATABASE='database.db',
+    # Set (e.g. FLASK_SUBMISSION_SPOOL_PATH=submissions.spool) to fsync queued
+    # submissions to disk so they survive a worker restart. Submissions that
+    # can't be written are moved to the same path plus ".rejected".
+    SUBMISSION_SPOOL_PATH=None,
+    # Cache-Control for pages and API responses. Browsers and proxies reuse a
+    # response for HTTP_CACHE_MAX_AGE seconds, then may keep serving it for up
+    # to HTTP_CACHE_STALE_WHILE_REVALIDATE more while they revalidate it with
+    # the ETag in the background.
+    HTTP_CACHE_MAX_AGE=60,
+    HTTP_CACHE_STALE_WHILE_REVALIDATE=600,
+    # Memory bound for the cache of rendered page sections.
+    FRAGMENT_CACHE_MAX_BYTES=32 * 1024 * 1024,
+    # How often (in seconds) to check data/*.txt for changes, and whether
+    # SIGHUP should make the next request reload them.
+    REFERENCE_DATA_CHECK_INTERVAL=5.0,
+    REFERENCE_DATA_RELOAD_ON_SIGHUP=False,
+    # Opt-in request profiling (see utils/profiling.py): a Server-Timing header
+    # on every response, and requests slower than PROFILING_SLOW_REQUEST_MS
+    # logged with their queries to PROFILING_LOG_PATH (or the app log), with
+    # query plans for statements slower than PROFILING_SLOW_QUERY_MS.
+    PROFILING=False,
+    PROFILING_SLOW_REQUEST_MS=200,
+    PROFILING_SLOW_QUERY_MS=50,
+    PROFILING_LOG_PATH=None,
+    # Prometheus metrics at /metrics and fragment cache stats at
+    # /api/cache-stats (see utils/metrics.py). They aren't access-controlled,
+    # so only turn them on behind a proxy that keeps them private. Ingest
+    # commands write their run metrics to METRICS_TEXTFILE_DIR, if it's set,
+    # for node_exporter's textfile collector.
+    METRICS=False,
+    METRICS_TEXTFILE_DIR=None,
+    # Rows per search page, and the most a per_page argument can ask for.
+    # Pages with at least SEARCH_STREAM_MIN_PER_PAGE rows are streamed: the
+    # top of the page is sent before the query runs and the rows follow as
+    # they're read.
+    SEARCH_PER_PAGE=80,
+    SEARCH_MAX_PER_PAGE=1000,
+    SEARCH_STREAM_MIN_PER_PAGE=200,
+    # Gzip HTML and JSON responses of at least COMPRESS_MIN_BYTES for clients
+    # that accept it, keeping up to COMPRESSED_CACHE_MAX_BYTES of compressed
+    # cacheable pages in memory.
+    COMPRESS_RESPONSES=True,
+    COMPRESS_MIN_BYTES=500,
+    COMPRESS_LEVEL=6,
+    COMPRESSED_CACHE_MAX_BYTES=8 * 1024 * 1024,
+    # Where `flask build-static` writes pre-rendered pages for a front proxy,
+    # and the site URL they're rendered for. When STATIC_PAGES_DIR is set,
+    # commands that add VODs rebuild the pages that changed.
+    STATIC_PAGES_DIR=None,
+    STATIC_PAGES_BASE_URL='https://www.rivals2vods.com/',
+    # Share of search, player and event page requests counted in search_log
+    # (0 turns it off), how often each worker writes its counts, and how many
+    # days of counts to keep.
+    SEARCH_LOG_SAMPLE_RATE=0.1,
+    SEARCH_LOG_FLUSH_INTERVAL=30.0,
+    SEARCH_LOG_RETENTION_DAYS=14,
+    # After adding VODs, commands request the WARM_CACHES_TOP most popular
+    # pages so the first visitors don't pay for cold caches. Set
+    # WARM_CACHES_URL (e.g. http://127.0.0.1:8000) to send the requests to the
+    # running site, which warms its caches too; otherwise they're rendered in
+    # the command, which only warms the database's pages in the OS cache.
+    WARM_CACHES_AFTER_INGEST=True,
+    WARM_CACHES_TOP=50,
+    WARM_CACHES_URL=None,
+)
+app.config.from_prefixed_env()
 db.init_app(app)
+profiling.init_app(app)
+metrics.init_app(app)
+compression.init_app(app)
 
+reference_data.check_interval = app.config['REFERENCE_DATA_CHECK_INTERVAL']
+if app.config['REFERENCE_DATA_RELOAD_ON_SIGHUP']:
+    reference_data.install_sighup_handler()
 
-# This injects recent events and last updated date into the template context for all routes
-# If we see performance issues with db queries we can refactor with a cache or something
+# Submissions are written in the background so a long-running ingest holding
+# the database lock doesn't make the form fail with "database is locked".
+submission_queue = SubmissionQueue(app.config['DATABASE'], spool_path=app.config['SUBMISSION_SPOOL_PATH'])
+
+# Sampled counts of the searches people run, for warm-caches.
+search_log = SearchLog(lambda: app.config['DATABASE'],
+                       sample_rate=app.config['SEARCH_LOG_SAMPLE_RATE'],
+                       flush_interval=app.config['SEARCH_LOG_FLUSH_INTERVAL'],
+                       retention_days=app.config['SEARCH_LOG_RETENTION_DAYS'])
+
+# In-memory typeahead indexes for /api/suggest.
+suggest_indexes = SuggestIndexes(db.suggestion_entries)
+
+# Rendered HTML for the VOD tables and the sections every page shares.
+fragment_cache = FragmentCache(app.config['FRAGMENT_CACHE_MAX_BYTES'])
+
+def newest_mtime(*directories):
+    return max(
+        (int(os.path.getmtime(os.path.join(root, name)))
+         for directory in directories
+         for root, _, names in os.walk(os.path.join(app.root_path, directory))
+         for name in names),
+        default=0)
+
+# The character icon stylesheet from `flask build-sprites`, if it's been run.
+# Like the templates, it's only reloaded on restart.
+SPRITES_PATH = os.path.join(app.static_folder, 'sprites')
+app.jinja_env.globals['character_sprites'] = sprites.load(SPRITES_PATH, '/sprites')
+
+# Hashed copies of the stylesheets and static files from `flask build-assets`,
+# if it's been run. Also only reloaded on restart.
+ASSETS_PATH = os.path.join(app.static_folder, 'assets')
+asset_manifest = assets.load(ASSETS_PATH)
+
+@app.template_global()
+def asset_url(name, external=False):
+    """The URL of the built copy of an asset (e.g. "styles.css" or "favicon.ico"),
+    or None if it hasn't been built, for templates to fall back on."""
+    filename = asset_manifest.get(name)
+    return url_for('asset_file', filename=filename, _external=external) if filename else None
+
+# Pages also depend on the templates, which are only reloaded on restart, and
+# the files in data/ (see reference_data), so those are folded into the ETag
+# and Last-Modified too.
+TEMPLATES_VERSION = newest_mtime('templates', 'static')
+
+def http_cached(view):
+    """Adds ETag, Last-Modified and Cache-Control to a GET view's responses, and
+    answers conditional requests with a 304 without calling the view.
+
+    The validators come from the data generation in metadata, so a response
+    stays valid until the VODs change.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        generation, updated_at = db.get_data_version()
+        site_version = max(TEMPLATES_VERSION, reference_data.version())
+        etag = f'{generation}-{site_version}'
+        last_modified = datetime.fromtimestamp(max(updated_at or 0, site_version), timezone.utc)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = bool(request.if_modified_since) and request.if_modified_since >= last_modified
+
+        response = Response(status=304) if not_modified else make_response(view(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            if 'Cache-Control' not in response.headers:
+                response.headers['Cache-Control'] = (
+                    f"public, max-age={app.config['HTTP_CACHE_MAX_AGE']}, "
+                    f"stale-while-revalidate={app.config['HTTP_CACHE_STALE_WHILE_REVALIDATE']}")
+        return response
+    return wrapper
+
+
+# This injects the recent events and last updated date section into the template context for all routes.
+# It only changes when the database does, so it's cached on the database file's mtime.
 @app.context_processor
 def inject_globals():
-    return {
-        "recent_events": get_recent_events(),
-        "last_updated": get_last_updated_date(),
-    }
+    if request.environ.get(static_pages.STATIC_BUILD):
+        # Pre-rendered pages include the bar from its own file, so they don't
+        # all go stale whenever it changes.
+        return {"updates_html": Markup(f'<!--# include virtual="{static_pages.UPDATES_PATH}" -->')}
+    return {"updates_html": updates_html()}
+
+def updates_html():
+    return Markup(fragment_cache.get_or_render(
+        ('updates', os.path.getmtime(updates_db_path)),
+        render_updates))
+
+def render_updates():
+    with profiling.phase('inject_globals'):
+        return app.jinja_env.get_template("updates/updates.jinja2").render(
+            recent_events=get_recent_events(),
+            last_updated=get_last_updated_date(),
+        )
+
+def credits_html():
+    return Markup(fragment_cache.get_or_render(
+        ('credits', reference_data.mtime('channels')),
+        lambda: render_template("credits/credits.jinja2", channels=get_channels())))
+
+def cached_vod_table(key, fetch):
+    """Returns (html, total) for a VOD table, using the fragment cache.
+
+    `key` identifies the query and page. `fetch()` returns (vods, total) and
+    is only called on a miss, so a hit skips the database as well as Jinja.
+    """
+    key = key + (db.get_data_generation(),)
+    cached = fragment_cache.get(key)
+    if cached is None:
+        vods, total = fetch()
+        html = render_template("table/vods_table.jinja2", vods=vods)
+        cached = (Markup(html), total)
+        fragment_cache.put(key, cached, len(html))
+    return cached
 
 def get_channels():
-    channels = []
-    with open('data/channel_ids.txt') as f:
-        for line in f.readlines():
-            url, rest = line.split(': ')
-            _, name = rest.split(' ')[0], rest.split(' ')[1:]
-            name = ' '.join(name)
-            channels.append(Channel(url=url, name=name))
-    return channels
+    return reference_data.get('channels')
+
+def parse_date_arg(value):
+    """Parses a YYYY-MM-DD query argument into a UTC epoch, or None."""
+    if not value:
+        return None
+    try:
+        return int(datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
 
 def validate_submission_input(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date):
     if not url:
@@ -76,60 +275,186 @@ def validate_submission_input(url, p1_char, p2_char, p1_tag, p2_tag, event, roun
     #     pagination=pagination
     # )
     # return redirect("/search", code=302)
-@app.route("/")
-def search_page():
-    p1 = request.args.get('p1') or ''
-    p2 = request.args.get('p2') or ''
-    c1 = request.args.get('c1')
+def search_args(args):
+    """Reads the search filters from query arguments: (p1, p2, c1, c2, event, rank, after, before)."""
+    p1 = args.get('p1') or ''
+    p2 = args.get('p2') or ''
+    c1 = args.get('c1')
     if not c1 or c1.lower() == 'any':
         c1 = ''
-    c2 = request.args.get('c2')
+    c2 = args.get('c2')
     if not c2 or c2.lower() == 'any':
         c2 = ''
-    event = request.args.get('event') or ''
-    rank = request.args.get('rank')
+    event = args.get('event') or ''
+    rank = args.get('rank')
     if not rank or rank.lower() == 'any':
         rank = ''
 
-    search_results = list(db.search_vods(p1, p2, c1, c2, event, rank))
-    patches = db.load_patches()
-    vods = db.patch_vods(search_results, patches)
+    after = parse_date_arg(args.get('after'))
+    before = parse_date_arg(args.get('before'))
+    return p1, p2, c1, c2, event, rank, after, before
+
+def canonical_search_args(args):
+    """The search arguments that change the results, normalized and sorted by name.
+
+    Filters set to "any" or left empty are dropped, as are unknown arguments
+    and page=1, so equivalent searches share one URL (and one cache entry).
+    """
+    canonical = canonical_page_args(args)
+    for key in ('p1', 'p2', 'event'):
+        value = (args.get(key) or '').strip()
+        if value:
+            canonical.append((key, value))
+    for key in ('c1', 'c2', 'rank'):
+        value = (args.get(key) or '').strip().lower()
+        if value and value != 'any':
+            canonical.append((key, value))
+    for key in ('after', 'before'):
+        if parse_date_arg(args.get(key)) is not None:
+            canonical.append((key, args[key]))
+    per_page = search_per_page(args)
+    if per_page != app.config['SEARCH_PER_PAGE']:
+        canonical.append(('per_page', str(per_page)))
+    return sorted(canonical)
+
+def search_per_page(args):
+    per_page = args.get('per_page', type=int, default=app.config['SEARCH_PER_PAGE'])
+    return max(1, min(per_page, app.config['SEARCH_MAX_PER_PAGE']))
 
-    #pagination
+def canonical_page_args(args):
+    page = args.get(get_page_parameter(), type=int, default=1)
+    return [(get_page_parameter(), str(page))] if page > 1 else []
+
+def canonical_redirect(canonical):
+    """Redirects to the canonical form of the current URL, or returns None if it's already canonical."""
+    if canonical == list(request.args.items(multi=True)):
+        return None
+    return redirect(request.path + ('?' + urlencode(canonical) if canonical else ''), code=301)
+
+@app.route("/")
+@http_cached
+def search_page():
+    redirect_response = canonical_redirect(canonical_search_args(request.args))
+    if redirect_response:
+        return redirect_response
+
+    p1, p2, c1, c2, event, rank, after, before = search_args(request.args)
+    record_search()
 
     page = request.args.get(get_page_parameter(), type=int, default=1)
-    per_page = 80
+    per_page = search_per_page(request.args)
     offset = (page - 1) * per_page
-    total = len(vods)
+    search_context = dict(c1=c1, c2=c2, p1=p1, p2=p2, event=event, rank=rank, is_search=True)
 
-    # slice vods for current page
-    vods = vods[offset: offset + per_page]
-    pagination = Pagination(
-        page=page,
-        per_page=per_page,
-        total=total,
-        inner_window=2,
-        outer_window=1,
-        prev_label='<&nbsp;&nbsp;&nbsp;Previous',
-        next_label='Next&nbsp;&nbsp;&nbsp;>',
-        css_framework='bootstrap5',
-        bs_version=5,
-        display_msg="{start} - {end} / {total}"
-    )
+    if per_page >= app.config['SEARCH_STREAM_MIN_PER_PAGE']:
+        return stream_search_page((p1, p2, c1, c2, event, rank, after, before), page, per_page, search_context)
+
+    def fetch():
+        with profiling.phase('search_vods'):
+            return db.search_vods_page(p1, p2, c1, c2, event, rank, amount=per_page, offset=offset,
+                                       after=after, before=before, patches=db.load_patches())
+
+    vods_table_html, total = cached_vod_table(('search', tuple(canonical_search_args(request.args))), fetch)
+    metrics.search_results.observe(total)
+    pagination = make_pagination(page, per_page, total)
     
     return render_template(
         "home.jinja2",
-        vods=vods,
-        c1=c1,
-        c2=c2,
-        p1=p1,
-        p2=p2,
-        event=event,
-        rank=rank,
-        channels=get_channels(),
-        is_search=True,
+        vods_table_html=vods_table_html,
         pagination=pagination,
+        **search_context,
+        )
+
+def record_search():
+    """Counts the current (canonical) request in the search log, ignoring the page number.
+
+    Requests from build-static and warm-caches aren't counted, or they'd
+    keep promoting the pages they render.
+    """
+    if request.environ.get(static_pages.STATIC_BUILD) or SKIP_SEARCH_LOG_HEADER in request.headers:
+        return
+    args = [(key, value) for (key, value) in request.args.items(multi=True) if key != get_page_parameter()]
+    search_log.record(request.path + ('?' + urlencode(args) if args else ''))
+
+# Marks where a streamed page is flushed. It's only defined when streaming,
+# so other renders of the same template output nothing there.
+STREAM_FLUSH = '\x00flush\x00'
+
+def stream_search_page(args, page, per_page, search_context):
+    """Streams a search page, for large per_page values.
+
+    The head, navbar, styles and search form are sent before the query runs.
+    The table rows are then rendered as they come off the cursor, and the
+    pagination (which needs the total, a separate COUNT) is rendered last.
+    Streamed pages skip the fragment cache.
+    """
+    p1, p2, c1, c2, event, rank, after, before = args
+    vods, total = db.stream_search_vods(p1, p2, c1, c2, event, rank, amount=per_page, offset=(page - 1) * per_page,
+                                        after=after, before=before, patches=db.load_patches())
+
+    def count():
+        result = total()
+        metrics.search_results.observe(result)
+        return result
+
+    chunks = stream_template(
+        "home.jinja2",
+        vods=StreamedVods(vods),
+        pagination=LazyPagination(page, per_page, count),
+        stream_flush=STREAM_FLUSH,
+        **search_context,
         )
+    return Response(buffered_stream(chunks), mimetype='text/html')
+
+def buffered_stream(chunks, batch_size=2048):
+    """Sends everything before STREAM_FLUSH at once, then joins the rest of
+    a template's many small chunks `batch_size` at a time (a few dozen table
+    rows), so there's one write per batch instead of one per chunk."""
+    chunks = iter(chunks)
+    head = []
+    for chunk in chunks:
+        if chunk == STREAM_FLUSH:
+            break
+        head.append(chunk)
+    yield ''.join(head)
+    while True:
+        batch = list(itertools.islice(chunks, batch_size))
+        if not batch:
+            break
+        yield ''.join(batch)
+
+class StreamedVods:
+    """The Vods for a streamed table. Checking whether it's empty (the table
+    template's `{% if vods %}`) reads the first row, without losing it."""
+
+    def __init__(self, vods):
+        self._vods = iter(vods)
+        self._head = None
+
+    def __bool__(self):
+        if self._head is None:
+            self._head = list(itertools.islice(self._vods, 1))
+        return bool(self._head)
+
+    def __iter__(self):
+        bool(self)
+        head, self._head = self._head, []
+        return itertools.chain(head, self._vods)
+
+class LazyPagination:
+    """Pagination for a streamed page, built the first time it's used, so the
+    total is only counted once the rows before it have been sent."""
+
+    def __init__(self, page, per_page, total):
+        self.page = page
+        self.per_page = per_page
+        self._total = total
+        self._pagination = None
+
+    def __getattr__(self, name):
+        if self._pagination is None:
+            self._pagination = make_pagination(self.page, self.per_page, self._total())
+        return getattr(self._pagination, name)
 
 @app.post("/submission")
 def vod_post():
@@ -148,25 +473,242 @@ def vod_post():
 
     error = validate_submission_input(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date)
     if not error:
-        db.create_submission(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date)
+        submission_queue.put((url, p1_char, p2_char, p1_tag, p2_tag, event, round, date))
         return render_template('submission_success.jinja2')
     return render_template('submission_fail.jinja2')
 
+class CanonicalPagination(Pagination):
+    """Pagination with links in the canonical URL form, so following one doesn't redirect."""
+
+    def page_href(self, page):
+        args = [(key, value) for (key, value) in request.args.items(multi=True) if key != self.page_parameter]
+        if page and page > 1:
+            args.append((self.page_parameter, str(page)))
+        args.sort()
+        return request.path + ('?' + urlencode(args) if args else '')
+
+def make_pagination(page, per_page, total):
+    return CanonicalPagination(
+        page=page,
+        per_page=per_page,
+        total=total,
+        inner_window=2,
+        outer_window=1,
+        prev_label='<&nbsp;&nbsp;&nbsp;Previous',
+        next_label='Next&nbsp;&nbsp;&nbsp;>',
+        css_framework='bootstrap5',
+        bs_version=5,
+        display_msg="{start} - {end} / {total}"
+    )
+
+def render_profile(profile, fetch_vods, cache_key):
+    """Renders a player or event page. `fetch_vods(amount, offset)` returns a page of Vods with their patches."""
+    if profile is None:
+        abort(404)
+    redirect_response = canonical_redirect(canonical_page_args(request.args))
+    if redirect_response:
+        return redirect_response
+    record_search()
+
+    page = request.args.get(get_page_parameter(), type=int, default=1)
+    per_page = 80
+    vods_table_html, _ = cached_vod_table(
+        cache_key + (page,),
+        lambda: (fetch_vods(per_page, (page - 1) * per_page), profile["vods"]))
+
+    return render_template(
+        "home.jinja2",
+        profile=profile,
+        vods_table_html=vods_table_html,
+        pagination=make_pagination(page, per_page, profile["vods"]),
+        )
+
+@app.route("/player/<int:player_id>")
+@http_cached
+def player_page(player_id):
+    return render_profile(
+        db.get_player_profile(player_id),
+        lambda amount, offset: db.player_vods(player_id, amount, offset, db.load_patches()),
+        ('player', player_id))
+
+@app.route("/event/<int:event_id>")
+@http_cached
+def event_page(event_id):
+    return render_profile(
+        db.get_event_profile(event_id),
+        lambda amount, offset: db.event_vods(event_id, amount, offset, db.load_patches()),
+        ('event', event_id))
+
 @app.route("/submit")
+@http_cached
 def submit_page():
     return render_template("home.jinja2")
 
+@app.route("/stats")
+@http_cached
+def stats_page():
+    return render_template(
+        "home.jinja2",
+        stats=db.get_stats(),
+        )
+
+@app.route("/api/stats")
+@http_cached
+def stats_api():
+    return jsonify(db.get_stats())
+
+def vod_json(vod):
+    return {
+        "id": vod.vod_id,
+        "url": vod.url,
+        "date": vod.vod_date.strftime('%Y-%m-%d') if vod.vod_date else None,
+        "event": vod.event_name,
+        "event_id": vod.event_id,
+        "round": vod.round,
+        "p1": vod.p1_tag,
+        "p1_id": vod.p1_id,
+        "c1": vod.c1_name,
+        "p2": vod.p2_tag,
+        "p2_id": vod.p2_id,
+        "c2": vod.c2_name,
+        "p3": vod.p3_tag,
+        "p4": vod.p4_tag,
+    }
+
+def encode_cursor(vod):
+    return base64.urlsafe_b64encode(json.dumps([vod.vod_ts, vod.vod_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Returns the (vod_ts, id) key in a cursor from encode_cursor, or None if it's invalid."""
+    try:
+        vod_ts, vod_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(vod_id, int) or not (vod_ts is None or isinstance(vod_ts, int)):
+        return None
+    return vod_ts, vod_id
+
+@app.route("/api/vods")
+@http_cached
+def vods_api():
+    """VOD search results for bots and other tools. Takes the same filters as the search page.
+
+    By default returns a page of results as JSON with a `next_cursor` to pass
+    back as `cursor` for the next page. With format=ndjson, streams every
+    result as one JSON object per line.
+
+    Clients can poll with If-None-Match, see http_cached.
+    """
+    query = db.vod_search_query(*search_args(request.args))
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for vod in db.iter_vods(**query):
+                yield json.dumps(vod_json(vod)) + '\n'
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    else:
+        limit = min(max(request.args.get('limit', type=int, default=100), 1), 1000)
+        after_key = None
+        if request.args.get('cursor'):
+            after_key = decode_cursor(request.args['cursor'])
+            if after_key is None:
+                return jsonify({"error": "invalid cursor"}), 400
+
+        # One extra row tells us whether there's another page.
+        vods = db.query_vods(amount=limit + 1, after_key=after_key, **query)
+        response = jsonify({
+            "vods": [vod_json(vod) for vod in vods[:limit]],
+            "next_cursor": encode_cursor(vods[limit - 1]) if len(vods) > limit else None,
+        })
+    return response
+
+@app.route("/api/suggest")
+@http_cached
+def suggest_api():
+    field = request.args.get('field')
+    if field not in ('player', 'event'):
+        return jsonify({"error": "field must be player or event"}), 400
+    query = request.args.get('q') or ''
+    limit = request.args.get('limit', type=int, default=10)
+
+    index = suggest_indexes.get(field, db.get_data_generation())
+    response = jsonify([{"name": name, "vods": vods} for (name, vods) in index.suggest(query, limit)])
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response
+
+@app.route("/api/cache-stats")
+def cache_stats_api():
+    if not metrics.enabled:
+        abort(404)
+    return jsonify(fragment_cache.stats())
+
+@app.route("/sprites/<path:filename>")
+def sprites_file(filename):
+    # The file names are fingerprinted, so they can be cached forever.
+    response = send_from_directory(SPRITES_PATH, filename, max_age=365 * 24 * 60 * 60)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/assets/<path:filename>")
+def asset_file(filename):
+    # Hashed file names change with their contents, so they can be cached forever.
+    max_age = 365 * 24 * 60 * 60
+    gzipped = filename + '.gz'
+    if request.accept_encodings['gzip'] and safe_join(ASSETS_PATH, gzipped) and os.path.isfile(safe_join(ASSETS_PATH, gzipped)):
+        response = send_from_directory(ASSETS_PATH, gzipped, max_age=max_age,
+                                       mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(ASSETS_PATH, filename, max_age=max_age)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/metrics")
+def metrics_page():
+    if not metrics.enabled:
+        abort(404)
+    response = Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+    response.cache_control.no_store = True
+    return response
+
+def table_sizes():
+    cursor = db.get_db().cursor()
+    return [((table,), cursor.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0])
+            for table in ('vod', 'player', 'event')]
+
+def fragment_cache_stat(name):
+    return lambda: fragment_cache.stats()[name]
+
+metrics.registry.gauge('vods_fragment_cache_hits_total', 'Fragment cache hits.', fragment_cache_stat('hits'), type='counter')
+metrics.registry.gauge('vods_fragment_cache_misses_total', 'Fragment cache misses.', fragment_cache_stat('misses'), type='counter')
+metrics.registry.gauge('vods_fragment_cache_hit_ratio', 'Share of fragment cache lookups that were hits.', fragment_cache_stat('hit_rate'))
+metrics.registry.gauge('vods_fragment_cache_entries', 'Fragments in the cache.', fragment_cache_stat('entries'))
+metrics.registry.gauge('vods_fragment_cache_bytes', 'Size of the cached fragments.', fragment_cache_stat('bytes'))
+metrics.registry.gauge('vods_submission_queue_depth', 'Submissions waiting to be written.', submission_queue.depth)
+metrics.registry.gauge('vods_table_rows', 'Rows in each table.', table_sizes, labelnames=('table',))
+
 @app.route("/credits")
+@http_cached
 def credits_page():
     return render_template(
         "home.jinja2",
-        channels=get_channels(),
+        credits_html=credits_html(),
         )
 
+@app.route(static_pages.UPDATES_PATH)
+def updates_bar():
+    """The "last updated" bar on its own, for pre-rendered pages to include."""
+    return updates_html()
+
 @app.route("/contact")
+@http_cached
 def contact_page():
     return render_template("home.jinja2")
 
 @app.route("/about")
+@http_cached
 def about_page():
     return render_template("home.jinja2")
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""Measures how long a web worker takes to import the app, and its memory after.
+
+Imports app.py in fresh interpreters with `python -X importtime` and reports
+the median import time, peak resident memory, and the modules that took
+longest. Exits non-zero if either is over budget, or if a module only the
+CLI needs (see utils/cli.py) was imported.
+
+    python benchmarks/importtime.py [--budget-ms 300] [--budget-rss-mb 48] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Modules the web path shouldn't load: the commands and the client libraries they use.
+CLI_ONLY_MODULES = ['commands', 'gspread', 'google.oauth2', 'google.genai', 'googleapiclient']
+
+CHILD = f"""
+import json, resource, sys
+import app
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'rss_kb': rss / 1024 if sys.platform == 'darwin' else rss,
+    'cli_modules': [name for name in {CLI_ONLY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def import_app():
+    """Returns (microseconds per module, rss_kb, CLI-only modules loaded) from a fresh interpreter."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    # A module is listed after the ones it imports, indented by two spaces
+    # per level, so app's direct imports are the one-level lines before it.
+    timings, children = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == 'app':
+                timings = {**children, 'app': int(cumulative)}
+            children = {}
+        elif depth == 1:
+            children[name.strip()] = int(cumulative)
+    output = json.loads(result.stdout)
+    return timings, output['rss_kb'], output['cli_modules']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=300)
+    parser.add_argument('--budget-rss-mb', type=float, default=48)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [import_app() for _ in range(args.repeat)]
+    import_ms = statistics.median(timings['app'] for (timings, _, _) in runs) / 1000
+    rss_mb = max(rss_kb for (_, rss_kb, _) in runs) / 1024
+    cli_modules = runs[0][2]
+
+    slowest = sorted(((name, statistics.median(timings.get(name, 0) for (timings, _, _) in runs) / 1000)
+                      for name in runs[0][0] if name != 'app'), key=lambda item: -item[1])
+    for name, ms in slowest[:8]:
+        print(f'  {name:36} {ms:7.1f}ms')
+    print(f'import app {import_ms:7.1f}ms  rss {rss_mb:6.1f}MB')
+
+    failed = False
+    if import_ms > args.budget_ms:
+        print(f'import time over the {args.budget_ms:.0f}ms budget')
+        failed = True
+    if rss_mb > args.budget_rss_mb:
+        print(f'resident memory over the {args.budget_rss_mb:.0f}MB budget')
+        failed = True
+    if cli_modules:
+        print(f"imported CLI-only modules: {', '.join(cli_modules)}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""Replays a mix of requests against the site, optionally while an ingest runs.
+
+Without --url, starts the site with `flask run` on a copy of the database
+(FLASK_DATABASE, or database.db), so submissions and the ingest don't touch
+the original. The requests are either replayed from an access log (--log,
+GET and HEAD lines in common/combined log format) or synthesized from the
+database: searches, player and event pages, the API, and form submissions.
+
+--ingest-vods N runs `flask ingest-csv` on N new VODs made from existing
+players and events partway through, and --ingest-command runs any other
+command, to reproduce the lock contention between the site and ingests.
+
+Reports throughput, latency percentiles per kind of request (overall and
+while the ingest ran), errors, "database is locked" lines in the server's
+log, and how many submissions made it to the database. Standard library only.
+
+    python benchmarks/loadtest.py [--concurrency 8] [--requests 2000] [--ingest-vods 5000]
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --log access.log --duration 60
+"""
+import argparse
+import csv
+import http.client
+import itertools
+import json
+import os
+import random
+import re
+import shlex
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from urllib.parse import quote_plus, urlencode, urlsplit
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+LOG_LINE = re.compile(r'"(GET|HEAD) (\S+) HTTP/[\d.]+"')
+
+ROUNDS = ['Winners Round 1', 'Winners Semis', 'Losers Quarters', 'Losers Finals', 'Grand Finals']
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))] if sorted_values else 0
+
+
+def kind(method, path):
+    """What to group a request's latency under, e.g. "/player" or "/ search"."""
+    url = urlsplit(path)
+    if method == 'POST':
+        return url.path
+    if url.path == '/':
+        return '/ search' if url.query else '/'
+    parts = url.path.split('/')
+    return '/'.join(parts[:3]) if parts[1] == 'api' else '/' + parts[1]
+
+
+def read_log(path):
+    """(method, path, body) for each GET or HEAD request in an access log."""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return [(m.group(1), m.group(2), None) for m in map(LOG_LINE.search, f) if m]
+
+
+def sample_names(cursor, query, limit=500):
+    return [row[0] for row in cursor.execute(query + f" LIMIT {limit};")]
+
+
+def synthesize(database, count, rng):
+    """A mix of `count` requests weighted like the site's traffic, for the VODs in `database`."""
+    connection = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    cursor = connection.cursor()
+    players = sample_names(cursor, "SELECT p.tag FROM stat_player s INNER JOIN player p ON p.id = s.player_id ORDER BY s.vods DESC")
+    player_ids = sample_names(cursor, "SELECT player_id FROM stat_player ORDER BY vods DESC")
+    event_ids = sample_names(cursor, "SELECT id FROM event ORDER BY id DESC")
+    characters = sample_names(cursor, "SELECT lower(name) FROM game_character WHERE name != 'Random'")
+    connection.close()
+
+    def search(**args):
+        return '/?' + urlencode(sorted(args.items()))
+
+    def submission():
+        return ('POST', '/submission', {
+            'url': f'https://www.youtube.com/watch?v=lt{rng.getrandbits(40):010x}',
+            'p1_tag': rng.choice(players), 'p1_char': rng.choice(characters),
+            'p2_tag': rng.choice(players), 'p2_char': rng.choice(characters),
+            'event': 'Load Test', 'round': rng.choice(ROUNDS), 'date': date.today().isoformat(),
+        })
+
+    requests = [
+        (20, lambda: ('GET', '/', None)),
+        (15, lambda: ('GET', search(c1=rng.choice(characters), c2=rng.choice(characters)), None)),
+        (15, lambda: ('GET', search(p1=rng.choice(players)), None)),
+        (5, lambda: ('GET', search(rank=rng.choice(['one_lunarank', 'two_lunarank', 'one_alexrank', 'two_alexrank'])), None)),
+        (10, lambda: ('GET', f'/event/{rng.choice(event_ids)}', None)),
+        (10, lambda: ('GET', f'/player/{rng.choice(player_ids)}', None)),
+        (10, lambda: ('GET', f'/api/suggest?field=player&q={quote_plus(rng.choice(players)[:3])}', None)),
+        (5, lambda: ('GET', '/api/vods?' + urlencode({'c1': rng.choice(characters)}), None)),
+        (3, lambda: ('GET', '/credits', None)),
+        (2, lambda: ('GET', '/stats', None)),
+        (5, submission),
+    ]
+    weights = [weight for (weight, _) in requests]
+    return [rng.choices(requests, weights)[0][1]() for _ in range(count)]
+
+
+def write_ingest_csv(database, path, count, rng):
+    """Writes `count` new VODs between existing players at existing events, in ingest-csv's format."""
+    connection = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    cursor = connection.cursor()
+    players = sample_names(cursor, "SELECT tag FROM player", limit=5000)
+    events = sample_names(cursor, "SELECT name FROM event ORDER BY id DESC", limit=50)
+    characters = sample_names(cursor, "SELECT name FROM game_character WHERE name != 'Random'")
+    connection.close()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(
+            (f'https://www.youtube.com/watch?v=in{rng.getrandbits(40):010x}',
+             rng.choice(players), rng.choice(characters), rng.choice(players), rng.choice(characters),
+             rng.choice(events), rng.choice(ROUNDS), f'{date.today().isoformat()} 12:00:00+00:00')
+            for _ in range(count))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def flask_command(database, args, **kwargs):
+    return subprocess.Popen([sys.executable, '-m', 'flask', '--app', 'app', *args], cwd=ROOT,
+                            env={**os.environ, 'FLASK_DATABASE': database}, **kwargs)
+
+
+def wait_for_server(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'the site did not start on {host}:{port}')
+
+
+class Ingest:
+    """Runs a flask command in the background after `delay` seconds, recording when it ran."""
+
+    def __init__(self, database, args, delay):
+        self.database = database
+        self.args = args
+        self.delay = delay
+        self.started = self.finished = None
+        self.returncode = None
+        self.output = ''
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        time.sleep(self.delay)
+        self.started = time.monotonic()
+        process = flask_command(self.database, self.args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        self.output, _ = process.communicate()
+        self.returncode = process.returncode
+        self.finished = time.monotonic()
+
+    def overlaps(self, start, end):
+        return self.started is not None and start < (self.finished or float('inf')) and end > self.started
+
+
+def run_load(host, port, requests, concurrency, duration, timeout):
+    """Sends the requests from `concurrency` threads, each with its own
+    connection. Returns (start, end, kind, status or None, error) per request."""
+    source = iter(requests) if not duration else itertools.cycle(requests)
+    source_lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+    results = []
+
+    def worker():
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        while True:
+            if deadline and time.monotonic() >= deadline:
+                break
+            with source_lock:
+                request = next(source, None)
+            if request is None:
+                break
+            method, path, form = request
+            body = urlencode(form) if form else None
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+            start = time.monotonic()
+            status, error = None, None
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                content = response.read()
+                status = response.status
+                if b'database is locked' in content:
+                    error = 'database is locked'
+            except (OSError, http.client.HTTPException) as e:
+                error = type(e).__name__
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=timeout)
+            results.append((start, time.monotonic(), kind(method, path), status, error))
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results):
+    by_kind = {}
+    for start, end, request_kind, status, error in results:
+        by_kind.setdefault(request_kind, []).append((end - start, status, error))
+    summary = {}
+    for request_kind, rows in sorted(by_kind.items(), key=lambda item: -len(item[1])):
+        latencies = sorted(latency * 1000 for (latency, _, _) in rows)
+        summary[request_kind] = {
+            'requests': len(rows),
+            'errors': sum(1 for (_, status, error) in rows if error or status is None or status >= 400),
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p90_ms': round(percentile(latencies, 0.9), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+        }
+    return summary
+
+
+def print_summary(title, summary):
+    print(title)
+    print(f"  {'kind':16} {'requests':>8} {'errors':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for request_kind, s in summary.items():
+        print(f"  {request_kind:16} {s['requests']:8} {s['errors']:7} {s['p50_ms']:7.1f}ms "
+              f"{s['p90_ms']:7.1f}ms {s['p99_ms']:7.1f}ms {s['max_ms']:7.1f}ms")
+
+
+def count_submissions(database):
+    connection = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM submission;").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='A running site to test. By default one is started on a copy of the database.')
+    parser.add_argument('--database', default=os.environ.get('FLASK_DATABASE', os.path.join(ROOT, 'database.db')),
+                        help='The database to synthesize requests from, and to copy for the site (or ingest into, with --url).')
+    parser.add_argument('--log', help='Replay the GET and HEAD requests in this access log instead of synthesizing them.')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests to synthesize.')
+    parser.add_argument('--duration', type=float, help='Keep replaying the requests for this many seconds.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--ingest-vods', type=int, help='Run ingest-csv on this many new VODs during the load.')
+    parser.add_argument('--ingest-command', help='Run this flask command (e.g. "promote-staging --all") during the load.')
+    parser.add_argument('--ingest-delay', type=float, default=1.0, help='Seconds into the load to start the ingest.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Also write the results as JSON here.')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    requests = read_log(args.log) if args.log else synthesize(args.database, args.requests, rng)
+    if not requests:
+        sys.exit('No requests to replay.')
+
+    with tempfile.TemporaryDirectory() as directory:
+        server, server_log_path = None, os.path.join(directory, 'server.log')
+        database = args.database
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            database = os.path.join(directory, 'loadtest.db')
+            shutil.copy(args.database, database)
+            host, port = '127.0.0.1', free_port()
+            with open(server_log_path, 'w') as server_log:
+                server = flask_command(database, ['run', '--port', str(port), '--with-threads', '--no-reload', '--no-debugger'],
+                                       stdout=server_log, stderr=subprocess.STDOUT)
+            wait_for_server(host, port)
+
+        ingest = None
+        if args.ingest_vods or args.ingest_command:
+            if args.ingest_vods:
+                csv_path = os.path.join(directory, 'ingest.csv')
+                write_ingest_csv(database, csv_path, args.ingest_vods, rng)
+                ingest_args = ['ingest-csv', csv_path]
+            else:
+                ingest_args = shlex.split(args.ingest_command)
+            if args.url:
+                print(f'Running {" ".join(ingest_args)} against {database}, which the site at {args.url} should be using.')
+            ingest = Ingest(database, ingest_args, args.ingest_delay)
+            ingest.thread.start()
+
+        submissions_before = count_submissions(database)
+        start = time.monotonic()
+        results = run_load(host, port, requests, args.concurrency, args.duration, args.timeout)
+        elapsed = time.monotonic() - start
+        if ingest:
+            ingest.thread.join()
+        # Give the submission writer a moment to drain its queue.
+        time.sleep(1.5)
+        submissions_stored = count_submissions(database) - submissions_before
+
+        if server:
+            server.terminate()
+            server.wait()
+            with open(server_log_path, encoding='utf-8', errors='replace') as f:
+                locked_in_log = sum(1 for line in f if 'database is locked' in line)
+
+    summary = summarize(results)
+    errors = sum(s['errors'] for s in summary.values())
+    report = {
+        'requests': len(results),
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(len(results) / elapsed, 1),
+        'errors': errors,
+        'error_rate': round(errors / len(results), 4),
+        'by_kind': summary,
+        'submissions_posted': summary.get('/submission', {}).get('requests', 0),
+        'submissions_stored': submissions_stored,
+    }
+    print_summary(f'{len(results)} requests in {elapsed:.1f}s from {args.concurrency} connections: '
+                  f"{report['requests_per_second']} req/s, {errors} errors ({report['error_rate']:.2%})", summary)
+
+    if ingest:
+        during = [r for r in results if ingest.overlaps(r[0], r[1])]
+        report['ingest'] = {
+            'command': ingest.args,
+            'returncode': ingest.returncode,
+            'seconds': round(ingest.finished - ingest.started, 2),
+            'by_kind_during': summarize(during),
+        }
+        print(f"\ningest {' '.join(ingest.args)}: exit {ingest.returncode} after {report['ingest']['seconds']}s")
+        if ingest.returncode:
+            print(ingest.output.strip())
+        print_summary(f'{len(during)} requests while it ran', report['ingest']['by_kind_during'])
+
+    print(f"\nsubmissions: {report['submissions_posted']} posted, {submissions_stored} stored")
+    if server:
+        report['database_locked_in_log'] = locked_in_log
+        print(f'"database is locked" in the server log: {locked_in_log}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Measures peak Python memory per search request with tracemalloc.
+
+Requests each search through the test client against the database
+(FLASK_DATABASE, or database.db), with the fragment cache cleared first so
+every request runs the query and renders the table. Exits non-zero if a
+request's peak is over the budget.
+
+    python benchmarks/memory.py [--budget-kb 2048] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as vods_app  # noqa: E402
+
+
+SEARCHES = [
+    '/',
+    '/?c1=ranno',
+    '/?c1=ranno&c2=zetterburn',
+    '/?p1=Landon',
+    '/?event=Genesis+X3',
+    '/?rank=one_lunarank',
+    '/?rank=two_lunarank',
+    # Every dated VOD, the largest result a search can have.
+    '/?after=2000-01-01',
+    '/?after=2000-01-01&page=40',
+    # Streamed pages, whose rows are rendered as they're read.
+    '/?after=2000-01-01&per_page=1000',
+    '/?after=2000-01-01&page=5&per_page=1000',
+]
+
+
+def request(client, url):
+    """Requests `url` and reads the body a chunk at a time, throwing it away,
+    so streamed pages (which are only rendered as they're read) are measured
+    without the test client holding the whole page."""
+    response = client.get(url, buffered=False)
+    for _ in response.iter_encoded():
+        pass
+    response.close()
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-kb', type=float, default=2048)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    client = vods_app.app.test_client()
+    # Warm up imports, templates and reference data, so they aren't counted.
+    for url in SEARCHES:
+        request(client, url)
+
+    failed = False
+    tracemalloc.start()
+    for url in SEARCHES:
+        peaks, timings = [], []
+        for _ in range(args.repeat):
+            vods_app.fragment_cache.clear()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            response = request(client, url)
+            timings.append((time.perf_counter() - start) * 1000)
+            peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+            assert response.status_code == 200, (url, response.status_code)
+
+        # The lowest of the repeats, so one-off allocations (a search log flush, a
+        # garbage collection) don't make the check flaky. A leak or a per-row
+        # cost shows up in every repeat.
+        peak = min(peaks)
+        print(f'{url:32} peak {peak:8.1f}KB  {min(timings):7.1f}ms')
+        if peak > args.budget_kb:
+            print(f'{url}: peak over the {args.budget_kb:.0f}KB budget')
+            failed = True
+    tracemalloc.stop()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measures /api/suggest lookup latency, without the HTTP layer.
+
+Builds the player and event indexes from the database (FLASK_DATABASE, or
+database.db) and times lookups for prefixes and misspellings of real names.
+Exits non-zero if the p99 is over the budget.
+
+    python benchmarks/suggest.py [--budget-ms 1.0] [--queries 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import app  # noqa: E402
+import db  # noqa: E402
+from utils.suggest import SuggestIndex  # noqa: E402
+
+
+def sample_queries(names, count, rng):
+    queries = []
+    for _ in range(count):
+        name = rng.choice(names)
+        if len(name) > 3 and rng.random() < 0.2:
+            # Drop a character, like a typo.
+            i = rng.randrange(len(name))
+            queries.append(name[:i] + name[i + 1:])
+        else:
+            queries.append(name[:rng.randint(1, min(len(name), 8))])
+    return queries
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=1.0)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = False
+    with app.app_context():
+        for field in ('player', 'event'):
+            entries = db.suggestion_entries(field)
+            start = time.perf_counter()
+            index = SuggestIndex(entries)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            queries = sample_queries([name for (name, _) in entries if name.strip()], args.queries, rng)
+            timings = []
+            for query in queries:
+                start = time.perf_counter_ns()
+                index.suggest(query)
+                timings.append(time.perf_counter_ns() - start)
+            timings.sort()
+
+            p50, p99 = percentile(timings, 0.5) / 1e6, percentile(timings, 0.99) / 1e6
+            print(f'{field}: {len(index)} names, built in {build_ms:.1f}ms, '
+                  f'p50 {p50:.3f}ms, p99 {p99:.3f}ms, max {timings[-1] / 1e6:.3f}ms')
+            if p99 > args.budget_ms:
+                print(f'{field}: p99 over the {args.budget_ms}ms budget')
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
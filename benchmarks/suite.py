@@ -0,0 +1,217 @@
+"""Times the hot paths against a synthetic catalogue and reports JSON.
+
+Generates (or reuses) a database from benchmarks/synthetic.py with --vods
+VODs, or uses --database, and times searches, attaching patches, ingest-csv,
+export-csv, title parsing and whole search pages. Prints a summary and
+writes the results as JSON to --output (or stdout). With --compare, exits
+non-zero if a case's median got slower than the baseline's by more than
+--tolerance.
+
+    python benchmarks/suite.py --vods 100000 --output results.json
+    python benchmarks/suite.py --vods 100000 --compare results.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as vods_app  # noqa: E402
+import commands  # noqa: E402
+import db  # noqa: E402
+import synthetic  # noqa: E402
+
+
+TITLE_FORMAT = '%P1 (%C1) %V %P2 (%C2)'
+INGEST_ROWS = 1000
+TITLES = 5000
+
+
+def search_mixes(catalogue):
+    """(name, search arguments) for representative searches: the most common
+    player, matchup and event, and a rank list (two_ needs both players ranked,
+    which takes a slower path)."""
+    top_player = catalogue.players[0]
+    c1, c2 = catalogue.characters[:2]
+    return [
+        ('empty', {}),
+        ('player', {'p1': top_player}),
+        ('matchup', {'c1': c1, 'c2': c2}),
+        ('event', {'event': catalogue.events[0]}),
+        ('rank_one', {'rank': 'one_lunarank'}),
+        ('rank_two', {'rank': 'two_lunarank'}),
+    ]
+
+
+def time_runs(f, repeat, setup=None):
+    """Milliseconds for each of `repeat` calls of f, after one warm-up call."""
+    timings = []
+    for i in range(repeat + 1):
+        if setup:
+            setup(i)
+        start = time.perf_counter()
+        f()
+        if i:
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def invoke(cli, args):
+    result = cli.invoke(args=args)
+    if result.exception:
+        raise result.exception
+    return result
+
+
+def summarize(timings):
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'runs': len(timings),
+    }
+
+
+def run_cases(database, catalogue, repeat):
+    app = vods_app.app
+    app.config['DATABASE'] = database
+    client = app.test_client()
+    cli = app.test_cli_runner()
+    results = {}
+    mixes = search_mixes(catalogue)
+
+    with app.app_context():
+        patches = db.load_patches()
+        for name, search in mixes:
+            args = [search.get(key, '') for key in ('p1', 'p2', 'c1', 'c2', 'event', 'rank')]
+            results[f'search_vods.{name}'] = time_runs(lambda: db.search_vods(*args, amount=80), repeat)
+
+        # What patch_vods used to do: attaching the live patch to each VOD.
+        rows = list(db.vod_rows([], [], amount=10000))
+        results['build_vods.patches'] = time_runs(lambda: list(db.build_vods(rows, patches)), repeat)
+
+        titles = [f'{p1} ({c1}) vs {p2} ({c2})' for (_, p1, c1, p2, c2, *_) in catalogue.vods(TITLES, start=10 ** 9)]
+        title_regex = re.compile(commands.title_query_to_regex_str(TITLE_FORMAT))
+        results['parse_vod_title'] = time_runs(lambda: [
+            commands.parse_vod_title(title, '', title_regex, resolve_ids=False, prompt_missing=False)
+            for title in titles], repeat)
+
+        with tempfile.TemporaryDirectory() as directory:
+            export_path = os.path.join(directory, 'export.csv')
+            results['export_vods_command'] = time_runs(
+                lambda: invoke(cli, ['export-csv', export_path]), repeat)
+
+    for name, search in mixes:
+        url = '/?' + urlencode(sorted((key, value.lower() if key in ('c1', 'c2') else value)
+                                      for (key, value) in search.items()))
+        results[f'search_page.{name}'] = time_runs(
+            lambda: client.get(url), repeat, setup=lambda _: vods_app.fragment_cache.clear())
+
+    # Ingesting writes to the database, so it runs against a copy, with new VODs each time.
+    with tempfile.TemporaryDirectory() as directory:
+        app.config['DATABASE'] = os.path.join(directory, 'ingest.db')
+        shutil.copy(database, app.config['DATABASE'])
+        csv_path = os.path.join(directory, 'ingest.csv')
+
+        def write_csv(i):
+            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(catalogue.vods(INGEST_ROWS, start=2 * 10 ** 9 + i * INGEST_ROWS))
+
+        with app.app_context():
+            results['ingest_csv_command'] = time_runs(
+                lambda: invoke(cli, ['ingest-csv', csv_path]), repeat, setup=write_csv)
+        app.config['DATABASE'] = database
+
+    return {name: summarize(timings) for (name, timings) in results.items()}
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Prints each case against the baseline and returns the names of the regressions."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median_ms'], result['median_ms']
+        change = (after - before) / before if before else 0
+        regressed = change > tolerance and after - before > min_delta_ms
+        print(f"{name:32} {before:9.2f}ms -> {after:9.2f}ms  {change:+7.1%}{'  REGRESSION' if regressed else ''}",
+              file=sys.stderr)
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vods', type=int, default=100000,
+                        help='Size of the synthetic catalogue, e.g. 10000, 100000 or 1000000.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', help='Use this database instead of a synthetic one.')
+    parser.add_argument('--regenerate', action='store_true', help="Regenerate the synthetic database even if it exists.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout.')
+    parser.add_argument('--compare', help='JSON results from an earlier run to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='How much slower (as a fraction) a median can get before it counts as a regression.')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='Ignore slowdowns smaller than this, which are mostly noise.')
+    args = parser.parse_args()
+
+    catalogue = synthetic.Catalogue(args.vods, args.seed)
+    database = args.database or synthetic.default_path(args.vods, args.seed)
+    if not args.database and (args.regenerate or not os.path.exists(database)):
+        print(f'Generating {args.vods} VODs into {database}...', file=sys.stderr)
+        catalogue = synthetic.generate(database, args.vods, args.seed)
+
+    results = run_cases(database, catalogue, args.repeat)
+    for name, result in results.items():
+        print(f"{name:32} median {result['median_ms']:9.2f}ms  min {result['min_ms']:9.2f}ms", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'database': database,
+            'vods': vods_count(database),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+def vods_count(database):
+    connection = sqlite3.connect(database)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM vod;").fetchone()[0]
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Generates a synthetic VOD database for benchmarks.
+
+Player tags, events and characters are Zipf-distributed, like the real data:
+a few players, events and characters account for most VODs. The most common
+players are the ones in the rank lists, so rank searches have results, and
+the dates span data/patches.txt.
+
+    python benchmarks/synthetic.py --vods 100000 [--output synthetic.db] [--seed 0]
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import app  # noqa: E402
+import db  # noqa: E402
+from utils.reference_data import data_lines, data_path, reference_data  # noqa: E402
+
+
+# Zipf exponents: how much the most common values dominate.
+PLAYER_SKEW = 0.9
+EVENT_SKEW = 0.8
+CHARACTER_SKEW = 0.8
+
+SERIES = ['Warped', 'Aether Weekly', 'Crossroads', 'Rivals Rumble', 'Sky Clash', 'Rock Bottom',
+          'Midnight Melee', 'Lunar Lockdown', 'Storm Front', 'Tide Break', 'Ember Cup', 'Treetop Tussle']
+ROUNDS = ['Winners Round 1', 'Winners Round 2', 'Winners Quarters', 'Winners Semis', 'Winners Finals',
+          'Losers Round 1', 'Losers Round 2', 'Losers Quarters', 'Losers Semis', 'Losers Finals',
+          'Grand Finals', 'Pools']
+SYLLABLES = ['ka', 'ro', 'mi', 'zen', 'tor', 'lu', 'vex', 'shi', 'bo', 'dra', 'no', 'kai', 'rex', 'fi', 'ly', 'gon']
+
+
+def zipf_cum_weights(count, skew):
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def default_path(vods, seed):
+    return os.path.join(tempfile.gettempdir(), f'vods-synthetic-{vods}-{seed}.db')
+
+
+class Catalogue:
+    """The players, events and characters VODs are drawn from, sized for `vods` VODs."""
+
+    def __init__(self, vods, seed=0):
+        self.rng = random.Random(seed)
+        ranked = [tag for name in ('lunarank', 'alexrank') for tag in data_lines(data_path / f'{name}.txt')]
+        self.players = list(dict.fromkeys(ranked))
+        seen = {tag.lower() for tag in self.players}
+        while len(self.players) < max(200, vods // 15):
+            tag = ''.join(self.rng.choices(SYLLABLES, k=self.rng.randint(2, 3))).capitalize()
+            if self.rng.random() < 0.2:
+                tag += str(self.rng.randint(1, 99))
+            if tag.lower() not in seen:
+                seen.add(tag.lower())
+                self.players.append(tag)
+
+        patch_dates = [p.date for p in reference_data.get('patches')]
+        first, last = min(patch_dates), max(patch_dates) + timedelta(days=30)
+        num_events = max(20, vods // 40)
+        self.events = [f'{SERIES[i % len(SERIES)]} #{i // len(SERIES) + 1}' for i in range(num_events)]
+        self.event_dates = [first + (last - first) * self.rng.random() for _ in self.events]
+
+        self.characters = [name for name in db.CHAR_NAME_TO_ID if name != 'random']
+        self.rng.shuffle(self.characters)
+
+        self._player_weights = zipf_cum_weights(len(self.players), PLAYER_SKEW)
+        self._event_weights = zipf_cum_weights(len(self.events), EVENT_SKEW)
+        self._character_weights = zipf_cum_weights(len(self.characters), CHARACTER_SKEW)
+
+    def vods(self, count, start=0):
+        """Yields (url, p1, c1, p2, c2, event, round, vod_date) rows, the ingest-csv format."""
+        rng = self.rng
+        for i in range(start, start + count):
+            p1, p2 = rng.choices(self.players, cum_weights=self._player_weights, k=2)
+            c1, c2 = rng.choices(self.characters, cum_weights=self._character_weights, k=2)
+            event = rng.choices(range(len(self.events)), cum_weights=self._event_weights)[0]
+            vod_date = self.event_dates[event] + timedelta(minutes=rng.randrange(3 * 24 * 60))
+            yield (f'https://www.youtube.com/watch?v=s{i:010x}', p1, c1.title(), p2, c2.title(),
+                   self.events[event], rng.choice(ROUNDS), vod_date.strftime('%Y-%m-%d %H:%M:%S+00:00'))
+
+
+def generate(path, vods, seed=0, batch_size=50000):
+    """Writes a database with `vods` synthetic VODs to `path`, replacing any that's there."""
+    if os.path.exists(path):
+        os.unlink(path)
+    catalogue = Catalogue(vods, seed)
+    app.config['DATABASE'] = path
+    with app.app_context():
+        db.init_db()
+        connection = db.get_db()
+        connection.execute('PRAGMA journal_mode = OFF;')
+        connection.execute('PRAGMA synchronous = OFF;')
+        cursor = connection.cursor()
+        cursor.executemany("INSERT INTO player (tag) VALUES (?);", [(tag,) for tag in catalogue.players])
+        cursor.executemany("INSERT INTO event (name) VALUES (?);", [(name,) for name in catalogue.events])
+        player_ids = {tag: id for (id, tag) in cursor.execute("SELECT id, tag FROM player;")}
+        event_ids = {name: id for (id, name) in cursor.execute("SELECT id, name FROM event;")}
+
+        rows = catalogue.vods(vods)
+        while batch := list(itertools.islice(rows, batch_size)):
+            cursor.executemany("""
+            INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date, vod_ts)
+            VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?,        ?);
+            """, [(db.RIVALS_OF_AETHER_TWO, event_ids[event], url, player_ids[p1], player_ids[p2],
+                   db.CHAR_NAME_TO_ID[c1.lower()], db.CHAR_NAME_TO_ID[c2.lower()], round, vod_date,
+                   db.vod_date_to_epoch(vod_date))
+                  for (url, p1, c1, p2, c2, event, round, vod_date) in batch])
+            connection.commit()
+        cursor.execute("ANALYZE;")
+        connection.commit()
+    return catalogue
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vods', type=int, default=100000)
+    parser.add_argument('--output', help='Defaults to vods-synthetic-<vods>-<seed>.db in the temp folder.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = args.output or default_path(args.vods, args.seed)
+    start = time.perf_counter()
+    catalogue = generate(path, args.vods, args.seed)
+    print(f'Wrote {args.vods} VODs ({len(catalogue.players)} players, {len(catalogue.events)} events) '
+          f'to {path} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measures time to first byte and total time for large search pages.
+
+Serves the app on a local port and requests each page with streaming on and
+off (by moving SEARCH_STREAM_MIN_PER_PAGE), clearing the fragment cache
+first so every request runs the query. Uses the database in FLASK_DATABASE,
+or database.db.
+
+    python benchmarks/ttfb.py [--per-page 1000] [--repeat 5]
+"""
+import argparse
+import http.client
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as vods_app  # noqa: E402
+
+
+SEARCHES = [
+    {'after': '2000-01-01'},
+    {'rank': 'one_lunarank'},
+    {'rank': 'two_lunarank'},
+    {'c1': 'ranno'},
+]
+
+
+def fetch(port, path):
+    """Returns (seconds to the first byte of the body, seconds to the last)."""
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    start = time.perf_counter()
+    connection.request('GET', path)
+    response = connection.getresponse()
+    response.read(1)
+    first_byte = time.perf_counter() - start
+    response.read()
+    total = time.perf_counter() - start
+    connection.close()
+    assert response.status == 200, (path, response.status)
+    return first_byte, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--per-page', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = vods_app.app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stream_min = app.config['SEARCH_STREAM_MIN_PER_PAGE']
+
+    for search in SEARCHES:
+        # In canonical form, so it isn't redirected.
+        path = '/?' + urlencode(sorted({**search, 'per_page': args.per_page}.items()))
+        fetch(server.port, path)
+        for streamed in (False, True):
+            app.config['SEARCH_STREAM_MIN_PER_PAGE'] = stream_min if streamed else args.per_page + 1
+            first_bytes, totals = [], []
+            for _ in range(args.repeat):
+                vods_app.fragment_cache.clear()
+                first_byte, total = fetch(server.port, path)
+                first_bytes.append(first_byte * 1000)
+                totals.append(total * 1000)
+            print(f"{path:40} {'streamed' if streamed else 'buffered':8} "
+                  f"TTFB {statistics.median(first_bytes):7.1f}ms  total {statistics.median(totals):7.1f}ms")
+
+    app.config['SEARCH_STREAM_MIN_PER_PAGE'] = stream_min
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
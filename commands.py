@@ -0,0 +1,1712 @@
+"""The `flask` commands that set up, fill and maintain the database.
+
+They're registered lazily (see utils/cli.py), so this module, and the Google
+and YouTube client libraries the ingest commands use, are only imported when
+a command runs. Web workers only need db.py.
+"""
+import functools
+import math
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlencode
+
+import click
+from flask import current_app, g
+
+from db import (
+    APPROVED_STATUS, CHAR_NAME_TO_ID, GEMINI_CONFIDENCE, NOT_REVIEWED_STATUS, REJECTED_STATUS,
+    RIVALS_OF_AETHER_TWO, ensure_event, ensure_events, ensure_player, ensure_players, event_vods,
+    get_character_id, get_db, get_event_profile, init_db, insert_vod, load_patches, parse_date,
+    search_vods_page, sync_patches, vod_exists,
+)
+from models import ParsedVodTitle, StagedVod
+from utils.reference_data import reference_data
+from utils import assets, metrics, migrations, search_log, sprites, static_pages
+from utils.update_template import get_recent_events, get_last_updated_date
+
+@click.command('init-db')
+@click.option('--force', '-f', is_flag=True)
+def init_db_command(force):
+    """Clear the existing data and create new tables."""
+    if not force:
+        response = input("This is going to drop the database. Type \"confirm\" to confirm: ")
+        if response != "confirm":
+            print("Aborting.")
+            return
+
+    init_db()
+    click.echo('Initialized the database.')
+
+def submission_filter_sql(platform=None, event=None, matches_existing=False):
+    """Builds a WHERE clause (and its params) that filters unreviewed submissions."""
+    where = ['status = ?']
+    params = [NOT_REVIEWED_STATUS]
+    if platform == 'youtube':
+        where.append("(url LIKE '%youtube.com/%' OR url LIKE '%youtu.be/%')")
+    elif platform == 'twitch':
+        where.append("url LIKE '%twitch.tv/%'")
+    if event:
+        where.append('event LIKE ?')
+        params.append('%' + event + '%')
+    if matches_existing:
+        # Uses idx_vod_url.
+        where.append('EXISTS (SELECT 1 FROM vod WHERE vod.url = submission.url)')
+    return ' AND '.join(where), params
+
+def bulk_review_submissions(action, platform=None, event=None, matches_existing=False, missing_characters=False, dry_run=False):
+    """Approves or rejects every unreviewed submission matching the filters in a single transaction."""
+    db = get_db()
+    where, params = submission_filter_sql(platform, event, matches_existing)
+    submissions = db.cursor().execute(f"""
+    SELECT id, url, p1, c1, p2, c2, round, event, date,
+           EXISTS (SELECT 1 FROM vod WHERE vod.url = submission.url)
+    FROM submission
+    WHERE {where}
+    ORDER BY id;
+    """, params).fetchall()
+
+    # Character names are resolved in Python because of the nickname handling in get_character_id.
+    rows = []
+    for (id, url, p1, c1, p2, c2, round, event_name, date_str, exists) in submissions:
+        c1_id = get_character_id(c1) if c1 else None
+        c2_id = get_character_id(c2) if c2 else None
+        if missing_characters and c1_id and c2_id:
+            continue
+        rows.append((id, url, p1, c1_id, p2, c2_id, event_name or 'Unknown', date_str, exists))
+
+    skipped_existing = skipped_incomplete = 0
+    if action == 'reject':
+        batch_ids = [row[0] for row in rows]
+        db.cursor().executemany('UPDATE submission SET status = ? WHERE id = ?;',
+                                [(REJECTED_STATUS, id) for id in batch_ids])
+    else:
+        batch = []
+        seen_urls = set()
+        for (id, url, p1, c1_id, p2, c2_id, event_name, date_str, exists) in rows:
+            if exists or url in seen_urls:
+                skipped_existing += 1
+                continue
+            if not (p1 and p2 and c1_id and c2_id):
+                skipped_incomplete += 1
+                continue
+            seen_urls.add(url)
+            batch.append((id, p1, c1_id, p2, c2_id, event_name, date_str))
+
+        event_ids = ensure_events(event_name for (_, _, _, _, _, event_name, _) in batch)
+        player_ids = ensure_players([p for row in batch for p in (row[1], row[3])])
+
+        cursor = db.cursor()
+        cursor.execute("""
+        CREATE TEMP TABLE review_batch (
+            submission_id INTEGER PRIMARY KEY,
+            event_id INTEGER NOT NULL,
+            p1_id INTEGER NOT NULL,
+            c1_id INTEGER NOT NULL,
+            p2_id INTEGER NOT NULL,
+            c2_id INTEGER NOT NULL,
+            vod_date TEXT
+        );
+        """)
+        def vod_date(date_str):
+            parsed = parse_date(date_str) if date_str else None
+            return parsed.isoformat() if parsed else ''
+        cursor.executemany("INSERT INTO review_batch VALUES (?, ?, ?, ?, ?, ?, ?);", [
+            (id, event_ids[event_name], player_ids[p1], c1_id, player_ids[p2], c2_id, vod_date(date_str))
+            for (id, p1, c1_id, p2, c2_id, event_name, date_str) in batch])
+        cursor.execute("""
+        INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date, vod_ts, submission_id)
+        SELECT s.game_id, b.event_id, s.url, b.p1_id, b.p2_id, b.c1_id, b.c2_id, s.round, b.vod_date, vod_epoch(b.vod_date), s.id
+        FROM review_batch b
+            INNER JOIN submission s ON s.id = b.submission_id
+        ORDER BY s.id;
+        """)
+        cursor.execute("UPDATE submission SET status = ? WHERE id IN (SELECT submission_id FROM review_batch);", (APPROVED_STATUS,))
+        cursor.execute("DROP TABLE review_batch;")
+        batch_ids = [row[0] for row in batch]
+
+    verb = 'Rejected' if action == 'reject' else 'Approved'
+    click.echo(f"{len(rows)} submissions matched the filters.")
+    click.echo(f"{verb} {len(batch_ids)} submissions.")
+    if skipped_existing:
+        click.echo(f"Skipped {skipped_existing} submissions for VODs that already exist.")
+    if skipped_incomplete:
+        click.echo(f"Skipped {skipped_incomplete} submissions missing players or known characters.")
+
+    if dry_run:
+        db.rollback()
+        click.echo('Dry run, nothing was committed.')
+    else:
+        db.commit()
+
+@click.command('review-submissions')
+@click.option('--bulk', type=click.Choice(['approve', 'reject']),
+              help='Approve or reject every matching submission without prompting.')
+@click.option('--platform', type=click.Choice(['youtube', 'twitch']), help='Only submissions for this site.')
+@click.option('--event', 'event_filter', help='Only submissions whose event name contains this text.')
+@click.option('--matches-existing', is_flag=True, help='Only submissions whose URL is already a VOD.')
+@click.option('--missing-characters', is_flag=True, help='Only submissions without two recognized characters.')
+@click.option('--dry-run', is_flag=True, help='Print the summary of a bulk review without committing it.')
+def review_submissions_command(bulk, platform, event_filter, matches_existing, missing_characters, dry_run):
+    """Review unreviewed submissions interactively, or in bulk with --bulk.
+
+    Example:
+
+        flask review-submissions --bulk reject --matches-existing
+    """
+    if bulk:
+        bulk_review_submissions(bulk, platform, event_filter, matches_existing, missing_characters, dry_run)
+        return
+
+    db = get_db()
+    where, params = submission_filter_sql(platform, event_filter, matches_existing)
+    submissions = db.cursor().execute(f"SELECT id,url,p1,c1,p2,c2,round,event,date FROM submission WHERE {where};", params).fetchall()
+    if missing_characters:
+        submissions = [s for s in submissions if not (s[3] and get_character_id(s[3]) and s[5] and get_character_id(s[5]))]
+    click.echo(f"{len(submissions)} submissions to review.")
+    # TODO: Support dates.
+    for (id,url,p1,c1,p2,c2,round,event,date_str) in submissions:
+        while True:
+            # Build the info string.
+            def display_info(id, url, p1, c1, p2, c2, event, round, date_str):
+                info = f"ID={id} URL={url}"
+                if p1:
+                    info += f" p1=\"{p1}\""
+                if c1:
+                    info += f" c1=\"{c1}\""
+                if p2:
+                    info += f" p2=\"{p2}\""
+                if c2:
+                    info += f" c2=\"{c2}\""
+                if event:
+                    info += f" event=\"{event}\""
+                if round:
+                    info += f" round=\"{round}\""
+                if date_str:
+                    info += f" date=\"{date_str}\""
+                click.echo(info)
+            display_info(id, url, p1, c1, p2, c2, event, round, date_str)
+            action = input("Approve [A] Edit [E] Skip [S] Reject [R]: ").lower()
+            if action == 'a':
+                event_id = ensure_event(event)
+                p1_id = ensure_player(p1)
+                p2_id = ensure_player(p2)
+                c1_id = get_character_id(c1) or ''
+                c2_id = get_character_id(c2) or ''
+                vod_date = parse_date(date_str) or None
+                db.cursor().execute('UPDATE submission SET status = ? WHERE id = ?;', (APPROVED_STATUS, id,))
+                insert_vod(event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date.isoformat() if vod_date else '')
+                db.commit()
+                break
+            elif action == 'r':
+                db.cursor().execute('UPDATE submission SET status = ? WHERE id = ?;', (REJECTED_STATUS, id,))
+                db.commit()
+                break
+            elif action == 's':
+                break
+            elif action == 'e':
+                url = prompt('URL', url)
+                p1 = prompt('Player 1', p1)
+                c1 = prompt('Char 1', c1)
+                p2 = prompt('Player 2', p2)
+                c2 = prompt('Char 2', c2)
+                event = prompt('Event', event)
+                round = prompt('Round', round)
+
+                date_str = prompt('Date (MM/DD/YY)', date_str)
+                vod_date = parse_date(date_str) or None
+
+                display_info(id, url, p1, c1, p2, c2, event, round, date_str)
+                response = input('Commit this to the database? [y/n] ')
+                if response in ['y', 'yes']:
+                    p1_id = ensure_player(p1)
+                    p2_id = ensure_player(p2)
+                    c1_id = get_character_id(c1)
+                    c2_id = get_character_id(c2)
+                    event_id = ensure_event(event)
+
+                    insert_vod(event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date.isoformat() if vod_date else '')
+                    
+                    db.commit()
+
+                break
+            else:
+                click.echo('Unknown action.')
+
+# YouTube Data API quota cost of each call, for the ingest metrics.
+YOUTUBE_QUOTA_COSTS = {
+    'search.list': 100,
+    'playlistItems.list': 1,
+    'videos.list': 1,
+}
+
+# What the commands that parse video titles (or Gemini's matches) report.
+TITLE_COUNTS = ('pages_fetched', 'quota_units', 'titles_matched', 'titles_rejected', 'titles_known', 'rows_staged')
+
+def ingest_metrics(command, *names):
+    """Makes an ingest command write its run metrics to METRICS_TEXTFILE_DIR.
+
+    While the command runs, `count_ingest` adds to the run's counts. `names`
+    are the counts the command reports, so they're written even when they're 0.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            directory = current_app.config.get('METRICS_TEXTFILE_DIR')
+            with metrics.ingest_run(command, directory, names) as run:
+                g.ingest_run = run
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    g.pop('ingest_run', None)
+        return wrapper
+    return decorator
+
+def count_ingest(name, amount=1):
+    """Adds to a count for the running ingest command's metrics, if any."""
+    run = g.get('ingest_run')
+    if run is not None:
+        run.inc(name, amount)
+
+def count_youtube_call(method):
+    count_ingest('pages_fetched')
+    count_ingest('quota_units', YOUTUBE_QUOTA_COSTS[method])
+
+@click.command('ingest-sheet')
+@ingest_metrics('ingest-sheet', 'pages_fetched', 'rows_read', 'rows_rejected', 'rows_known', 'rows_inserted')
+def ingest_sheet_command():
+    from utils.authenticate_google_sheet import get_vods_sheet
+
+    # Call Google Sheets Authentication helper to get the sheet object.
+    sheet = get_vods_sheet()
+
+    if not sheet:
+        click.echo('Sheet not found!')
+        return
+
+    all_data = sheet.get_all_values()
+    data_rows = all_data[1:]  # skip header row
+    count_ingest('pages_fetched')
+    count_ingest('rows_read', len(data_rows))
+
+    db = get_db()
+    num_vods = 0
+    for row in data_rows:
+        if len(row) < 8:
+            click.echo(f'Skipping malformed row: {row}')
+            count_ingest('rows_rejected')
+            continue
+        url, p1, c1, p2, c2, event, round, vod_time = row[:8]
+        if vod_exists(url):
+            # click.echo(f"Skipping existing vod {url}.")
+            count_ingest('rows_known')
+            continue
+
+        p1_id = ensure_player(p1)
+        p2_id = ensure_player(p2)
+        event_id = ensure_event(event)
+        c1_id = get_character_id(c1)
+        c2_id = get_character_id(c2)
+
+        num_vods += 1
+        insert_vod(event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_time)
+    db.commit()
+    count_ingest('rows_inserted', num_vods)
+
+    # Update the last updated date in the metadata table.
+
+    today = datetime.now().strftime('%Y-%m-%d')
+
+    cursor = db.cursor()
+
+    cursor.execute("""
+    INSERT OR REPLACE INTO metadata (key, value)
+    VALUES (?, ?)
+    """, ("last_updated", today))
+
+    db.commit()
+
+    click.echo(f'Ingested {num_vods} vods from Google Sheets.')
+    if num_vods:
+        after_vods_added()
+    return
+
+@click.command('ingest-csv')
+@click.argument('filename', required=False)
+def ingest_csv_command(filename: str | None):
+    import csv
+
+    if filename is None:
+        filename = "./data/vods.csv"
+
+    db = get_db()
+    num_vods = 0
+    with open(filename) as csvfile:
+        for url, p1, c1, p2, c2, event, round, vod_time in csv.reader(csvfile):
+            if vod_exists(url):
+                # click.echo(f"Skipping existing vod {url}.")
+                continue
+
+            p1_id = ensure_player(p1)
+            p2_id = ensure_player(p2)
+            event_id = ensure_event(event)
+            c1_id = get_character_id(c1)
+            c2_id = get_character_id(c2)
+
+            num_vods += 1
+            insert_vod(event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_time)
+    db.commit()
+    click.echo(f"Ingested {num_vods} vods.")
+    if num_vods:
+        after_vods_added()
+
+@click.command('ingest-channel')
+@click.argument('channel_id')
+@click.argument('query')
+@click.argument('format')
+@ingest_metrics('ingest-channel', *TITLE_COUNTS)
+def ingest_channel_command(channel_id, query, format):
+    import googleapiclient.discovery
+    import googleapiclient.errors
+    import os
+
+    scopes = ["https://www.googleapis.com/auth/youtube.readonly"]
+
+    # Disable OAuthlib's HTTPS verification when running locally.
+    # *DO NOT* leave this option enabled in production.
+    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+    api_service_name = "youtube"
+    api_version = "v3"
+    api_key = None
+    with open('youtube_api_key') as f:
+        api_key = f.readline().strip()
+
+    youtube = googleapiclient.discovery.build(
+        api_service_name, api_version, developerKey=api_key)
+
+    def get_page(page_token=None):
+        request = youtube.search().list(
+            part="snippet",
+            maxResults=50,
+            channelId=channel_id,
+            q=query,
+            pageToken=page_token
+        )
+        count_youtube_call('search.list')
+        return request.execute()
+
+    format_regex_str = title_query_to_regex_str(format)
+    print(format_regex_str)
+    format_regex = re.compile(format_regex_str)
+
+    def ingest_page(page):
+        items = page.get('items')
+        if not items:
+            return []
+        
+        results = []
+        for item in items:
+            # Ignore playlists, just grab videos.
+            if not item.get('id') or not item['id'].get('videoId'):
+                continue
+            video_id = item['id']['videoId']
+            url = f"https://www.youtube.com/watch?v={video_id}"
+            snippet = item['snippet']
+            published_at = snippet['publishedAt']
+            title = snippet['title']
+
+            if url_is_known(url):
+                click.echo(f'ALREADY PRESENT: {title}')
+                count_ingest('titles_known')
+                continue
+
+            info = parse_vod_title(title, url, format_regex, resolve_ids=False, prompt_missing=sys.stdin.isatty())
+            if not info:
+                click.echo(f'DOES NOT MATCH: {title}')
+                count_ingest('titles_rejected')
+                continue
+            if not info.c1_id or not info.c2_id:
+                count_ingest('titles_rejected')
+                continue
+            count_ingest('titles_matched')
+
+            result = f'p1={info.p1} c1={info.c1} p2={info.p2} c2={info.c2} event={info.event} round={info.round} vod_date={published_at} url={url}'
+            click.echo(result)
+            results.append(staged_vod_from_title(info, url, title, published_at))
+        
+        return results
+
+    
+    page = get_page()
+    results = []
+    results += ingest_page(page)
+    while page.get('nextPageToken'):
+        page = get_page(page['nextPageToken'])
+        results += ingest_page(page)
+    
+    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "0"
+
+    stage_vods('channel', results)
+
+@click.command('ingest-playlist')
+@click.argument('playlist_url')
+@click.argument('event_name')
+@click.argument('format_str')
+@ingest_metrics('ingest-playlist', *TITLE_COUNTS)
+def ingest_playlist_command(playlist_url, event_name, format_str):
+    import googleapiclient.discovery
+    import googleapiclient.errors
+    import re
+    from urllib.parse import urlparse, parse_qs
+
+    format_regex = re.compile(title_query_to_regex_str(format_str))
+
+    api_service_name = "youtube"
+    api_version = "v3"
+    api_key = None
+    with open('youtube_api_key') as f:
+        api_key = f.readline().strip()
+
+    youtube = googleapiclient.discovery.build(
+        api_service_name, api_version, developerKey=api_key
+    )
+
+    # get playlist ID
+    query = parse_qs(urlparse(playlist_url).query)
+    playlist_id = query.get("list", [None])[0]
+    if not playlist_id:
+        click.echo("Invalid playlist URL")
+        return
+
+    def get_page(page_token=None):
+        request = youtube.playlistItems().list(
+            part="snippet",
+            maxResults=50,
+            playlistId=playlist_id,
+            pageToken=page_token
+        )
+        count_youtube_call('playlistItems.list')
+        return request.execute()
+
+    def ingest_page(page):
+        items = page.get('items')
+        if not items:
+            return []
+
+        results = []
+        for item in items:
+            snippet = item['snippet']
+            video_id = snippet['resourceId']['videoId']
+            url = f"https://www.youtube.com/watch?v={video_id}"
+            published_at = snippet['publishedAt']
+            title = snippet['title']
+
+            if url_is_known(url):
+                click.echo(f'ALREADY PRESENT: {title}')
+                count_ingest('titles_known')
+                continue
+
+            info = parse_vod_title(title, url, format_regex, event_name, resolve_ids=False, prompt_missing=sys.stdin.isatty())
+            if not info:
+                click.echo(f'DOES NOT MATCH: {title}')
+                count_ingest('titles_rejected')
+                continue
+
+            if not info.c1_id or not info.c2_id:
+                count_ingest('titles_rejected')
+                continue
+            count_ingest('titles_matched')
+                
+            result = f'STAGED: {info.p1} ({info.c1}) vs {info.p2} ({info.c2}) - {info.round} [{published_at}]'
+            click.echo(result)
+            results.append(staged_vod_from_title(info, url, title, published_at))
+
+        return results
+
+    page = get_page()
+    results = []
+    results += ingest_page(page)
+    while page.get('nextPageToken'):
+        page = get_page(page['nextPageToken'])
+        results += ingest_page(page)
+
+    stage_vods('playlist', results)
+
+@click.command('export-csv')
+@click.argument('filename', required=False)
+def export_vods_command(filename: str | None):
+    import csv
+
+    if filename is None:
+        filename = "./data/vods.csv"
+
+    db = get_db()
+    vods = db.cursor().execute("""
+    SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c2.name, e.name, vod.round, vod.vod_date
+    FROM vod
+        INNER JOIN event e ON e.id = vod.event_id
+        INNER JOIN player p1 ON p1.id = vod.p1_id
+        INNER JOIN player p2 ON p2.id = vod.p2_id
+        INNER JOIN game_character c1 ON c1.id = vod.c1_id
+        INNER JOIN game_character c2 ON c2.id = vod.c2_id
+    ORDER BY vod.vod_ts ASC, vod.id ASC
+    """, ()).fetchall()
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        vod_writer = csv.writer(csvfile)
+        for id, url, p1_tag, p2_tag, c1_name, c2_name, event_name, round, vod_date in vods:
+            row = [url, p1_tag, c1_name, p2_tag, c2_name, event_name, round if round else '', vod_date if vod_date else '']
+            vod_writer.writerow(row)
+
+@click.command('export-sheet')
+def export_sheet_command():
+    from utils.authenticate_google_sheet import get_vods_sheet
+
+    db = get_db()
+    vods = db.cursor().execute("""
+    SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c2.name, e.name, vod.round, vod.vod_date
+    FROM vod
+        INNER JOIN event e ON e.id = vod.event_id
+        INNER JOIN player p1 ON p1.id = vod.p1_id
+        INNER JOIN player p2 ON p2.id = vod.p2_id
+        INNER JOIN game_character c1 ON c1.id = vod.c1_id
+        INNER JOIN game_character c2 ON c2.id = vod.c2_id
+    ORDER BY vod.vod_ts ASC, vod.id ASC
+    """, ()).fetchall()
+
+    # Call Google Sheets Authentication helper to get the sheet object.
+
+    sheet = get_vods_sheet()
+
+    if not sheet:
+        click.echo('Sheet not found!')
+        return
+    
+    rows= sheet.get_all_values()
+    
+    # Build the data rows
+    data_rows = []
+    for id, url, p1_tag, p2_tag, c1_name, c2_name, event_name, round, vod_date in vods:
+        # Convert datetime to string if needed
+        if isinstance(vod_date, datetime):
+            vod_date_str = vod_date.isoformat()
+        else:
+            vod_date_str = str(vod_date) if vod_date else ''
+        
+        row = [str(url), str(p1_tag), str(c1_name), str(p2_tag), str(c2_name), str(event_name), str(round) if round else '', vod_date_str]
+        data_rows.append(row)
+    
+    try:
+        # Clear all cells except the header (row 1)
+        click.echo('Clearing existing data from Google Sheet...')
+        current_values = sheet.get_all_values()
+        
+        if len(current_values) > 1:
+            # Clear rows 2 onwards
+            sheet.batch_clear([f'A2:H{len(current_values)}'])
+        
+        # Append the data to the sheet
+        if len(data_rows) > 0:
+            sheet.append_rows(data_rows, value_input_option='RAW')
+        
+        click.echo(f'Exported {len(data_rows)} VODs to Google Sheet')
+    except Exception as e:
+        click.echo(f'Error updating Google Sheet: {e}')
+
+@click.command('extract-vods')
+@click.argument('vod_url')
+@click.argument('event')
+@ingest_metrics('extract-vods', *TITLE_COUNTS, 'gemini_calls')
+def extract_vods_v1_command(vod_url, event):
+    """Analyzes a vod for player names and characters.
+
+    This is an MVP implementation that requires a Gemini API key.
+    
+    Example:
+    
+        flask extract-vods "https://www.youtube.com/watch?v=gWtNu_6hoDY" "Wasteland Warriors #22"
+    """
+    from google import genai
+    import googleapiclient.discovery
+    import googleapiclient.errors
+    import time
+    import json
+
+    print("Fetching the video publish date...")
+    yt_api_service_name = "youtube"
+    yt_api_version = "v3"
+    yt_api_key = None
+    with open('youtube_api_key') as f:
+        yt_api_key = f.readline().strip()
+    youtube = googleapiclient.discovery.build(
+        yt_api_service_name, yt_api_version, developerKey=yt_api_key
+    )
+    yt_request = youtube.videos().list(
+        part="snippet,contentDetails,statistics",
+        id=vod_url.split('?v=')[1]
+    )
+    count_youtube_call('videos.list')
+    yt_response = yt_request.execute()
+    vod_date = yt_response.get('items')[0].get('snippet').get('publishedAt')
+    duration_iso = yt_response.get('items')[0].get('contentDetails').get('duration')
+    duration = parse_iso8601_duration(duration_iso)
+
+    # Common bad readings that we have to tell the model to watch out for.
+    # TODO: Unused right now because my logic for inserting it breaks with
+    # Python 3.10 (which is what PythonAnywhere uses).
+    #   File "/home/akbiggs/mysite/db.py", line 700
+    #    Some common player tag errors and their corrections: [{','.join(f'\'{k}\' -> \'{v}\'' for k, v in BAD_READINGS.items())}]""")
+    #      SyntaxError: f-string expression part cannot include a backslash
+    BAD_READINGS = {
+        'Cpuo': 'CPU0',
+        'Sawstepp': 'Sawstep',
+    }
+
+    # If you try to run a video that is too long through Gemini's API, the API
+    # call will fail with an internal error with no additional details.
+    # To work around this, we split the analysis into multiple Gemini API calls
+    # if it exceeds MAX_DURATION_SECONDS_PER_REQUEST.
+    MAX_DURATION_SECONDS_PER_REQUEST = 3200
+    num_genai_calls = math.ceil(duration.total_seconds() / MAX_DURATION_SECONDS_PER_REQUEST) # TODO: cleanup
+    if num_genai_calls > 1:
+        print(f'Splitting the analysis into {num_genai_calls} Gemini API calls.')
+
+    def analyze_chunk(n, matches, start_seconds, end_seconds):
+        start = time.time()
+
+        genai_client = None
+        with open('gemini_api_key') as f:
+            api_key = f.readline().strip()
+            genai_client = genai.Client(api_key=api_key)
+
+        # Sometimes during later API calls, Gemini seems to lose track of what
+        # the timestamp should be and reports super early timestamps, screwing
+        # things up. So for any chunk after the first chunk, we show it some of
+        # the existing response that it is adding to, so it hopefully remains
+        # more consistent from call to call.
+        prelude = ""
+        if n > 0:
+            prelude = f"""You are in the middle of a Gemini video analysis to find timestamps where matches begin in a competitive tournament video. Previous Gemini API calls have found some earlier matches.
+            
+You are analyzing the range {start_seconds} to {end_seconds}, while the previous Gemini API call analyzed the range {start_seconds - MAX_DURATION_SECONDS_PER_REQUEST} to {end_seconds - MAX_DURATION_SECONDS_PER_REQUEST}. The timestamps you return should fall within your designated analysis range.
+
+If it helps improve the analysis, I've noticed from running these prompts on you many times that your analysis is very accurate for earlier timestamps (in fact it is usually pinpoint precise for the first match) and wildly inaccurate with later timestamps (for example the timestamp starts in the middle of the wrong match instead of the beginning of the right match). I'm not sure if that gives you a clue to improve your accuracy. I am looking for accuracy over speed here.
+
+The results from the previous API calls follow. Your timestamps should not be lower than the last result's timestamp. Bad timestamps have been a frequent bug when I prompt you without this context.
+
+```
+{matches}
+```
+
+The rest of this prompt is the original prompt for the first Gemini API call for this tournament, which you should follow.
+
+"""
+
+        response = genai_client.models.generate_content(
+            model='models/gemini-2.5-pro',
+            contents=genai.types.Content(
+                parts=[
+                    genai.types.Part(
+                        file_data=genai.types.FileData(file_uri=vod_url),
+                        video_metadata=genai.types.VideoMetadata(
+                            start_offset=f'{start_seconds}s',
+                            end_offset=f'{end_seconds}s',
+                            fps=0.005,
+                        )
+                    ),
+                    genai.types.Part(text=prelude + f"""Whenever a new match begins in the video, tell me the tags of the players that are playing in this match, what round it is and what characters they are playing, and the playback time when the match began.
+
+There are several factors that indicate that a match has begun. All of these criteria must be met:
+
+- The game count reads 0 for both players.
+- The percentage count reads 0 for both players.
+- At least one of the player names has changed recently.
+
+The player tags and round name are located at the top of the video.
+Player tags and round names should be formatted as proper names (not all-caps).
+Sometimes player tags will start with a different colored word. This is a sponsor title and it should be omitted from the player tag.
+The character names are located at the bottom of the video. The character names are on the same side as the respective player names.
+The YouTube playback time must be in seconds.
+""")
+                ]
+            ),
+            # I tried for a while to get Gemini to consistently give me back structured text just using my
+            # prompt, but it kept inserting backticks and dashes and other annoying things.
+            # After a while I gave up, so here I require a JSON schema for the output that looks like:
+            # [ { time, p1, p2, c1, c2, round (optional) } ]
+            config=genai.types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema={
+                    'type': 'ARRAY',
+                    'items': {
+                        'type': 'OBJECT',
+                        'properties': {
+                            'time': {'type': 'INTEGER', 'format': 'int32'},
+                            'player1': {'type': 'STRING'},
+                            'player2': {'type': 'STRING'},
+                            'character1': {'type': 'STRING'},
+                            'character2': {'type': 'STRING'},
+                            'round': {'type': 'STRING'},
+                        },
+                        'required': ['time', 'player1', 'player2', 'character1', 'character2']
+                    }
+                }
+            )
+        )
+
+        count_ingest('gemini_calls')
+        print(f'Finished Gemini call in {(time.time() - start):.2f} seconds.')
+        print(response.text)
+        return json.loads(response.text)
+
+    matches = []
+    # Uncomment these lines (and comment out the for-loop below) to test with a
+    # specific time range. This is useful for testing changes quickly and with
+    # less API quota, as analyzing a full event vod uses a significant number of
+    # tokens and takes a while.
+    # print("Analyzing the video for matches using Gemini. This usually takes a few minutes...")
+    # matches = analyze_chunk(0, 1200)
+    for n in range(0, num_genai_calls):
+        print(f'Call {n+1}/{num_genai_calls}: Calling Gemini to analyze the video. This usually takes a few minutes...')
+        matches += analyze_chunk(
+            n=n,
+            matches=matches,
+            start_seconds=n * MAX_DURATION_SECONDS_PER_REQUEST,
+            end_seconds=min(duration.total_seconds(), (n+1) * MAX_DURATION_SECONDS_PER_REQUEST))
+    
+    # Parse the Gemini response into individual vods.
+    results = []
+    seen_sets = [] # [(p1, p2, round)]
+    matches.sort(key=lambda x: x.get('time'))
+    print('Debugging all matches...')
+    print(matches)
+    for match in matches:
+        t = match.get('time')
+        url = vod_url + f"&t={t}"
+
+        if url_is_known(url):
+            click.echo(f'ALREADY PRESENT: {match}')
+            count_ingest('titles_known')
+            continue
+
+        if not match.get('character1') or not match.get('character2') or not match.get('player1') or not match.get('player2'):
+            click.echo(f'MISSING DATA: {match}')
+            count_ingest('titles_rejected')
+            continue
+
+        p1 = match['player1']
+        c1 = match['character1']
+        p2 = match['player2']
+        c2 = match['character2']
+        round = match.get('round')
+
+        result = f'p1={p1} c1={c1} p2={p2} c2={c2} event={event} round={round} vod_date={vod_date} url={url}'
+        # A vod starts on the first game of the set, i.e. don't add matches that have the same players and round name.
+        # This is only necessary because I can't get Gemini to omit later matches in a set in its response.
+        already_added = any(p1 == seen_p1 and p2 == seen_p2 and round == seen_round for (seen_p1, seen_p2, seen_round) in seen_sets)
+        if already_added:
+            continue
+        seen_sets.append((p1, p2, round))
+
+        click.echo(result)
+
+        c1_id = get_character_id(c1)
+        c2_id = get_character_id(c2)
+
+        if not c1_id or not c2_id:
+            count_ingest('titles_rejected')
+            continue
+        count_ingest('titles_matched')
+
+        # Model output is never as reliable as a parsed title.
+        results.append(StagedVod(
+            url=url,
+            title=None,
+            p1=p1,
+            c1_id=c1_id,
+            p2=p2,
+            c2_id=c2_id,
+            event=event,
+            round=round,
+            vod_date=vod_date,
+            confidence=GEMINI_CONFIDENCE,
+        ))
+
+    stage_vods('gemini', results)
+
+@click.command('ingest-multi-vod')
+@click.argument('multi_vod_url')
+@click.argument('event')
+@click.argument('title_format')
+@click.argument('datetime_str')
+@click.argument('filename')
+def ingest_multi_vod_command(multi_vod_url, event, datetime_str, title_format, filename):
+    """Splits a single VOD into multiple VODs from a description file.
+    
+    Example:
+
+        flask ingest-multi-vod "https://www.youtube.com/watch?v=blah" "CEO 2025" "%P1 (%C1) %V %P2 (%C2)" "2025-06-17 21:33:44+00:00" description.txt
+
+    where description.txt is lines in the format:
+
+        00:00 Alex (Zetterburn) vs. Bob (Olympia)
+        43:20 Cynthia (Wrastor) vs. Dylan (Forsburn)
+    """
+    results = []
+    with open(filename, 'r') as f:
+        format_regex_str = title_query_to_regex_str(title_format)
+        format_regex = re.compile(format_regex_str)
+
+        for line in f.readlines():
+            line = line.strip()
+            line_parts = line.split(' ')
+            timestamp, title = line_parts[0], ' '.join(line_parts[1:])
+            timestamp_parts = timestamp.split(':')
+            time = 0
+            if len(timestamp_parts) == 1:
+                time = int(timestamp_parts[0])
+            elif len(timestamp_parts) == 2:
+                time = int(timestamp_parts[0]) * 60 + int(timestamp_parts[1])
+            elif len(timestamp_parts) == 3:
+                time = int(timestamp_parts[0]) * 3600 + int(timestamp_parts[1]) * 60 + int(timestamp_parts[2])
+            else:
+                click.echo(f'UNKNOWN TIMESTAMP FORMAT: {timestamp}.')
+            
+            url = multi_vod_url + f"&t={time}"
+
+            if url_is_known(url):
+                click.echo(f'ALREADY PRESENT: {title}')
+                continue            
+
+            info = parse_vod_title(title, url, format_regex, default_event_name=event, resolve_ids=False, prompt_missing=sys.stdin.isatty())
+            if not info:
+                click.echo(f'DOES NOT MATCH: {title}')
+                continue
+            if not info.c1_id or not info.c2_id:
+                continue
+
+            result = f'p1={info.p1} c1={info.c1} p2={info.p2} c2={info.c2} event={info.event} round={info.round} vod_date={datetime_str} url={url}'
+            click.echo(result)
+            results.append(staged_vod_from_title(info, url, title, datetime_str))
+
+    stage_vods('multi-vod', results)
+
+def url_is_known(url):
+    """Whether the URL is already a VOD, or is staged and not rejected."""
+    db = get_db()
+    existing = db.cursor().execute("""
+    SELECT 1 FROM vod WHERE url = ?
+    UNION ALL
+    SELECT 1 FROM ingest_staging WHERE url = ? AND status != ?
+    LIMIT 1;
+    """, (url, url, REJECTED_STATUS)).fetchone()
+    return True if existing else False
+
+def staged_vod_from_title(info, url, title, vod_date):
+    return StagedVod(
+        url=url,
+        title=title,
+        p1=info.p1,
+        c1_id=info.c1_id,
+        p2=info.p2,
+        c2_id=info.c2_id,
+        event=info.event,
+        round=info.round,
+        vod_date=vod_date,
+        confidence=info.confidence,
+    )
+
+def stage_vods(source, staged_vods):
+    """Writes parsed VODs to ingest_staging as a new batch and commits.
+
+    Nothing is written to vod (or event/player) until the batch is promoted
+    with promote-staging, so ingest commands never hold the write lock for
+    long and never need someone at the keyboard.
+    """
+    count_ingest('rows_staged', len(staged_vods))
+    if not staged_vods:
+        click.echo('No new VODs to stage.')
+        return None
+
+    db = get_db()
+    # The random suffix keeps two runs of the same source in the same second apart.
+    batch_id = f"{source}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    created_at = datetime.now(timezone.utc).isoformat()
+    db.cursor().executemany("""
+    INSERT INTO ingest_staging (batch_id, status, source, confidence, title, url, p1, c1_id, p2, c2_id, event, round, vod_date, created_at)
+    VALUES                     (?,        ?,      ?,      ?,          ?,     ?,   ?,  ?,     ?,  ?,     ?,     ?,     ?,        ?);
+    """, [(batch_id, NOT_REVIEWED_STATUS, source, v.confidence, v.title, v.url, v.p1, v.c1_id, v.p2, v.c2_id, v.event, v.round, v.vod_date, created_at)
+          for v in staged_vods])
+    db.commit()
+
+    min_confidence = min(v.confidence for v in staged_vods)
+    click.echo(f'Staged {len(staged_vods)} VODs as batch {batch_id} (lowest confidence {min_confidence:.2f}).')
+    click.echo(f'Publish them with: flask promote-staging {batch_id}')
+    return batch_id
+
+def touch_last_updated():
+    """Sets the "last updated" date shown on the site to today."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    get_db().cursor().execute("""
+    INSERT OR REPLACE INTO metadata (key, value)
+    VALUES (?, ?)
+    """, ("last_updated", today))
+
+@click.command('promote-staging')
+@click.argument('batch_ids', nargs=-1)
+@click.option('--all', 'promote_all', is_flag=True, help='Promote every pending batch.')
+@click.option('--min-confidence', type=float, default=0.0, help='Leave staged VODs below this confidence pending.')
+@click.option('--reject', is_flag=True, help='Reject the batches instead of promoting them.')
+@click.option('--dry-run', is_flag=True, help='Print what would happen without committing.')
+def promote_staging_command(batch_ids, promote_all, min_confidence, reject, dry_run):
+    """Moves staged VODs from ingest commands into the VOD table.
+
+    Without arguments, lists the pending batches. Example:
+
+        flask promote-staging playlist-20250901-120000-3f9c2a1b
+        flask promote-staging --all --min-confidence 0.9
+    """
+    db = get_db()
+    cursor = db.cursor()
+
+    if not batch_ids and not promote_all:
+        batches = cursor.execute("""
+        SELECT batch_id, source, COUNT(*), MIN(confidence), MIN(created_at)
+        FROM ingest_staging
+        WHERE status = ?
+        GROUP BY batch_id
+        ORDER BY MIN(id);
+        """, (NOT_REVIEWED_STATUS,)).fetchall()
+        if not batches:
+            click.echo('No pending batches.')
+        for batch_id, source, count, confidence, created_at in batches:
+            click.echo(f'{batch_id}: {count} VODs from {source}, lowest confidence {confidence:.2f}, staged {created_at}')
+        return
+
+    cursor.execute("CREATE TEMP TABLE promote_batch (staging_id INTEGER PRIMARY KEY, event_id INTEGER, p1_id INTEGER, p2_id INTEGER);")
+    batch_filter = '' if promote_all else f"AND batch_id IN ({','.join('?' * len(batch_ids))})"
+    staged = cursor.execute(f"""
+    SELECT id, url, p1, p2, event
+    FROM ingest_staging
+    WHERE status = ? AND confidence >= ? {batch_filter}
+    ORDER BY id;
+    """, (NOT_REVIEWED_STATUS, min_confidence, *batch_ids)).fetchall()
+
+    if reject:
+        cursor.executemany("UPDATE ingest_staging SET status = ? WHERE id = ?;", [(REJECTED_STATUS, id) for id, *_ in staged])
+        click.echo(f'Rejected {len(staged)} staged VODs.')
+    else:
+        # The same URL can be staged by more than one batch; only the first one counts.
+        seen_urls = set()
+        duplicates = []
+        unique = []
+        for row in staged:
+            id, url, *_ = row
+            if url in seen_urls:
+                duplicates.append(id)
+            else:
+                unique.append(row)
+            seen_urls.add(url)
+        staged = unique
+
+        event_ids = ensure_events(event for (_, _, _, _, event) in staged)
+        player_ids = ensure_players([p for (_, _, p1, p2, _) in staged for p in (p1, p2)])
+        cursor.executemany("INSERT INTO promote_batch VALUES (?, ?, ?, ?);", [
+            (id, event_ids[event], player_ids[p1], player_ids[p2]) for (id, _, p1, p2, event) in staged])
+
+        # VODs that are already in the database are rejected, like duplicates in the batch.
+        already_added = [id for (id,) in cursor.execute("""
+        SELECT b.staging_id
+        FROM promote_batch b
+            INNER JOIN ingest_staging s ON s.id = b.staging_id
+        WHERE EXISTS (SELECT 1 FROM vod WHERE vod.url = s.url);
+        """).fetchall()]
+        cursor.executemany("DELETE FROM promote_batch WHERE staging_id = ?;", [(id,) for id in already_added])
+
+        cursor.execute("""
+        INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, vod_date, vod_ts, round)
+        SELECT ?, b.event_id, s.url, b.p1_id, b.p2_id, s.c1_id, s.c2_id, s.vod_date, vod_epoch(s.vod_date), s.round
+        FROM promote_batch b
+            INNER JOIN ingest_staging s ON s.id = b.staging_id
+        WHERE NOT EXISTS (SELECT 1 FROM vod WHERE vod.url = s.url)
+        ORDER BY s.id;
+        """, (RIVALS_OF_AETHER_TWO,))
+        promoted = cursor.rowcount
+        cursor.execute("UPDATE ingest_staging SET status = ? WHERE id IN (SELECT staging_id FROM promote_batch);", (APPROVED_STATUS,))
+        cursor.executemany("UPDATE ingest_staging SET status = ? WHERE id = ?;",
+                           [(REJECTED_STATUS, id) for id in duplicates + already_added])
+        if promoted:
+            touch_last_updated()
+
+        click.echo(f'Promoted {promoted} VODs.')
+        if already_added:
+            click.echo(f'Rejected {len(already_added)} staged VODs that are already in the database.')
+
+    cursor.execute("DROP TABLE promote_batch;")
+    if dry_run:
+        db.rollback()
+        click.echo('Dry run, nothing was committed.')
+    else:
+        db.commit()
+        if not reject and promoted:
+            after_vods_added()
+
+@click.command('backfill-vod-ts')
+@click.option('--chunk-size', default=1000, help='Rows to update per transaction.')
+def backfill_vod_ts_command(chunk_size):
+    """Fills in vod.vod_ts for VODs that don't have it yet.
+
+    Adds the column and its index first if the database predates them.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(vod);").fetchall()]
+    if 'vod_ts' not in columns:
+        cursor.execute("ALTER TABLE vod ADD COLUMN vod_ts INTEGER;")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vod_ts ON vod (vod_ts);")
+    db.commit()
+
+    # Commit in chunks so the site can keep reading while this runs.
+    num_vods = 0
+    last_id = 0
+    while True:
+        ids = cursor.execute("SELECT id FROM vod WHERE id > ? ORDER BY id LIMIT ?;", (last_id, chunk_size)).fetchall()
+        if not ids:
+            break
+        first_id, last_id = ids[0][0], ids[-1][0]
+        cursor.execute("""
+        UPDATE vod SET vod_ts = vod_epoch(vod_date)
+        WHERE id BETWEEN ? AND ? AND vod_ts IS NULL;
+        """, (first_id, last_id))
+        num_vods += cursor.rowcount
+        db.commit()
+
+    unparsed = cursor.execute("SELECT COUNT(*) FROM vod WHERE vod_ts IS NULL;").fetchone()[0]
+    click.echo(f'Backfilled vod_ts for {num_vods} vods ({unparsed} have no parseable date).')
+
+def search_plans():
+    """EXPLAIN QUERY PLAN for the queries behind the main kinds of search,
+    using the most common player, matchup and event: search name -> list of
+    plans (one per query), or the error if a query fails."""
+    db = get_db()
+    cursor = db.cursor()
+
+    def most_common(sql):
+        return tuple(cursor.execute(sql).fetchone() or ('', ''))
+
+    player, = most_common("""
+    SELECT player.tag FROM vod INNER JOIN player ON player.id = vod.p1_id
+    GROUP BY vod.p1_id ORDER BY COUNT(*) DESC LIMIT 1;
+    """)
+    c1, c2 = most_common("""
+    SELECT lower(c1.name), lower(c2.name)
+    FROM vod
+        INNER JOIN game_character c1 ON c1.id = vod.c1_id
+        INNER JOIN game_character c2 ON c2.id = vod.c2_id
+    WHERE vod.c1_id != vod.c2_id
+    GROUP BY vod.c1_id, vod.c2_id ORDER BY COUNT(*) DESC LIMIT 1;
+    """)
+    event, = most_common("""
+    SELECT event.name FROM vod INNER JOIN event ON event.id = vod.event_id
+    GROUP BY vod.event_id ORDER BY COUNT(*) DESC LIMIT 1;
+    """)
+    searches = [
+        ('empty', {}),
+        ('player', {'p1': player}),
+        ('character', {'c1': c1}),
+        ('matchup', {'c1': c1, 'c2': c2}),
+        ('event', {'event': event}),
+        ('rank_one', {'rank': 'one_lunarank'}),
+        ('rank_two', {'rank': 'two_lunarank'}),
+    ]
+
+    plans = {}
+    patches = load_patches()
+    for name, search in searches:
+        statements = []
+        db.set_trace_callback(statements.append)
+        try:
+            search_vods_page(*(search.get(key, '') for key in ('p1', 'p2', 'c1', 'c2', 'event', 'rank')),
+                             amount=current_app.config['SEARCH_PER_PAGE'], patches=patches)
+        except sqlite3.Error as e:
+            plans[name] = str(e)
+            continue
+        finally:
+            db.set_trace_callback(None)
+        plans[name] = [[row['detail'] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql)]
+                       for sql in statements if sql.lstrip().upper().startswith(('SELECT', 'WITH'))]
+    return plans
+
+def search_plans_for(database):
+    """search_plans() against another database file."""
+    app = current_app._get_current_object()
+    previous = app.config['DATABASE']
+    app.config['DATABASE'] = database
+    try:
+        with app.app_context():
+            return search_plans()
+    finally:
+        app.config['DATABASE'] = previous
+
+def echo_plan_changes(before, after, since):
+    """Prints each search's plans before and after, where `since` is the
+    migration a search that failed before first ran after, if any."""
+    for name in after:
+        label = f'{name} (runs from {since[name]:04d} on)' if name in since else name
+        if before[name] == after[name]:
+            click.echo(f'{label}: unchanged')
+            continue
+        click.echo(f'{label}:')
+        for label, plans in (('before', before[name]), ('after', after[name])):
+            if isinstance(plans, str):
+                click.echo(f'  {label}: fails ({plans})')
+                continue
+            click.echo(f'  {label}:')
+            for i, plan in enumerate(plans, 1):
+                click.echo(f'    query {i}:')
+                for detail in plan:
+                    click.echo(f'      {detail}')
+
+@click.command('migrate')
+@click.option('--dry-run', is_flag=True,
+              help='Migrate a copy of the database instead, and show how the search query plans change.')
+@click.option('--status', is_flag=True, help='Only list the pending migrations.')
+@click.option('--chunk-size', default=1000, help='Rows to backfill per transaction.')
+def migrate_command(dry_run, status, chunk_size):
+    """Brings the database's schema up to date without dropping anything.
+
+    Applies the migrations in migrations/ that are newer than the database's
+    schema_version. The site can keep serving while it runs.
+    """
+    database = current_app.config['DATABASE']
+    connection = migrations.connect(database)
+    try:
+        version = migrations.get_version(connection)
+        pending = migrations.pending(connection)
+    finally:
+        connection.close()
+
+    click.echo(f'Schema version {version}, latest is {migrations.latest_version()}.')
+    for migration in pending:
+        click.echo(f'  Pending: {migration.version:04d}_{migration.name}')
+    if not pending or status:
+        return
+
+    start = time.perf_counter()
+    if dry_run:
+        with tempfile.TemporaryDirectory() as directory:
+            copy = os.path.join(directory, 'dry-run.db')
+            source, destination = sqlite3.connect(database), sqlite3.connect(copy)
+            try:
+                source.backup(destination)
+            finally:
+                source.close()
+                destination.close()
+
+            # Today's search queries need some of the pending migrations, so
+            # a search that fails before migrating is compared from the first
+            # migration it runs after instead.
+            before = search_plans_for(copy)
+            since = {}
+            migrating = 0
+            for migration in pending:
+                migration_start = time.perf_counter()
+                migrations.migrate(copy, chunk_size, echo=click.echo, target=migration.version)
+                migrating += time.perf_counter() - migration_start
+                for name, plans in search_plans_for(copy).items():
+                    if isinstance(before[name], str) and not isinstance(plans, str):
+                        before[name] = plans
+                        since[name] = migration.version
+            click.echo(f'Migrated a copy in {migrating:.1f}s. Search query plans:')
+            echo_plan_changes(before, search_plans_for(copy), since)
+        click.echo('Dry run, the database wasn\'t changed.')
+    else:
+        applied = migrations.migrate(database, chunk_size, echo=click.echo)
+        click.echo(f'Applied {len(applied)} migrations in {time.perf_counter() - start:.1f}s.')
+
+@click.command('build-sprites')
+@click.option('--icons-dir', type=click.Path(exists=True, file_okay=False),
+              help='Read icons from this folder (matched by file name) instead of their URLs.')
+def build_sprites_command(icons_dir):
+    """Bundles the character icons into one fingerprinted stylesheet in static/sprites.
+
+    Restart the site afterwards to use it. Characters whose icon can't be
+    read keep being shown with an <img>.
+    """
+    rows = get_db().cursor().execute("SELECT id, name, icon_url FROM game_character ORDER BY id;").fetchall()
+    icons = []
+    for character_id, name, icon_url in rows:
+        try:
+            data = sprites.read_icon(icon_url, current_app.root_path, icons_dir)
+            sprites.image_type(data)
+        except (OSError, ValueError) as e:
+            click.echo(f'Skipping {name} ({icon_url}): {e}')
+            continue
+        icons.append((character_id, data))
+
+    filename = sprites.write(os.path.join(current_app.static_folder, 'sprites'), icons)
+    click.echo(f'Wrote static/sprites/{filename} with {len(icons)} of {len(rows)} character icons.')
+
+@click.command('build-assets')
+def build_assets_command():
+    """Copies the stylesheets and static files to static/assets under content-hashed names.
+
+    Each one that compresses also gets a gzipped copy to serve to clients
+    that accept it. Restart the site afterwards to link to them; until the
+    first build, stylesheets are inlined and static files served as-is.
+    """
+    manifest = assets.build(current_app.root_path, current_app.static_folder,
+                            os.path.join(current_app.static_folder, 'assets'))
+    click.echo(f'Wrote {len(manifest)} assets to static/assets.')
+
+def site_signature():
+    """What every page depends on besides its VODs: the templates and static
+    files, and the files in data/. The "last updated" bar is pre-rendered on
+    its own and included by the proxy, so a new day or event doesn't make
+    every page stale."""
+    newest_file = max(
+        (int(os.path.getmtime(os.path.join(root, name)))
+         for directory in ('templates', 'static')
+         for root, _, names in os.walk(os.path.join(current_app.root_path, directory))
+         for name in names),
+        default=0)
+    return (newest_file, reference_data.version())
+
+def static_page_signatures():
+    """path -> signature for the pages build-static renders: the home page,
+    credits, the "last updated" bar, every event and every matchup with VODs.
+
+    Search pages are signed with their first page of VODs and total, and
+    event pages with the event's summary and VODs, so a page is only
+    rendered again when what it shows changes.
+    """
+    cursor = get_db().cursor()
+    site = site_signature()
+    patches = load_patches()
+    per_page = current_app.config['SEARCH_PER_PAGE']
+
+    def search(c1='', c2=''):
+        return search_vods_page('', '', c1, c2, '', '', amount=per_page, patches=patches)
+
+    pages = {
+        '/': static_pages.signature(site, search()),
+        '/credits': static_pages.signature(site),
+        static_pages.UPDATES_PATH: static_pages.signature(site, get_recent_events(), get_last_updated_date()),
+    }
+    for (event_id,) in cursor.execute("SELECT id FROM event ORDER BY id;").fetchall():
+        pages[f'/event/{event_id}'] = static_pages.signature(
+            site, get_event_profile(event_id), event_vods(event_id, None, patches=patches))
+    for c1, c2 in cursor.execute("""
+    SELECT lower(c1.name), lower(c2.name)
+    FROM matchup_count m
+        INNER JOIN game_character c1 ON c1.id = m.char_lo
+        INNER JOIN game_character c2 ON c2.id = m.char_hi
+    WHERE m.vods > 0
+    ORDER BY m.char_lo, m.char_hi;
+    """).fetchall():
+        # In the canonical form the site redirects searches to.
+        pages['/?' + urlencode(sorted({'c1': c1, 'c2': c2}.items()))] = static_pages.signature(site, search(c1, c2))
+    return pages
+
+def build_static_pages(directory, jobs=None, force=False):
+    rendered, unchanged, failures = static_pages.build(
+        current_app.import_name, directory, static_page_signatures(),
+        current_app.config['STATIC_PAGES_BASE_URL'], jobs=jobs, force=force)
+    for path, status in failures:
+        click.echo(f'Skipping {path}: HTTP {status}')
+    click.echo(f'Rendered {len(rendered)} pages to {directory} ({len(unchanged)} unchanged).')
+
+def refresh_static_pages():
+    """Rebuilds the pages in STATIC_PAGES_DIR, if it's set, after a command changes the VODs."""
+    directory = current_app.config.get('STATIC_PAGES_DIR')
+    if directory:
+        build_static_pages(directory)
+
+def after_vods_added():
+    """Refreshes the pre-rendered pages and warms the caches after a command adds VODs."""
+    refresh_static_pages()
+    if current_app.config['WARM_CACHES_AFTER_INGEST']:
+        warm_caches(current_app.config['WARM_CACHES_TOP'])
+
+def warm_caches(top, days=7, url=None, jobs=4):
+    """Requests the `top` most popular paths in the search log from the last
+    `days` days, from the site at `url` (or WARM_CACHES_URL) if it's set and
+    otherwise in this process."""
+    paths = [path for (path, _, _) in search_log.popular_paths(get_db().cursor(), top, days)]
+    if not paths:
+        click.echo('No searches logged yet, nothing to warm.')
+        return
+    base_url = url or current_app.config['WARM_CACHES_URL']
+    if base_url:
+        def get(path):
+            try:
+                request = urllib.request.Request(base_url.rstrip('/') + path,
+                                                 headers={search_log.SKIP_HEADER: '1'})
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                    return response.status
+            except OSError as e:
+                return getattr(e, 'code', str(e))
+    else:
+        app = current_app._get_current_object()
+        clients = threading.local()
+
+        def get(path):
+            if not hasattr(clients, 'client'):
+                clients.client = app.test_client()
+            return clients.client.get(path, headers={search_log.SKIP_HEADER: '1'}).status_code
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        statuses = list(executor.map(get, paths))
+    for path, status in zip(paths, statuses):
+        if status != 200:
+            click.echo(f'Warming {path} failed: {status}')
+    click.echo(f"Warmed {statuses.count(200)} of {len(paths)} popular pages{f' on {base_url}' if base_url else ''}.")
+
+@click.command('warm-caches')
+@click.option('--top', type=int, help='How many pages to request. Defaults to WARM_CACHES_TOP.')
+@click.option('--days', default=7, help='Rank pages by their requests over this many days.')
+@click.option('--url', help='The site to request them from. Defaults to WARM_CACHES_URL.')
+@click.option('--jobs', '-j', default=4, help='Requests to make at once.')
+def warm_caches_command(top, days, url, jobs):
+    """Requests the most popular search, player and event pages so they're cached.
+
+    Commands that add VODs do this themselves when WARM_CACHES_AFTER_INGEST is set.
+    """
+    warm_caches(top or current_app.config['WARM_CACHES_TOP'], days=days, url=url, jobs=jobs)
+
+@click.command('popular-searches')
+@click.option('--top', default=25, help='How many pages to list.')
+@click.option('--days', default=7, help='Rank pages by their requests over this many days.')
+def popular_searches_command(top, days):
+    """Lists the most requested search, player and event pages in the search log.
+
+    Requests are sampled (see SEARCH_LOG_SAMPLE_RATE), so the counts are
+    relative rather than exact.
+    """
+    rows = search_log.popular_paths(get_db().cursor(), top, days)
+    if not rows:
+        click.echo('No searches logged yet.')
+        return
+    for path, hits, day in rows:
+        last_seen = datetime.fromtimestamp(day * 86400, timezone.utc).date()
+        click.echo(f'{hits:8}  {last_seen}  {path}')
+
+@click.command('build-static')
+@click.option('--output', '-o', type=click.Path(file_okay=False),
+              help='Where to write the pages. Defaults to STATIC_PAGES_DIR.')
+@click.option('--jobs', '-j', type=int, help='Pages to render in parallel. Defaults to the number of CPUs.')
+@click.option('--force', is_flag=True, help='Render every page, even if its VODs haven\'t changed.')
+def build_static_command(output, jobs, force):
+    """Renders the home page, credits, event and matchup pages to files for a front proxy to serve.
+
+    Only pages whose VODs changed since the last build are rendered again.
+    Ingest commands do this themselves when STATIC_PAGES_DIR is set.
+    """
+    directory = output or current_app.config.get('STATIC_PAGES_DIR')
+    if not directory:
+        raise click.UsageError('Pass --output or set FLASK_STATIC_PAGES_DIR.')
+    build_static_pages(directory, jobs=jobs, force=force)
+
+@click.command('rebuild-participants')
+def rebuild_participants_command():
+    """Rebuilds vod_participant from the player/character slots in vod.
+
+    Triggers keep it up to date on insert, so this is only needed for VODs
+    added before the table existed.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM vod_participant;")
+    for slot in range(1, 5):
+        cursor.execute(f"""
+        INSERT INTO vod_participant (vod_id, slot, player_id, character_id)
+        SELECT id, {slot}, p{slot}_id, c{slot}_id FROM vod WHERE p{slot}_id IS NOT NULL;
+        """)
+    db.commit()
+    count = cursor.execute("SELECT COUNT(*) FROM vod_participant;").fetchone()[0]
+    click.echo(f'Rebuilt {count} VOD participants.')
+
+@click.command('rebuild-matchups')
+def rebuild_matchups_command():
+    """Rebuilds vod_matchup and matchup_count from vod.
+
+    Triggers keep them up to date on insert, so this is only needed for VODs
+    added before the tables existed.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM vod_matchup;")
+    cursor.execute("""
+    INSERT INTO vod_matchup (vod_id, char_lo, char_hi, vod_ts, flipped)
+    SELECT id, MIN(c1_id, c2_id), MAX(c1_id, c2_id), vod_ts, c1_id > c2_id FROM vod;
+    """)
+    cursor.execute("DELETE FROM matchup_count;")
+    cursor.execute("""
+    INSERT INTO matchup_count (char_lo, char_hi, vods)
+    SELECT char_lo, char_hi, COUNT(*) FROM vod_matchup GROUP BY char_lo, char_hi;
+    """)
+    db.commit()
+    count = cursor.execute("SELECT COUNT(*) FROM matchup_count;").fetchone()[0]
+    click.echo(f'Rebuilt the matchup index for {count} matchups.')
+
+@click.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recomputes the stats tables from scratch.
+
+    The stats are kept up to date incrementally as VODs are inserted, so this
+    is only needed after patches.txt changes, after bulk edits to vod (first
+    and last seen dates aren't rolled back on delete), or for VODs added before
+    the tables existed.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    sync_patches()
+
+    cursor.execute("DELETE FROM stat_character;")
+    cursor.execute("""
+    INSERT INTO stat_character (character_id, picks)
+    SELECT character_id, COUNT(*) FROM vod_participant WHERE character_id IS NOT NULL GROUP BY character_id;
+    """)
+
+    cursor.execute("DELETE FROM stat_player;")
+    cursor.execute("""
+    INSERT INTO stat_player (player_id, vods, first_ts, last_ts)
+    SELECT vp.player_id, COUNT(DISTINCT vp.vod_id), MIN(vod.vod_ts), MAX(vod.vod_ts)
+    FROM vod_participant vp
+        INNER JOIN vod ON vod.id = vp.vod_id
+    GROUP BY vp.player_id;
+    """)
+
+    cursor.execute("DELETE FROM stat_player_character;")
+    cursor.execute("""
+    INSERT INTO stat_player_character (player_id, character_id, vods)
+    SELECT player_id, character_id, COUNT(*) FROM vod_participant
+    WHERE character_id IS NOT NULL
+    GROUP BY player_id, character_id;
+    """)
+
+    cursor.execute("DELETE FROM stat_event;")
+    cursor.execute("""
+    INSERT INTO stat_event (event_id, vods, first_ts, last_ts)
+    SELECT event_id, COUNT(*), MIN(vod_ts), MAX(vod_ts) FROM vod GROUP BY event_id;
+    """)
+
+    cursor.execute("DELETE FROM stat_event_character;")
+    cursor.execute("""
+    INSERT INTO stat_event_character (event_id, character_id, picks)
+    SELECT vod.event_id, vp.character_id, COUNT(*)
+    FROM vod_participant vp
+        INNER JOIN vod ON vod.id = vp.vod_id
+    WHERE vp.character_id IS NOT NULL
+    GROUP BY vod.event_id, vp.character_id;
+    """)
+
+    cursor.execute("DELETE FROM stat_patch_event;")
+    cursor.execute("""
+    INSERT INTO stat_patch_event (patch_name, event_id, vods)
+    SELECT patch_name, event_id, COUNT(*) FROM (
+        SELECT vod.event_id,
+               (SELECT name FROM patch WHERE start_ts <= vod.vod_ts ORDER BY start_ts DESC LIMIT 1) AS patch_name
+        FROM vod
+    )
+    WHERE patch_name IS NOT NULL
+    GROUP BY patch_name, event_id;
+    """)
+
+    cursor.execute("DELETE FROM matchup_count;")
+    cursor.execute("""
+    INSERT INTO matchup_count (char_lo, char_hi, vods)
+    SELECT char_lo, char_hi, COUNT(*) FROM vod_matchup GROUP BY char_lo, char_hi;
+    """)
+
+    db.commit()
+    click.echo('Rebuilt stats.')
+
+def title_query_to_regex_str(query):
+    """Converts queries like "%P1 (%C1) %V %P2 (%C2)" into a regex str."""
+    return (re.escape(query)
+                    .replace('%SIDE', r'(([\s*W\s*])|([\s*L\s*]))')
+                    .replace('%E', r'(?P<event>[\w\s\+\-#&;:@\'\(\)\.\,~/~]+)')
+                    .replace('%P1', r'(?P<p1>[\s*\w\$|&;:~!?#.@\-\+]+)')
+                    .replace('%P2', r'(?P<p2>[\s*\w\$|&;:~!?#.@\-\+]+)')
+                    .replace('%C1', r'(?P<c1>[\s*\w/*,*]+)')
+                    .replace('%C2', r'(?P<c2>[\s*\w/*,*]+)')
+                    .replace('%V', '((vs.)|(vs)|(Vs.)|(VS.)|(Vs)|(VS))')
+                    .replace('%ROA', '((RoA2)|(ROA2)|(RoA 2)|(ROA 2)|(RoAII)|(ROAII)|(Rivals II)|(RIVALS 2)|(RIVALS II)|(RIVALS OF AETHER 2)|(RIVALS OF AETHER II)|(Rivals 2)|(Rivals of Aether 2)|(Rivals 2 Tournament)|(Rivals of Aether II)|(Rivals II Bracket)|(Rivals 2 Bracket))?')
+                    .replace('%R', r'(?P<round>[\s*\(*\s*\w\-#&;\)*]+)'))
+
+def parse_vod_title(title, url, format_regex, default_event_name="Unknown", resolve_ids=True, prompt_missing=True):
+    """Parses a video title with a regex from title_query_to_regex_str.
+
+    With resolve_ids=False the player and event IDs are left as None, so
+    nothing is written to the database (used when staging VODs). Missing
+    characters are only prompted for if prompt_missing is set.
+    """
+    info = format_regex.match(title.strip())
+    if not info:
+        return None
+    
+    p1 = info.group('p1')
+    p2 = info.group('p2')
+
+    c1 = None
+    if info.groupdict().get('c1'):
+        c1 = info.group('c1').lower().split(',')[0].split('/')[0].replace('P1 ', '').replace('P2 ', '')
+    elif prompt_missing:
+        c1 = prompt(f"c1 for {url}")
+    c2 = None
+    if info.groupdict().get('c2'):
+        c2 = info.group('c2').lower().split(',')[0].split('/')[0].replace('P1 ', '').replace('P2 ', '')
+    elif prompt_missing:
+        c2 = prompt(f"c2 for {url}")
+    event = info.groupdict().get('event') or default_event_name
+    round = info.groupdict().get('round') or ''
+
+    # TODO: Parse round name info.
+    event_id = ensure_event(event) if resolve_ids else None
+    p1_id = ensure_player(p1) if resolve_ids else None
+    p2_id = ensure_player(p2) if resolve_ids else None
+    c1_id = get_character_id(c1) if c1 else None
+    c2_id = get_character_id(c2) if c2 else None
+
+    # How much to trust the parse: characters that only matched through a
+    # nickname and titles without an event name are more often misparsed.
+    confidence = 1.0
+    for c in (c1, c2):
+        if c and c.strip().lower() not in CHAR_NAME_TO_ID:
+            confidence -= 0.1
+    if not info.groupdict().get('event') and default_event_name == "Unknown":
+        confidence -= 0.2
+
+    return ParsedVodTitle(
+        p1=p1,
+        p1_id=p1_id,
+        p2=p2,
+        p2_id=p2_id,
+        c1=c1,
+        c1_id=c1_id,
+        c2=c2,
+        c2_id=c2_id,
+        event=event,
+        event_id=event_id,
+        round=round,
+        # `round` is shadowed by the round name here.
+        confidence=float(f'{max(confidence, 0.0):.2f}'),
+    )
+
+# Thanks to https://stackoverflow.com/a/77332099.
+def parse_iso8601_duration(duration: str) -> timedelta:    
+    pattern = r"^P(?:(?P<days>\d+\.\d+|\d*?)D)?T?(?:(?P<hours>\d+\.\d+|\d*?)H)?(?:(?P<minutes>\d+\.\d+|\d*?)M)?(?:(?P<seconds>\d+\.\d+|\d*?)S)?$"
+    match = re.match(pattern, duration)
+    if not match:
+        raise ValueError(f"Invalid ISO 8601 duration: {duration}")
+    parts = {k: float(v) for k, v in match.groupdict("0").items()}
+    return timedelta(**parts)
+
+def prompt(text, default=None):
+    value = input(f'{text} ' + (f'[{default}]' if default else '') + ': ')
+    return value if value else default
+    
+# # Google Sheets Stuff
+
+# @click.command('pull-sheet')
+# def pull_sheet_command():
+#     """Pull data from the Google Sheet and update vods.csv"""
+#     import gspread
+#     from google.oauth2.service_account import Credentials
+#     import csv
+#     import os
+
+#     # Authenticate w/ Google Sheets
+#     scope = ['https://www.googleapis.com/auth/spreadsheets']
+#     credentials = Credentials.from_service_account_file('google_service_account.json', scopes=scope)
+#     client = gspread.authorize(credentials)
+
+#     sheet_id = '1RRblTHe9hmlQDmOw05dglEXmnuH0fcB7f-ZqHjBOyT4'
+#     sheet = client.open_by_key(sheet_id).worksheet('vods')
+    
+#     # Get data from the sheet
+#     all_values = sheet.get_all_values()
+#     if not all_values:
+#         click.echo('Sheet is empty!')
+#         return
+    
+#     # Skip header row
+#     data_rows = all_values[1:]
+    
+#     # Write to vods.csv
+#     csv_path = './data/vods.csv'
+#     try:
+#         with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+#             writer = csv.writer(csvfile)
+#             for row in data_rows:
+#                 # Only write non-empty rows
+#                 if any(row):
+#                     writer.writerow(row)
+        
+#         click.echo(f'Successfully synced {len(data_rows)} rows from Google Sheet to {csv_path}')
+#     except Exception as e:
+#         click.echo(f'Error writing to CSV: {e}')
+
+# @click.command('push-sheet')
+# def push_sheet_command():
+#     """Push vods.csv data to Google Sheet"""
+#     import gspread
+#     from google.oauth2.service_account import Credentials
+#     import csv
+    
+#     # Read vods.csv
+#     csv_path = './data/vods.csv'
+#     try:
+#         with open(csv_path, 'r', encoding='utf-8') as csvfile:
+#             reader = csv.reader(csvfile)
+#             csv_data = list(reader)
+#     except FileNotFoundError:
+#         click.echo(f'Error: {csv_path} not found!')
+#         return
+#     except Exception as e:
+#         click.echo(f'Error reading CSV: {e}')
+#         return
+    
+#     if not csv_data:
+#         click.echo('CSV is empty!')
+#         return
+    
+#     # Authenticate with Google Sheets
+#     scope = ['https://www.googleapis.com/auth/spreadsheets']
+#     creds = Credentials.from_service_account_file('google_service_account.json', scopes=scope)
+#     client = gspread.authorize(creds)
+    
+#     # Open the sheet
+#     sheet_id = '1RRblTHe9hmlQDmOw05dglEXmnuH0fcB7f-ZqHjBOyT4'
+#     try:
+#         sheet = client.open_by_key(sheet_id).worksheet('vods')
+#     except Exception as e:
+#         click.echo(f'Error opening sheet: {e}')
+#         return
+    
+#     try:
+#         # Clear all cells except the header (row 1)
+#         # Get current data to see how many rows we need to clear
+#         current_values = sheet.get_all_values()
+        
+#         if len(current_values) > 1:
+#             # Clear rows 2 onwards using batch_clear instead of delete_rows
+#             sheet.batch_clear([f'A2:H{len(current_values)}'])
+        
+#         # Append the CSV data
+#         if len(csv_data) > 0:
+#             sheet.append_rows(csv_data, value_input_option='RAW')
+        
+#         click.echo(f'Successfully synced {len(csv_data)} rows from {csv_path} to Google Sheet')
+#     except Exception as e:
+#         click.echo(f'Error updating sheet: {e}')
@@ -1,12 +1,13 @@
+import bisect
+import functools
 import sqlite3
-import click
-import re
-import math
-from datetime import datetime, timezone, timedelta
+import sys
+from datetime import datetime, timezone
 from flask import current_app, g
-from utils.authenticate_google_sheet import get_vods_sheet
 
-from models import Vod, Patch, VodAndPatch, ParsedVodTitle
+from models import Vod
+from utils.reference_data import reference_data
+from utils import cli, migrations, profiling
 
 CHAR_NAME_TO_ID = {
     "random": 1,
@@ -38,13 +39,17 @@ APPROVED_STATUS = 3
 
 RIVALS_OF_AETHER_TWO = 1
 
+# Staged VODs from Gemini's video analysis (extract-vods) get this confidence.
+GEMINI_CONFIDENCE = 0.5
+
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-           'database.db',
+        g.db = profiling.connect(
+            current_app.config.get('DATABASE', 'database.db'),
             detect_types=sqlite3.PARSE_DECLTYPES
         )
         g.db.row_factory = sqlite3.Row
+        g.db.create_function('vod_epoch', 1, vod_date_to_epoch, deterministic=True)
 
     return g.db
 
@@ -61,6 +66,42 @@ def init_db():
     with current_app.open_resource('schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
 
+    sync_patches()
+    # schema.sql is the latest schema, so there's nothing to migrate.
+    migrations.set_version(db, migrations.latest_version())
+    db.commit()
+
+def sync_patches():
+    """Copies data/patches.txt into the patch table, which the stats triggers use."""
+    db = get_db()
+    db.cursor().execute("DELETE FROM patch;")
+    db.cursor().executemany("INSERT INTO patch (name, start_ts, url) VALUES (?, ?, ?);",
+                            [(p.name, int(p.date.timestamp()), p.url) for p in load_patches()])
+
+def vod_date_to_epoch(vod_date):
+    """Normalizes the vod_date formats we store into a UTC epoch for vod.vod_ts.
+
+    vod_date can be "2024-04-28 16:00:04+00:00" (CSV), "2024-04-28T16:00:04Z"
+    (YouTube API) or a naive isoformat string (submissions), in which case it's
+    treated as UTC. Returns None if the date can't be parsed.
+    """
+    if not vod_date:
+        return None
+    if not isinstance(vod_date, datetime):
+        try:
+            vod_date = datetime.fromisoformat(str(vod_date).strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if vod_date.tzinfo is None:
+        vod_date = vod_date.replace(tzinfo=timezone.utc)
+    return int(vod_date.timestamp())
+
+def insert_vod(event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date, game_id=RIVALS_OF_AETHER_TWO):
+    get_db().cursor().execute("""
+    INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date, vod_ts)
+    VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?,        ?);
+    """, (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date, vod_date_to_epoch(vod_date)))
+
 def get_character_id(name):
     name = name.strip().lower()
 
@@ -118,15 +159,54 @@ def ensure_player(player):
     
     return entry[0] if entry else None
 
+def ensure_events(events):
+    """Like ensure_event, but for many names at once. Returns a {name: id} dict."""
+    return _ensure_names('event', 'name', events)
+
+def ensure_players(players):
+    """Like ensure_player, but for many tags at once. Returns a {tag: id} dict."""
+    return _ensure_names('player', 'tag', players)
+
+def _ensure_names(table, column, names):
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_name (name TEXT PRIMARY KEY);")
+    cursor.execute("DELETE FROM wanted_name;")
+    cursor.executemany("INSERT OR IGNORE INTO wanted_name (name) VALUES (?);", [(n,) for n in names if n])
+    cursor.execute(f"""
+    INSERT INTO {table} ({column})
+    SELECT name FROM wanted_name WHERE name NOT IN (SELECT {column} FROM {table});
+    """)
+    ids = dict(cursor.execute(f"""
+    SELECT {column}, MIN(id) FROM {table} WHERE {column} IN (SELECT name FROM wanted_name) GROUP BY {column};
+    """).fetchall())
+    cursor.execute("DELETE FROM wanted_name;")
+    return ids
+
 def create_submission(url, p1_char, p2_char, p1_tag, p2_tag, event, round, date):
     db = get_db()
-    db.cursor().execute("""
-    INSERT INTO submission (game_id, url, status, p1, c1, p2, c2, event, round, date)
-    VALUES                 (?,       ?,   ?,      ?,  ?,  ?,  ?,  ?,     ?,     ?);
-    """,
-    (RIVALS_OF_AETHER_TWO, url, NOT_REVIEWED_STATUS, p1_tag, p1_char, p2_tag, p2_char, event, round, date,))
+    insert_submissions(db, [(None, url, p1_char, p2_char, p1_tag, p2_tag, event, round, date)])
     db.commit()
 
+def insert_submissions(db, submissions):
+    """Inserts (token, url, p1_char, p2_char, p1_tag, p2_tag, event, round, date) tuples.
+
+    A submission whose token is already in the table isn't inserted again, so
+    replaying a batch that was already written (e.g. from the submission spool)
+    is harmless. Submissions without a token are always inserted.
+    """
+    db.cursor().executemany("""
+    INSERT INTO submission (token, game_id, url, status, p1, c1, p2, c2, event, round, date)
+    VALUES                 (?,     ?,       ?,   ?,      ?,  ?,  ?,  ?,  ?,     ?,     ?)
+    ON CONFLICT (token) DO NOTHING;
+    """,
+    [(token, RIVALS_OF_AETHER_TWO, url, NOT_REVIEWED_STATUS, p1_tag, p1_char, p2_tag, p2_char, event, round, date)
+     for token, url, p1_char, p2_char, p1_tag, p2_tag, event, round, date in submissions])
+
+def submission_exists(db, token):
+    existing = db.cursor().execute("SELECT id FROM submission WHERE token = ? LIMIT 1;", (token,)).fetchone()
+    return True if existing else False
+
 def vod_exists(url):
     db = get_db()
     existing_vod = db.cursor().execute("SELECT id from vod WHERE url = ? LIMIT 1;", (url,)).fetchone()
@@ -135,19 +215,19 @@ def vod_exists(url):
 def latest_vods(amount=10000):
     db = get_db()
     vods = db.cursor().execute("""
-    SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c1.icon_url, c2.name, c2.icon_url, e.name, vod.round, vod.vod_date
+    SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c1.icon_url, c2.name, c2.icon_url, e.name, vod.round, vod.vod_ts
     FROM vod
         INNER JOIN event e ON e.id = vod.event_id
         INNER JOIN player p1 ON p1.id = vod.p1_id
         INNER JOIN player p2 ON p2.id = vod.p2_id
         INNER JOIN game_character c1 ON c1.id = vod.c1_id
         INNER JOIN game_character c2 ON c2.id = vod.c2_id
-    ORDER BY vod_date DESC
+    ORDER BY vod.vod_ts DESC, vod.id DESC
     LIMIT ?
     """, (amount,)).fetchall()
     
     result = []
-    for id, url, p1_tag, p2_tag, c1_name, c1_icon_url, c2_name, c2_icon_url, event, round, vod_date in vods:
+    for id, url, p1_tag, p2_tag, c1_name, c1_icon_url, c2_name, c2_icon_url, event, round, vod_ts in vods:
         result.append(Vod(
             url=url,
             round=round,
@@ -155,109 +235,470 @@ def latest_vods(amount=10000):
             p2_tag=p2_tag,
             c1_icon_url=c1_icon_url,
             c2_icon_url=c2_icon_url,
-            vod_date=vod_date,
+            vod_ts=vod_ts,
             event_name=event
         ))
     return result
 
-def search_vods(p1, p2, c1, c2, event, rank, amount=10000):
+def matchup_key(c1, c2):
+    """Returns (char_lo, char_hi, flipped) for a search on two known characters, otherwise None.
+
+    `flipped` is whether c1 is the higher character ID, i.e. whether a VOD
+    stored as (char_lo, char_hi) has to be swapped to match the search.
+    """
+    c1_id = CHAR_NAME_TO_ID.get(c1.lower()) if c1 else None
+    c2_id = CHAR_NAME_TO_ID.get(c2.lower()) if c2 else None
+    if not c1_id or not c2_id:
+        return None
+    return min(c1_id, c2_id), max(c1_id, c2_id), c1_id > c2_id
+
+def matchup_total(c1, c2):
+    """The number of VODs for a character matchup, from the matchup_count table."""
+    matchup = matchup_key(c1, c2)
+    if not matchup:
+        return None
+    char_lo, char_hi, _ = matchup
+    row = get_db().cursor().execute(
+        "SELECT vods FROM matchup_count WHERE char_lo = ? AND char_hi = ?;", (char_lo, char_hi)).fetchone()
+    return row[0] if row else 0
+
+def get_stats(num_players=25):
+    """Site-wide stats, read from the stat_* tables the triggers in schema.sql maintain."""
     db = get_db()
+    cursor = db.cursor()
+
+    characters = cursor.execute("""
+    SELECT c.id, c.name, c.icon_url, s.picks
+    FROM stat_character s
+        INNER JOIN game_character c ON c.id = s.character_id
+    WHERE s.picks > 0
+    ORDER BY s.picks DESC;
+    """).fetchall()
+    total_picks = sum(picks for (_, _, _, picks) in characters)
+
+    matchups = cursor.execute("""
+    SELECT c1.name, c2.name, m.vods
+    FROM matchup_count m
+        INNER JOIN game_character c1 ON c1.id = m.char_lo
+        INNER JOIN game_character c2 ON c2.id = m.char_hi
+    WHERE m.vods > 0
+    ORDER BY m.vods DESC;
+    """).fetchall()
+
+    players = cursor.execute("""
+    SELECT p.id, p.tag, s.vods
+    FROM stat_player s
+        INNER JOIN player p ON p.id = s.player_id
+    ORDER BY s.vods DESC
+    LIMIT ?;
+    """, (num_players,)).fetchall()
+
+    patches = cursor.execute("""
+    SELECT p.name, p.url, COUNT(s.event_id), COALESCE(SUM(s.vods), 0)
+    FROM patch p
+        LEFT JOIN stat_patch_event s ON s.patch_name = p.name
+    GROUP BY p.name
+    ORDER BY p.start_ts DESC;
+    """).fetchall()
+
+    return {
+        "characters": [
+            {"id": id, "name": name, "icon_url": icon_url, "picks": picks,
+             "pick_rate": picks / total_picks if total_picks else 0.0}
+            for (id, name, icon_url, picks) in characters
+        ],
+        "matchups": [{"c1": c1, "c2": c2, "vods": vods} for (c1, c2, vods) in matchups],
+        "top_players": [{"id": id, "tag": tag, "vods": vods} for (id, tag, vods) in players],
+        "patches": [{"name": name, "url": url, "events": events, "vods": vods}
+                    for (name, url, events, vods) in patches],
+    }
+
+def get_data_generation():
+    """A counter the triggers in schema.sql bump whenever VODs, player tags or event names change."""
+    return get_data_version()[0]
+
+def get_data_version():
+    """Returns (data_generation, data_updated_at) from metadata. data_updated_at is an epoch or None."""
+    values = dict(get_db().cursor().execute("""
+    SELECT key, value FROM metadata WHERE key IN ('data_generation', 'data_updated_at');
+    """).fetchall())
+    generation = values.get('data_generation')
+    updated_at = values.get('data_updated_at')
+    return (int(generation) if generation is not None else 0,
+            int(updated_at) if updated_at is not None else None)
+
+def suggestion_entries(field):
+    """(name, VOD count) pairs for the typeahead, one per distinct player tag or event name."""
+    if field == 'player':
+        query = """
+        SELECT p.tag, COALESCE(SUM(s.vods), 0)
+        FROM player p
+            LEFT JOIN stat_player s ON s.player_id = p.id
+        GROUP BY p.tag;
+        """
+    elif field == 'event':
+        query = """
+        SELECT e.name, COALESCE(SUM(s.vods), 0)
+        FROM event e
+            LEFT JOIN stat_event s ON s.event_id = e.id
+        GROUP BY e.name;
+        """
+    else:
+        raise ValueError(f'Unknown suggestion field: {field}')
+    return get_db().cursor().execute(query).fetchall()
+
+def search_vods(p1, p2, c1, c2, event, rank, amount=10000, after=None, before=None, offset=0, after_key=None):
+    """Searches VODs, newest first. `after`/`before` are optional epoch bounds on vod_ts.
+
+    `after_key` is the (vod_ts, id) of the last VOD on the previous page, for
+    keyset pagination.
+    """
+    return query_vods(amount=amount, offset=offset, after_key=after_key,
+                      **vod_search_query(p1, p2, c1, c2, event, rank, after, before))
+
+def search_vods_page(p1, p2, c1, c2, event, rank, amount, offset=0, after=None, before=None, patches=None):
+    """Returns (vods, total) for one page of a search, with the patches attached."""
+    vods, total = stream_search_vods(p1, p2, c1, c2, event, rank, amount, offset, after, before, patches)
+    return list(vods), total()
 
-    p1_match = '%' + p1 + '%'
-    p2_match = '%' + p2 + '%'
-    c1_match = '%' + c1 + '%'
-    c2_match = '%' + c2 + '%'
-    event_match = '%' + event + '%'
+def stream_search_vods(p1, p2, c1, c2, event, rank, amount, offset=0, after=None, before=None, patches=None):
+    """Returns (vods, total) for one page of a search, where `vods` is an
+    iterator that reads the page's rows as it's consumed and `total()` returns
+    the number of results.
 
+    Plain matchup searches get their total from the matchup counts. Otherwise
+    it's a separate COUNT(*) (see vod_count), run when `total()` is called.
+    """
+    query = vod_search_query(p1, p2, c1, c2, event, rank, after, before)
+    vods = build_vods(vod_rows(amount=amount, offset=offset, **query), patches)
+    total = None
+    if not (p1 or p2 or event or rank or after or before):
+        total = matchup_total(c1, c2)
+
+    if total is not None:
+        return vods, lambda: total
+    return vods, lambda: vod_count(**query)
+
+def vod_search_query(p1, p2, c1, c2, event, rank, after=None, before=None):
+    """Builds the keyword arguments to query_vods or iter_vods for a search.
+
+    Player and character filters match any slot through vod_participant, so
+    they're index lookups rather than ORs across the vod columns, and they also
+    match the third and fourth players of doubles VODs. Searches for a pair of
+    characters are a range scan of vod_matchup instead.
+    """
     rank_source = None
     rank_count = None
     if rank and rank.lower() in ['one_lunarank', 'two_lunarank']:
-        rank_source = 'data/lunarank.txt'
+        rank_source = 'lunarank'
         rank_count = 1 if rank == 'one_lunarank' else 2
     if rank and rank.lower() in ['one_alexrank', 'two_alexrank']:
-        rank_source = 'data/alexrank.txt'
+        rank_source = 'alexrank'
         rank_count = 1 if rank == 'one_alexrank' else 2
-    
-    rank_query = ''
+
+    with_query = ''
+    where = ['e.name LIKE ?']
+    params = ['%' + event + '%']
+
     if rank_source:
-        players = []
-        with open(rank_source) as f:
-            for line in f.readlines():
-                if line.startswith('#'):
-                    continue
-                players.append(line.strip().lower())
+        players = reference_data.get(rank_source)
+        with_query = f"""
+        WITH ranked_player (id) AS (
+            SELECT id FROM player WHERE {' OR '.join(['tag LIKE ?'] * len(players))}
+        )"""
+        params = ['%' + p + '%' for p in players] + params
         if rank_count == 1:
-            p1_query = ' OR '.join([f"p1.tag LIKE '%{p}%'" for p in players])
-            p2_query = ' OR '.join([f"p2.tag LIKE '%{p}%'" for p in players])
-            rank_query = f'AND (({p1_query}) OR ({p2_query}))'
+            where.append('vod.id IN (SELECT vod_id FROM vod_participant WHERE player_id IN ranked_player)')
         else:
-            p1_query = ' OR '.join([f"p1.tag LIKE '%{p}%'" for p in players])
-            p2_query = ' OR '.join([f"p2.tag LIKE '%{p}%'" for p in players])
-            rank_query = f'AND ({p1_query}) AND ({p2_query})'
-
-    vods = None
-    if c1 != c2:
-        vods = db.cursor().execute("""
-        SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c1.icon_url, c2.name, c2.icon_url, e.name, vod.round, vod.vod_date
-        FROM vod
-            INNER JOIN event e ON e.id = vod.event_id
-            INNER JOIN player p1 ON p1.id = vod.p1_id
-            INNER JOIN player p2 ON p2.id = vod.p2_id
-            INNER JOIN game_character c1 ON c1.id = vod.c1_id
-            INNER JOIN game_character c2 ON c2.id = vod.c2_id
-        WHERE
-            (p1.tag LIKE ? OR p2.tag LIKE ?)
-            AND (p1.tag LIKE ? OR p2.tag LIKE ?)
-            AND (c1.name LIKE ? OR c2.name LIKE ?)
-            AND (c1.name LIKE ? OR c2.name LIKE ?)
-            AND (e.name LIKE ?) """ + rank_query + """
-        ORDER BY vod_date DESC
-        LIMIT ?;
-        """, (p1_match, p1_match, p2_match, p2_match, c1_match, c1_match, c2_match, c2_match, event_match, amount,)).fetchall()
-    else:
-        vods = db.cursor().execute("""
-        SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c1.icon_url, c2.name, c2.icon_url, e.name, vod.round, vod.vod_date
-        FROM vod
-            INNER JOIN event e ON e.id = vod.event_id
-            INNER JOIN player p1 ON p1.id = vod.p1_id
-            INNER JOIN player p2 ON p2.id = vod.p2_id
-            INNER JOIN game_character c1 ON c1.id = vod.c1_id
-            INNER JOIN game_character c2 ON c2.id = vod.c2_id
-        WHERE
-            (p1.tag LIKE ? OR p2.tag LIKE ?)
-            AND (p1.tag LIKE ? OR p2.tag LIKE ?)
-            AND (c1.name LIKE ? AND c2.name LIKE ?)
-            AND (e.name LIKE ?) """ + rank_query + """
-        ORDER BY vod_date DESC
-        LIMIT ?;
-        """, (p1_match, p1_match, p2_match, p2_match, c1_match, c1_match, event_match, amount,)).fetchall()
-
-    result = []
-    for id, url, p1_tag, p2_tag, c1_name, c1_icon_url, c2_name, c2_icon_url, event, round, vod_date in vods:
+            where.append("""vod.id IN (
+                SELECT vod_id FROM vod_participant
+                WHERE player_id IN ranked_player
+                GROUP BY vod_id HAVING COUNT(*) >= 2)""")
+
+    for tag in (p1, p2):
+        if tag:
+            where.append("""vod.id IN (
+                SELECT vp.vod_id FROM vod_participant vp
+                WHERE vp.player_id IN (SELECT id FROM player WHERE tag LIKE ?))""")
+            params.append('%' + tag + '%')
+
+    # Two characters (including mirrors) have to be in different slots.
+    characters = [c for c in (c1, c2) if c]
+    matchup = matchup_key(c1, c2)
+    from_query = 'vod'
+    key_columns = DEFAULT_KEY_COLUMNS
+    swap = '0'
+    if matchup:
+        # vod_matchup is keyed on the unordered character pair, and `flipped`
+        # tells us which way round the VOD is, so rows come back in the same
+        # orientation as the search without any work in Python.
+        char_lo, char_hi, search_is_flipped = matchup
+        from_query = 'vod_matchup m INNER JOIN vod ON vod.id = m.vod_id'
+        key_columns = ('m.vod_ts', 'm.vod_id')
+        swap = f'(m.flipped != {int(search_is_flipped)})'
+        if char_lo == char_hi:
+            # Both sides of a mirror are the searched character, and VODs with
+            # it on the right have always been swapped, so mirrors are too.
+            swap = '1'
+        where.append('m.char_lo = ? AND m.char_hi = ?')
+        params += [char_lo, char_hi]
+    elif len(characters) == 1:
+        where.append("""vod.id IN (
+            SELECT vp.vod_id FROM vod_participant vp
+            WHERE vp.character_id IN (SELECT id FROM game_character WHERE name LIKE ?))""")
+        params.append('%' + characters[0] + '%')
+    elif len(characters) == 2:
+        where.append("""vod.id IN (
+            SELECT a.vod_id FROM vod_participant a
+                INNER JOIN vod_participant b ON b.vod_id = a.vod_id AND b.slot != a.slot
+            WHERE a.character_id IN (SELECT id FROM game_character WHERE name LIKE ?)
+                AND b.character_id IN (SELECT id FROM game_character WHERE name LIKE ?))""")
+        params += ['%' + c1 + '%', '%' + c2 + '%']
+
+    if after is not None:
+        where.append('vod.vod_ts >= ?')
+        params.append(after)
+    if before is not None:
+        where.append('vod.vod_ts < ?')
+        params.append(before)
+
+    if not matchup and c1 and c1 in CHAR_NAME_TO_ID:
         # Make the character order match the search query if it doesn't already.
-        if c2_name.lower() == c1:
-            result.append(Vod(
-                url=url,
-                round=round,
-                p1_tag=p2_tag,
-                p2_tag=p1_tag,
-                c1_icon_url=c2_icon_url,
-                c2_icon_url=c1_icon_url,
-                vod_date=vod_date,
-                event_name=event
-            ))
+        swap = f'(vod.c2_id = {CHAR_NAME_TO_ID[c1]})'
+
+    return {
+        "where": where,
+        "params": params,
+        "with_query": with_query,
+        "from_query": from_query,
+        "key_columns": key_columns,
+        "swap": swap,
+    }
+
+# The columns VOD lists are ordered by (descending), and keyset-paginated on.
+DEFAULT_KEY_COLUMNS = ('vod.vod_ts', 'vod.id')
+
+def vod_select(where, params, with_query='', from_query='vod', key_columns=DEFAULT_KEY_COLUMNS,
+               swap='0', after_key=None):
+    """The SELECT behind query_vods and iter_vods, without a LIMIT. Returns (sql, params).
+
+    `where` is a list of SQL conditions ANDed together. `swap` is a SQL
+    expression that's true for rows that should be shown the other way round
+    (p2 on the left).
+    """
+    ts_column, id_column = key_columns
+    where = list(where) or ['1']
+    params = list(params)
+    if after_key is not None:
+        # Rows without a date sort last.
+        last_ts, last_id = after_key
+        if last_ts is None:
+            where.append(f'({ts_column} IS NULL AND {id_column} < ?)')
+            params.append(last_id)
         else:
-            result.append(Vod(
-                url=url,
-                round=round,
-                p1_tag=p1_tag,
-                p2_tag=p2_tag,
-                c1_icon_url=c1_icon_url,
-                c2_icon_url=c2_icon_url,
-                vod_date=vod_date,
-                event_name=event
-            ))
-    return result
+            where.append(f'(({ts_column}, {id_column}) < (?, ?) OR {ts_column} IS NULL)')
+            params += [last_ts, last_id]
+
+    return with_query + f"""
+    SELECT vod.url, p1.tag, p2.tag, c1.icon_url, c2.icon_url, e.name, vod.round, vod.vod_ts, p3.tag, p4.tag,
+           p1.id, p2.id, e.id, c1.name, c2.name, vod.id, c1.id, c2.id
+    FROM {from_query}
+        INNER JOIN event e ON e.id = vod.event_id
+        INNER JOIN player p1 ON p1.id = CASE WHEN {swap} THEN vod.p2_id ELSE vod.p1_id END
+        INNER JOIN player p2 ON p2.id = CASE WHEN {swap} THEN vod.p1_id ELSE vod.p2_id END
+        INNER JOIN game_character c1 ON c1.id = CASE WHEN {swap} THEN vod.c2_id ELSE vod.c1_id END
+        INNER JOIN game_character c2 ON c2.id = CASE WHEN {swap} THEN vod.c1_id ELSE vod.c2_id END
+        LEFT JOIN player p3 ON p3.id = CASE WHEN {swap} THEN vod.p4_id ELSE vod.p3_id END
+        LEFT JOIN player p4 ON p4.id = CASE WHEN {swap} THEN vod.p3_id ELSE vod.p4_id END
+    WHERE """ + '\n        AND '.join(where) + f"""
+    ORDER BY {ts_column} DESC, {id_column} DESC""", params
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+def vod_from_row(row, patch=None):
+    """Makes a Vod from a vod_select row. Tags, names and icon URLs repeat
+    across rows, so they're interned to keep one copy of each."""
+    (url, p1_tag, p2_tag, c1_icon_url, c2_icon_url, event, round, vod_ts, p3_tag, p4_tag,
+     p1_id, p2_id, event_id, c1_name, c2_name, vod_id, c1_id, c2_id) = row
+    return Vod(
+        url,
+        sys.intern(p1_tag),
+        sys.intern(p2_tag),
+        sys.intern(c1_icon_url),
+        sys.intern(c2_icon_url),
+        sys.intern(event),
+        _intern(round),
+        vod_ts,
+        _intern(p3_tag),
+        _intern(p4_tag),
+        p1_id,
+        p2_id,
+        event_id,
+        sys.intern(c1_name),
+        sys.intern(c2_name),
+        vod_id,
+        c1_id,
+        c2_id,
+        patch.name if patch else None,
+        patch.url if patch else None,
+    )
+
+def vod_rows(where, params, amount=None, offset=0, batch_size=500, **options):
+    """Yields the rows of vod_select (all of them, or `amount` after `offset`),
+    reading `batch_size` at a time from one cursor.
+
+    Memory use doesn't depend on the number of results, but the read
+    transaction stays open until the generator is exhausted or closed.
+    """
+    sql, params = vod_select(where, params, **options)
+    if amount is not None:
+        sql += "\n    LIMIT ? OFFSET ?"
+        params = (*params, amount, offset)
+    cursor = get_db().cursor()
+    try:
+        cursor.execute(sql + ";", params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+def vod_count(where, params, with_query='', from_query='vod', **options):
+    """The number of rows vod_select matches. Only the event is joined, for
+    the event filter; the player and character joins are just for display."""
+    return get_db().cursor().execute(with_query + f"""
+    SELECT COUNT(*)
+    FROM {from_query}
+        INNER JOIN event e ON e.id = vod.event_id
+    WHERE """ + '\n        AND '.join(where or ['1']) + ";", params).fetchone()[0]
+
+@functools.lru_cache(maxsize=4)
+def patch_lookup(patches):
+    """Returns a function from a vod_ts to the Patch that was live then, or None.
+
+    `patches` is the tuple from load_patches, which only changes when
+    data/patches.txt does, so the sorted start times are cached for it.
+    """
+    patches = sorted(patches, key=lambda p: p.date)
+    patch_starts = [int(p.date.timestamp()) for p in patches]
+
+    def lookup(vod_ts):
+        if vod_ts is None:
+            return None
+        i = bisect.bisect_right(patch_starts, vod_ts)
+        return patches[i - 1] if i > 0 else None
+    return lookup
+
+def build_vods(rows, patches=None):
+    """Yields a Vod for each vod_select row, with its patch if `patches` is given."""
+    if not patches:
+        for row in rows:
+            yield vod_from_row(row)
+        return
+    lookup = patch_lookup(tuple(patches))
+    for row in rows:
+        yield vod_from_row(row, lookup(row[7]))
+
+def query_vods(where, params, amount, offset=0, patches=None, **options):
+    """Fetches a page of Vods. See vod_select for the arguments."""
+    return list(build_vods(vod_rows(where, params, amount=amount, offset=offset, **options), patches))
+
+def iter_vods(where, params, batch_size=500, patches=None, **options):
+    """Yields every matching Vod. See vod_rows for how it reads them."""
+    return build_vods(vod_rows(where, params, batch_size=batch_size, **options), patches)
+
+def player_vods(player_id, amount, offset=0, patches=None):
+    """A player's VODs, newest first, with the player on the left."""
+    return query_vods(['vp.player_id = ?'], [player_id], amount, offset, patches,
+                      from_query='vod_participant vp INNER JOIN vod ON vod.id = vp.vod_id',
+                      swap='(vp.slot % 2 = 0)')
+
+def event_vods(event_id, amount, offset=0, patches=None):
+    return query_vods(['vod.event_id = ?'], [event_id], amount, offset, patches)
+
+def patches_between(first_ts, last_ts):
+    """Names of the patches that were live at some point from `first_ts` to `last_ts`, oldest first."""
+    if first_ts is None or last_ts is None:
+        return []
+    return [name for (name,) in get_db().cursor().execute("""
+    SELECT name FROM patch
+    WHERE start_ts <= ?
+        AND start_ts >= COALESCE((SELECT MAX(start_ts) FROM patch WHERE start_ts <= ?), 0)
+    ORDER BY start_ts;
+    """, (last_ts, first_ts)).fetchall()]
+
+def get_player_profile(player_id, num_characters=5):
+    """Summary of a player's VODs from the stat_* tables, or None if there's no such player."""
+    cursor = get_db().cursor()
+    row = cursor.execute("""
+    SELECT p.id, p.tag, COALESCE(s.vods, 0), s.first_ts, s.last_ts
+    FROM player p
+        LEFT JOIN stat_player s ON s.player_id = p.id
+    WHERE p.id = ?;
+    """, (player_id,)).fetchone()
+    if not row:
+        return None
+    id, tag, vods, first_ts, last_ts = row
+
+    characters = cursor.execute("""
+    SELECT c.name, c.icon_url, s.vods
+    FROM stat_player_character s
+        INNER JOIN game_character c ON c.id = s.character_id
+    WHERE s.player_id = ? AND s.vods > 0
+    ORDER BY s.vods DESC
+    LIMIT ?;
+    """, (player_id, num_characters)).fetchall()
+
+    return {
+        "id": id,
+        "name": tag,
+        "vods": vods,
+        "first_seen": format_ts(first_ts),
+        "last_seen": format_ts(last_ts),
+        "characters": [{"name": char_name, "icon_url": icon_url, "vods": count}
+                       for (char_name, icon_url, count) in characters],
+        "patches": patches_between(first_ts, last_ts),
+    }
+
+def get_event_profile(event_id, num_characters=5):
+    """Summary of an event's VODs from the stat_* tables, or None if there's no such event."""
+    cursor = get_db().cursor()
+    row = cursor.execute("""
+    SELECT e.id, e.name, e.vods_url, COALESCE(s.vods, 0), s.first_ts, s.last_ts
+    FROM event e
+        LEFT JOIN stat_event s ON s.event_id = e.id
+    WHERE e.id = ?;
+    """, (event_id,)).fetchone()
+    if not row:
+        return None
+    id, name, vods_url, vods, first_ts, last_ts = row
+
+    characters = cursor.execute("""
+    SELECT c.name, c.icon_url, s.picks
+    FROM stat_event_character s
+        INNER JOIN game_character c ON c.id = s.character_id
+    WHERE s.event_id = ? AND s.picks > 0
+    ORDER BY s.picks DESC
+    LIMIT ?;
+    """, (event_id, num_characters)).fetchall()
+
+    return {
+        "id": id,
+        "name": name,
+        "vods_url": vods_url,
+        "vods": vods,
+        "first_seen": format_ts(first_ts),
+        "last_seen": format_ts(last_ts),
+        "characters": [{"name": char_name, "icon_url": icon_url, "vods": count}
+                       for (char_name, icon_url, count) in characters],
+        "patches": patches_between(first_ts, last_ts),
+    }
+
+def format_ts(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d') if ts is not None else None
 
 def parse_date(str):
     vod_parts = list(str.split('/'))
@@ -281,985 +722,9 @@ def parse_date(str):
 
     return None
 
-# COMMANDS
-
-@click.command('init-db')
-@click.option('--force', '-f', is_flag=True)
-def init_db_command(force):
-    """Clear the existing data and create new tables."""
-    if not force:
-        response = input("This is going to drop the database. Type \"confirm\" to confirm: ")
-        if response != "confirm":
-            print("Aborting.")
-            return
-
-    init_db()
-    click.echo('Initialized the database.')
-
-@click.command('review-submissions')
-def review_submissions_command():
-    db = get_db()
-    submissions = db.cursor().execute("SELECT id,url,p1,c1,p2,c2,round,event,date FROM submission WHERE status = ?;", (NOT_REVIEWED_STATUS,)).fetchall()
-    click.echo(f"{len(submissions)} submissions to review.")
-    # TODO: Support dates.
-    for (id,url,p1,c1,p2,c2,round,event,date_str) in submissions:
-        while True:
-            # Build the info string.
-            def display_info(id, url, p1, c1, p2, c2, event, round, date_str):
-                info = f"ID={id} URL={url}"
-                if p1:
-                    info += f" p1=\"{p1}\""
-                if c1:
-                    info += f" c1=\"{c1}\""
-                if p2:
-                    info += f" p2=\"{p2}\""
-                if c2:
-                    info += f" c2=\"{c2}\""
-                if event:
-                    info += f" event=\"{event}\""
-                if round:
-                    info += f" round=\"{round}\""
-                if date_str:
-                    info += f" date=\"{date_str}\""
-                click.echo(info)
-            display_info(id, url, p1, c1, p2, c2, event, round, date_str)
-            action = input("Approve [A] Edit [E] Skip [S] Reject [R]: ").lower()
-            if action == 'a':
-                event_id = ensure_event(event)
-                p1_id = ensure_player(p1)
-                p2_id = ensure_player(p2)
-                c1_id = get_character_id(c1) or ''
-                c2_id = get_character_id(c2) or ''
-                vod_date = parse_date(date_str) or None
-                db.cursor().execute('UPDATE submission SET status = ? WHERE id = ?;', (APPROVED_STATUS, id,))
-                db.cursor().execute('''
-                                    INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date)
-                                    VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?);''',
-                                    (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date.isoformat() if vod_date else ''))
-                db.commit()
-                break
-            elif action == 'r':
-                db.cursor().execute('UPDATE submission SET status = ? WHERE id = ?;', (REJECTED_STATUS, id,))
-                db.commit()
-                break
-            elif action == 's':
-                break
-            elif action == 'e':
-                url = prompt('URL', url)
-                p1 = prompt('Player 1', p1)
-                c1 = prompt('Char 1', c1)
-                p2 = prompt('Player 2', p2)
-                c2 = prompt('Char 2', c2)
-                event = prompt('Event', event)
-                round = prompt('Round', round)
-
-                date_str = prompt('Date (MM/DD/YY)', date_str)
-                vod_date = parse_date(date_str) or None
-
-                display_info(id, url, p1, c1, p2, c2, event, round, date_str)
-                response = input('Commit this to the database? [y/n] ')
-                if response in ['y', 'yes']:
-                    p1_id = ensure_player(p1)
-                    p2_id = ensure_player(p2)
-                    c1_id = get_character_id(c1)
-                    c2_id = get_character_id(c2)
-                    event_id = ensure_event(event)
-
-                    db.cursor().execute('''
-                        INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date)
-                        VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?);''',
-                        (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date.isoformat() if vod_date else ''))
-                    
-                    db.commit()
-
-                break
-            else:
-                click.echo('Unknown action.')
-
-@click.command('ingest-sheet')
-def ingest_sheet_command():
-
-    # Call Google Sheets Authentication helper to get the sheet object.
-    sheet = get_vods_sheet()
-
-    if not sheet:
-        click.echo('Sheet not found!')
-        return
-
-    all_data = sheet.get_all_values()
-    data_rows = all_data[1:]  # skip header row
-
-    db = get_db()
-    num_vods = 0
-    for row in data_rows:
-        if len(row) < 8:
-            click.echo(f'Skipping malformed row: {row}')
-            continue
-        url, p1, c1, p2, c2, event, round, vod_time = row[:8]
-        if vod_exists(url):
-            # click.echo(f"Skipping existing vod {url}.")
-            continue
-
-        p1_id = ensure_player(p1)
-        p2_id = ensure_player(p2)
-        event_id = ensure_event(event)
-        c1_id = get_character_id(c1)
-        c2_id = get_character_id(c2)
-
-        num_vods += 1
-        db.cursor().execute("""
-                            INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date)
-                            VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?);
-                            """, (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_time,))
-    db.commit()
-
-    # Update the last updated date in the metadata table.
-
-    today = datetime.now().strftime('%Y-%m-%d')
-
-    cursor = db.cursor()
-
-    cursor.execute("""
-    INSERT OR REPLACE INTO metadata (key, value)
-    VALUES (?, ?)
-    """, ("last_updated", today))
-
-    db.commit()
-
-    click.echo(f'Ingested {num_vods} vods from Google Sheets.')
-    return
-
-@click.command('ingest-csv')
-@click.argument('filename', required=False)
-def ingest_csv_command(filename: str | None):
-    import csv
-
-    if filename is None:
-        filename = "./data/vods.csv"
-
-    db = get_db()
-    num_vods = 0
-    with open(filename) as csvfile:
-        for url, p1, c1, p2, c2, event, round, vod_time in csv.reader(csvfile):
-            if vod_exists(url):
-                # click.echo(f"Skipping existing vod {url}.")
-                continue
-
-            p1_id = ensure_player(p1)
-            p2_id = ensure_player(p2)
-            event_id = ensure_event(event)
-            c1_id = get_character_id(c1)
-            c2_id = get_character_id(c2)
-
-            num_vods += 1
-            db.cursor().execute("""
-                              INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_date)
-                              VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,     ?);
-                              """, (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, round, vod_time,))
-    db.commit()
-    click.echo(f"Ingested {num_vods} vods.")
-
-@click.command('ingest-channel')
-@click.argument('channel_id')
-@click.argument('query')
-@click.argument('format')
-def ingest_channel_command(channel_id, query, format):
-    import googleapiclient.discovery
-    import googleapiclient.errors
-    import os
-
-    scopes = ["https://www.googleapis.com/auth/youtube.readonly"]
-
-    # Disable OAuthlib's HTTPS verification when running locally.
-    # *DO NOT* leave this option enabled in production.
-    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
-
-    api_service_name = "youtube"
-    api_version = "v3"
-    api_key = None
-    with open('youtube_api_key') as f:
-        api_key = f.readline().strip()
-
-    youtube = googleapiclient.discovery.build(
-        api_service_name, api_version, developerKey=api_key)
-
-    def get_page(page_token=None):
-        request = youtube.search().list(
-            part="snippet",
-            maxResults=50,
-            channelId=channel_id,
-            q=query,
-            pageToken=page_token
-        )
-        return request.execute()
-
-    format_regex_str = title_query_to_regex_str(format)
-    print(format_regex_str)
-    format_regex = re.compile(format_regex_str)
-
-    db = get_db()
-
-    def ingest_page(page):
-        items = page.get('items')
-        if not items:
-            return []
-        
-        results = []
-        for item in items:
-            # Ignore playlists, just grab videos.
-            if not item.get('id') or not item['id'].get('videoId'):
-                continue
-            video_id = item['id']['videoId']
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            snippet = item['snippet']
-            published_at = snippet['publishedAt']
-            title = snippet['title']
-
-            existing_vod = db.cursor().execute("SELECT id from vod WHERE url = ? LIMIT 1;", (url,)).fetchone()
-            if existing_vod:
-                click.echo(f'ALREADY PRESENT: {title}')
-                continue
-
-            info = parse_vod_title(title, url, format_regex)
-            if not info:
-                click.echo(f'DOES NOT MATCH: {title}')
-                continue
-            if not info.c1_id or not info.c2_id:
-                continue
-
-            result = f'p1={info.p1} c1={info.c1} p2={info.p2} c2={info.c2} event={info.event} round={info.round} vod_date={published_at} url={url}'
-            click.echo(result)
-            results.append(result)
-
-            db.cursor().execute("""
-                              INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, vod_date, round)
-                              VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,        ?);
-                              """, (RIVALS_OF_AETHER_TWO, info.event_id, url, info.p1_id, info.p2_id, info.c1_id, info.c2_id, published_at, info.round,))
-        
-        return results
-
-    
-    page = get_page()
-    results = []
-    results += ingest_page(page)
-    while page.get('nextPageToken'):
-        page = get_page(page['nextPageToken'])
-        results += ingest_page(page)
-    
-    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "0"
-
-    click.echo('\n'.join(results))
-    response = input(f'Are you sure you want to commit {len(results)} VODs? [y/n] ')
-    if response in ['y', 'yes']:
-        db.commit()
-
-        # Update the last updated date in the metadata table.
-        today = datetime.now().strftime('%Y-%m-%d')
-
-        cursor = db.cursor()
-
-        cursor.execute("""
-        INSERT OR REPLACE INTO metadata (key, value)
-        VALUES (?, ?)
-        """, ("last_updated", today))
-
-        db.commit()
-
-    else:
-        click.echo('Aborting.')
-        return
-
-@click.command('ingest-playlist')
-@click.argument('playlist_url')
-@click.argument('event_name')
-@click.argument('format_str')
-def ingest_playlist_command(playlist_url, event_name, format_str):
-    import googleapiclient.discovery
-    import googleapiclient.errors
-    import re
-    from urllib.parse import urlparse, parse_qs
-
-    format_regex = re.compile(title_query_to_regex_str(format_str))
-
-    api_service_name = "youtube"
-    api_version = "v3"
-    api_key = None
-    with open('youtube_api_key') as f:
-        api_key = f.readline().strip()
-
-    youtube = googleapiclient.discovery.build(
-        api_service_name, api_version, developerKey=api_key
-    )
-
-    # get playlist ID
-    query = parse_qs(urlparse(playlist_url).query)
-    playlist_id = query.get("list", [None])[0]
-    if not playlist_id:
-        click.echo("Invalid playlist URL")
-        return
-
-    db = get_db()
-
-    def get_page(page_token=None):
-        request = youtube.playlistItems().list(
-            part="snippet",
-            maxResults=50,
-            playlistId=playlist_id,
-            pageToken=page_token
-        )
-        return request.execute()
-
-    def ingest_page(page):
-        items = page.get('items')
-        if not items:
-            return []
-
-        results = []
-        for item in items:
-            snippet = item['snippet']
-            video_id = snippet['resourceId']['videoId']
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            published_at = snippet['publishedAt']
-            title = snippet['title']
-
-            existing_vod = db.cursor().execute(
-                "SELECT id FROM vod WHERE url = ? LIMIT 1;", (url,)
-            ).fetchone()
-            if existing_vod:
-                click.echo(f'ALREADY PRESENT: {title}')
-                continue
-
-            info = parse_vod_title(title, url, format_regex, event_name)
-            if not info:
-                click.echo(f'DOES NOT MATCH: {title}')
-                continue
-
-            if not info.c1_id or not info.c2_id:
-                continue
-                
-            result = f'INGESTED: {info.p1} ({info.c1}) vs {info.p2} ({info.c2}) - {info.round} [{published_at}]'
-            click.echo(result)
-            results.append(result)
-
-            db.cursor().execute("""
-                INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, vod_date, round)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
-            """, (RIVALS_OF_AETHER_TWO, info.event_id, url, info.p1_id, info.p2_id, info.c1_id, info.c2_id, published_at, info.round,))
-
-        return results
-
-    page = get_page()
-    results = []
-    results += ingest_page(page)
-    while page.get('nextPageToken'):
-        page = get_page(page['nextPageToken'])
-        results += ingest_page(page)
-
-    click.echo(f'\nTotal VODs ready to commit: {len(results)}')
-    response = input(f'Are you sure you want to commit {len(results)} VODs? [y/n] ')
-    if response.lower() in ['y', 'yes']:
-        db.commit()
-
-        # Update the last updated date in the metadata table.
-        today = datetime.now().strftime('%Y-%m-%d')
-
-        cursor = db.cursor()
-
-        cursor.execute("""
-        INSERT OR REPLACE INTO metadata (key, value)
-        VALUES (?, ?)
-        """, ("last_updated", today))
-
-        db.commit()
-
-        click.echo('Committed successfully!')
-    else:
-        click.echo('Aborting.')
-
-@click.command('export-csv')
-@click.argument('filename', required=False)
-def export_vods_command(filename: str | None):
-    import csv
-
-    if filename is None:
-        filename = "./data/vods.csv"
-
-    db = get_db()
-    vods = db.cursor().execute("""
-    SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c2.name, e.name, vod.round, vod.vod_date
-    FROM vod
-        INNER JOIN event e ON e.id = vod.event_id
-        INNER JOIN player p1 ON p1.id = vod.p1_id
-        INNER JOIN player p2 ON p2.id = vod.p2_id
-        INNER JOIN game_character c1 ON c1.id = vod.c1_id
-        INNER JOIN game_character c2 ON c2.id = vod.c2_id
-    ORDER BY vod_date ASC
-    """, ()).fetchall()
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-        vod_writer = csv.writer(csvfile)
-        for id, url, p1_tag, p2_tag, c1_name, c2_name, event_name, round, vod_date in vods:
-            row = [url, p1_tag, c1_name, p2_tag, c2_name, event_name, round if round else '', vod_date if vod_date else '']
-            vod_writer.writerow(row)
-
-@click.command('export-sheet')
-def export_sheet_command():
-
-    db = get_db()
-    vods = db.cursor().execute("""
-    SELECT vod.id, vod.url, p1.tag, p2.tag, c1.name, c2.name, e.name, vod.round, vod.vod_date
-    FROM vod
-        INNER JOIN event e ON e.id = vod.event_id
-        INNER JOIN player p1 ON p1.id = vod.p1_id
-        INNER JOIN player p2 ON p2.id = vod.p2_id
-        INNER JOIN game_character c1 ON c1.id = vod.c1_id
-        INNER JOIN game_character c2 ON c2.id = vod.c2_id
-    ORDER BY vod_date ASC
-    """, ()).fetchall()
-
-    # Call Google Sheets Authentication helper to get the sheet object.
-
-    sheet = get_vods_sheet()
-
-    if not sheet:
-        click.echo('Sheet not found!')
-        return
-    
-    rows= sheet.get_all_values()
-    
-    # Build the data rows
-    data_rows = []
-    for id, url, p1_tag, p2_tag, c1_name, c2_name, event_name, round, vod_date in vods:
-        # Convert datetime to string if needed
-        if isinstance(vod_date, datetime):
-            vod_date_str = vod_date.isoformat()
-        else:
-            vod_date_str = str(vod_date) if vod_date else ''
-        
-        row = [str(url), str(p1_tag), str(c1_name), str(p2_tag), str(c2_name), str(event_name), str(round) if round else '', vod_date_str]
-        data_rows.append(row)
-    
-    try:
-        # Clear all cells except the header (row 1)
-        click.echo('Clearing existing data from Google Sheet...')
-        current_values = sheet.get_all_values()
-        
-        if len(current_values) > 1:
-            # Clear rows 2 onwards
-            sheet.batch_clear([f'A2:H{len(current_values)}'])
-        
-        # Append the data to the sheet
-        if len(data_rows) > 0:
-            sheet.append_rows(data_rows, value_input_option='RAW')
-        
-        click.echo(f'Exported {len(data_rows)} VODs to Google Sheet')
-    except Exception as e:
-        click.echo(f'Error updating Google Sheet: {e}')
-
-@click.command('extract-vods')
-@click.argument('vod_url')
-@click.argument('event')
-def extract_vods_v1_command(vod_url, event):
-    """Analyzes a vod for player names and characters.
-
-    This is an MVP implementation that requires a Gemini API key.
-    
-    Example:
-    
-        flask extract-vods "https://www.youtube.com/watch?v=gWtNu_6hoDY" "Wasteland Warriors #22"
-    """
-    from google import genai
-    import googleapiclient.discovery
-    import googleapiclient.errors
-    import time
-    import json
-
-    print("Fetching the video publish date...")
-    yt_api_service_name = "youtube"
-    yt_api_version = "v3"
-    yt_api_key = None
-    with open('youtube_api_key') as f:
-        yt_api_key = f.readline().strip()
-    youtube = googleapiclient.discovery.build(
-        yt_api_service_name, yt_api_version, developerKey=yt_api_key
-    )
-    yt_request = youtube.videos().list(
-        part="snippet,contentDetails,statistics",
-        id=vod_url.split('?v=')[1]
-    )
-    yt_response = yt_request.execute()
-    vod_date = yt_response.get('items')[0].get('snippet').get('publishedAt')
-    duration_iso = yt_response.get('items')[0].get('contentDetails').get('duration')
-    duration = parse_iso8601_duration(duration_iso)
-
-    # Common bad readings that we have to tell the model to watch out for.
-    # TODO: Unused right now because my logic for inserting it breaks with
-    # Python 3.10 (which is what PythonAnywhere uses).
-    #   File "/home/akbiggs/mysite/db.py", line 700
-    #    Some common player tag errors and their corrections: [{','.join(f'\'{k}\' -> \'{v}\'' for k, v in BAD_READINGS.items())}]""")
-    #      SyntaxError: f-string expression part cannot include a backslash
-    BAD_READINGS = {
-        'Cpuo': 'CPU0',
-        'Sawstepp': 'Sawstep',
-    }
-
-    # If you try to run a video that is too long through Gemini's API, the API
-    # call will fail with an internal error with no additional details.
-    # To work around this, we split the analysis into multiple Gemini API calls
-    # if it exceeds MAX_DURATION_SECONDS_PER_REQUEST.
-    MAX_DURATION_SECONDS_PER_REQUEST = 3200
-    num_genai_calls = math.ceil(duration.total_seconds() / MAX_DURATION_SECONDS_PER_REQUEST) # TODO: cleanup
-    if num_genai_calls > 1:
-        print(f'Splitting the analysis into {num_genai_calls} Gemini API calls.')
-
-    def analyze_chunk(n, matches, start_seconds, end_seconds):
-        start = time.time()
-
-        genai_client = None
-        with open('gemini_api_key') as f:
-            api_key = f.readline().strip()
-            genai_client = genai.Client(api_key=api_key)
-
-        # Sometimes during later API calls, Gemini seems to lose track of what
-        # the timestamp should be and reports super early timestamps, screwing
-        # things up. So for any chunk after the first chunk, we show it some of
-        # the existing response that it is adding to, so it hopefully remains
-        # more consistent from call to call.
-        prelude = ""
-        if n > 0:
-            prelude = f"""You are in the middle of a Gemini video analysis to find timestamps where matches begin in a competitive tournament video. Previous Gemini API calls have found some earlier matches.
-            
-You are analyzing the range {start_seconds} to {end_seconds}, while the previous Gemini API call analyzed the range {start_seconds - MAX_DURATION_SECONDS_PER_REQUEST} to {end_seconds - MAX_DURATION_SECONDS_PER_REQUEST}. The timestamps you return should fall within your designated analysis range.
-
-If it helps improve the analysis, I've noticed from running these prompts on you many times that your analysis is very accurate for earlier timestamps (in fact it is usually pinpoint precise for the first match) and wildly inaccurate with later timestamps (for example the timestamp starts in the middle of the wrong match instead of the beginning of the right match). I'm not sure if that gives you a clue to improve your accuracy. I am looking for accuracy over speed here.
-
-The results from the previous API calls follow. Your timestamps should not be lower than the last result's timestamp. Bad timestamps have been a frequent bug when I prompt you without this context.
-
-```
-{matches}
-```
-
-The rest of this prompt is the original prompt for the first Gemini API call for this tournament, which you should follow.
-
-"""
-
-        response = genai_client.models.generate_content(
-            model='models/gemini-2.5-pro',
-            contents=genai.types.Content(
-                parts=[
-                    genai.types.Part(
-                        file_data=genai.types.FileData(file_uri=vod_url),
-                        video_metadata=genai.types.VideoMetadata(
-                            start_offset=f'{start_seconds}s',
-                            end_offset=f'{end_seconds}s',
-                            fps=0.005,
-                        )
-                    ),
-                    genai.types.Part(text=prelude + f"""Whenever a new match begins in the video, tell me the tags of the players that are playing in this match, what round it is and what characters they are playing, and the playback time when the match began.
-
-There are several factors that indicate that a match has begun. All of these criteria must be met:
-
-- The game count reads 0 for both players.
-- The percentage count reads 0 for both players.
-- At least one of the player names has changed recently.
-
-The player tags and round name are located at the top of the video.
-Player tags and round names should be formatted as proper names (not all-caps).
-Sometimes player tags will start with a different colored word. This is a sponsor title and it should be omitted from the player tag.
-The character names are located at the bottom of the video. The character names are on the same side as the respective player names.
-The YouTube playback time must be in seconds.
-""")
-                ]
-            ),
-            # I tried for a while to get Gemini to consistently give me back structured text just using my
-            # prompt, but it kept inserting backticks and dashes and other annoying things.
-            # After a while I gave up, so here I require a JSON schema for the output that looks like:
-            # [ { time, p1, p2, c1, c2, round (optional) } ]
-            config=genai.types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema={
-                    'type': 'ARRAY',
-                    'items': {
-                        'type': 'OBJECT',
-                        'properties': {
-                            'time': {'type': 'INTEGER', 'format': 'int32'},
-                            'player1': {'type': 'STRING'},
-                            'player2': {'type': 'STRING'},
-                            'character1': {'type': 'STRING'},
-                            'character2': {'type': 'STRING'},
-                            'round': {'type': 'STRING'},
-                        },
-                        'required': ['time', 'player1', 'player2', 'character1', 'character2']
-                    }
-                }
-            )
-        )
-
-        print(f'Finished Gemini call in {(time.time() - start):.2f} seconds.')
-        print(response.text)
-        return json.loads(response.text)
-
-    matches = []
-    # Uncomment these lines (and comment out the for-loop below) to test with a
-    # specific time range. This is useful for testing changes quickly and with
-    # less API quota, as analyzing a full event vod uses a significant number of
-    # tokens and takes a while.
-    # print("Analyzing the video for matches using Gemini. This usually takes a few minutes...")
-    # matches = analyze_chunk(0, 1200)
-    for n in range(0, num_genai_calls):
-        print(f'Call {n+1}/{num_genai_calls}: Calling Gemini to analyze the video. This usually takes a few minutes...')
-        matches += analyze_chunk(
-            n=n,
-            matches=matches,
-            start_seconds=n * MAX_DURATION_SECONDS_PER_REQUEST,
-            end_seconds=min(duration.total_seconds(), (n+1) * MAX_DURATION_SECONDS_PER_REQUEST))
-    
-    # Parse the Gemini response into individual vods.
-    db = get_db()
-    results = []
-    seen_sets = [] # [(p1, p2, round)]
-    matches.sort(key=lambda x: x.get('time'))
-    print('Debugging all matches...')
-    print(matches)
-    for match in matches:
-        t = match.get('time')
-        url = vod_url + f"&t={t}"
-
-        existing_vod = db.cursor().execute("SELECT id from vod WHERE url = ? LIMIT 1;", (url,)).fetchone()
-        if existing_vod:
-            click.echo(f'ALREADY PRESENT: {match}')
-            continue
-
-        if not match.get('character1') or not match.get('character2') or not match.get('player1') or not match.get('player2'):
-            click.echo(f'MISSING DATA: {match}')
-            continue
-
-        p1 = match['player1']
-        c1 = match['character1']
-        p2 = match['player2']
-        c2 = match['character2']
-        round = match.get('round')
-
-        result = f'p1={p1} c1={c1} p2={p2} c2={c2} event={event} round={round} vod_date={vod_date} url={url}'
-        # A vod starts on the first game of the set, i.e. don't add matches that have the same players and round name.
-        # This is only necessary because I can't get Gemini to omit later matches in a set in its response.
-        already_added = any(p1 == seen_p1 and p2 == seen_p2 and round == seen_round for (seen_p1, seen_p2, seen_round) in seen_sets)
-        if already_added:
-            continue
-        seen_sets.append((p1, p2, round))
-
-        click.echo(result)
-        results.append(result)
-
-        event_id = ensure_event(event)
-        p1_id = ensure_player(p1)
-        p2_id = ensure_player(p2)
-        c1_id = get_character_id(c1)
-        c2_id = get_character_id(c2)
-
-        if not c1_id or not c2_id:
-            continue     
-
-        db.cursor().execute("""
-                            INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, vod_date, round)
-                            VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,        ?);
-                            """, (RIVALS_OF_AETHER_TWO, event_id, url, p1_id, p2_id, c1_id, c2_id, vod_date, round,))
-
-    response = input(f'Are you sure you want to commit {len(results)} VODs? [y/n] ')
-    if response.lower() in ['y', 'yes']:
-        db.commit()
-        click.echo('Committed successfully!')
-    else:
-        click.echo('Aborting.')
-
-@click.command('ingest-multi-vod')
-@click.argument('multi_vod_url')
-@click.argument('event')
-@click.argument('title_format')
-@click.argument('datetime_str')
-@click.argument('filename')
-def ingest_multi_vod_command(multi_vod_url, event, datetime_str, title_format, filename):
-    """Splits a single VOD into multiple VODs from a description file.
-    
-    Example:
-
-        flask ingest-multi-vod "https://www.youtube.com/watch?v=blah" "CEO 2025" "%P1 (%C1) %V %P2 (%C2)" "2025-06-17 21:33:44+00:00" description.txt
-
-    where description.txt is lines in the format:
-
-        00:00 Alex (Zetterburn) vs. Bob (Olympia)
-        43:20 Cynthia (Wrastor) vs. Dylan (Forsburn)
-    """
-    results = []
-    with open(filename, 'r') as f:
-        db = get_db()
-
-        format_regex_str = title_query_to_regex_str(title_format)
-        format_regex = re.compile(format_regex_str)
-
-        for line in f.readlines():
-            line = line.strip()
-            line_parts = line.split(' ')
-            timestamp, title = line_parts[0], ' '.join(line_parts[1:])
-            timestamp_parts = timestamp.split(':')
-            time = 0
-            if len(timestamp_parts) == 1:
-                time = int(timestamp_parts[0])
-            elif len(timestamp_parts) == 2:
-                time = int(timestamp_parts[0]) * 60 + int(timestamp_parts[1])
-            elif len(timestamp_parts) == 3:
-                time = int(timestamp_parts[0]) * 3600 + int(timestamp_parts[1]) * 60 + int(timestamp_parts[2])
-            else:
-                click.echo(f'UNKNOWN TIMESTAMP FORMAT: {timestamp}.')
-            
-            url = multi_vod_url + f"&t={time}"
-
-            existing_vod = db.cursor().execute("SELECT id from vod WHERE url = ? LIMIT 1;", (url,)).fetchone()
-            if existing_vod:
-                click.echo(f'ALREADY PRESENT: {title}')
-                continue            
-
-            info = parse_vod_title(title, url, format_regex, default_event_name=event)
-            if not info:
-                click.echo(f'DOES NOT MATCH: {title}')
-                continue
-            if not info.c1_id or not info.c2_id:
-                continue
-
-            result = f'p1={info.p1} c1={info.c1} p2={info.p2} c2={info.c2} event={info.event} round={info.round} vod_date={datetime_str} url={url}'
-            results.append(result)
-
-            db.cursor().execute("""
-                              INSERT INTO vod (game_id, event_id, url, p1_id, p2_id, c1_id, c2_id, vod_date, round)
-                              VALUES          (?,       ?,        ?,   ?,     ?,     ?,     ?,     ?,        ?);
-                              """, (RIVALS_OF_AETHER_TWO, info.event_id, url, info.p1_id, info.p2_id, info.c1_id, info.c2_id, datetime_str, info.round,))
-
-    click.echo('\n'.join(results))
-    response = input(f'Are you sure you want to commit {len(results)} VODs? [y/n] ')
-    if response in ['y', 'yes']:
-        db.commit()
-
-        # Update the last updated date in the metadata table.
-        today = datetime.now().strftime('%Y-%m-%d')
-
-        cursor = get_db().cursor()
-
-        cursor.execute("""
-        INSERT OR REPLACE INTO metadata (key, value)
-        VALUES (?, ?)
-        """, ("last_updated", today))
-
-        get_db().commit()
-
-        click.echo('Committed successfully!')
-    else:
-        click.echo('Aborting.')
-        return
-
-def title_query_to_regex_str(query):
-    """Converts queries like "%P1 (%C1) %V %P2 (%C2)" into a regex str."""
-    return (re.escape(query)
-                    .replace('%SIDE', r'(([\s*W\s*])|([\s*L\s*]))')
-                    .replace('%E', r'(?P<event>[\w\s\+\-#&;:@\'\(\)\.\,~/~]+)')
-                    .replace('%P1', r'(?P<p1>[\s*\w\$|&;:~!?#.@\-\+]+)')
-                    .replace('%P2', r'(?P<p2>[\s*\w\$|&;:~!?#.@\-\+]+)')
-                    .replace('%C1', r'(?P<c1>[\s*\w/*,*]+)')
-                    .replace('%C2', r'(?P<c2>[\s*\w/*,*]+)')
-                    .replace('%V', '((vs.)|(vs)|(Vs.)|(VS.)|(Vs)|(VS))')
-                    .replace('%ROA', '((RoA2)|(ROA2)|(RoA 2)|(ROA 2)|(RoAII)|(ROAII)|(Rivals II)|(RIVALS 2)|(RIVALS II)|(RIVALS OF AETHER 2)|(RIVALS OF AETHER II)|(Rivals 2)|(Rivals of Aether 2)|(Rivals 2 Tournament)|(Rivals of Aether II)|(Rivals II Bracket)|(Rivals 2 Bracket))?')
-                    .replace('%R', r'(?P<round>[\s*\(*\s*\w\-#&;\)*]+)'))
-
-def parse_vod_title(title, url, format_regex, default_event_name="Unknown"):
-    info = format_regex.match(title.strip())
-    if not info:
-        return None
-    
-    p1 = info.group('p1')
-    p2 = info.group('p2')
-
-    c1 = None
-    if info.groupdict().get('c1'):
-        c1 = info.group('c1').lower().split(',')[0].split('/')[0].replace('P1 ', '').replace('P2 ', '')
-    else:
-        c1 = prompt(f"c1 for {url}")
-    c2 = None
-    if info.groupdict().get('c2'):
-        c2 = info.group('c2').lower().split(',')[0].split('/')[0].replace('P1 ', '').replace('P2 ', '')
-    else:
-        c2 = prompt(f"c2 for {url}")
-    event = info.groupdict().get('event') or default_event_name
-    round = info.groupdict().get('round') or ''
-
-    # TODO: Parse round name info.
-    event_id = ensure_event(event)
-    p1_id = ensure_player(p1)
-    p2_id = ensure_player(p2)
-    c1_id = get_character_id(c1)
-    c2_id = get_character_id(c2)
-
-    return ParsedVodTitle(
-        p1=p1,
-        p1_id=p1_id,
-        p2=p2,
-        p2_id=p2_id,
-        c1=c1,
-        c1_id=c1_id,
-        c2=c2,
-        c2_id=c2_id,
-        event=event,
-        event_id=event_id,
-        round=round
-    )
-
 def load_patches():
-    patches = []
-    with open('data/patches.txt') as f:
-        lines = f.readlines()
-        for line in lines:
-            line = line.strip()
-            if line.startswith('#'):
-                continue
-            name, date, url = line.split(',')
-            patches.append(Patch(
-                name=name,
-                date=datetime.strptime(date, "%m/%d/%y").astimezone(timezone.utc),
-                url=url))
-
-    return patches
-
-def patch_vods(vods, patches):
-    patched_vods = []
-    
-    # Organize patches by date (descending).
-    patches.sort(key=lambda p: p.date, reverse=True)
-
-    for vod in vods:
-        found_patch = None
-        for patch in patches:
-            if vod.vod_date >= patch.date:
-                found_patch = patch
-                break
-        patched_vods.append(VodAndPatch(
-            url=vod.url,
-            round=vod.round,
-            p1_tag=vod.p1_tag,
-            p2_tag=vod.p2_tag,
-            c1_icon_url=vod.c1_icon_url,
-            c2_icon_url=vod.c2_icon_url,
-            vod_date=vod.vod_date,
-            event_name=vod.event_name,
-            patch_name=found_patch.name if found_patch else None,
-            patch_url=found_patch.url if found_patch else None
-        ))
-    
-    return patched_vods
-
-# Thanks to https://stackoverflow.com/a/77332099.
-def parse_iso8601_duration(duration: str) -> timedelta:    
-    pattern = r"^P(?:(?P<days>\d+\.\d+|\d*?)D)?T?(?:(?P<hours>\d+\.\d+|\d*?)H)?(?:(?P<minutes>\d+\.\d+|\d*?)M)?(?:(?P<seconds>\d+\.\d+|\d*?)S)?$"
-    match = re.match(pattern, duration)
-    if not match:
-        raise ValueError(f"Invalid ISO 8601 duration: {duration}")
-    parts = {k: float(v) for k, v in match.groupdict("0").items()}
-    return timedelta(**parts)
-
-def prompt(text, default=None):
-    value = input(f'{text} ' + (f'[{default}]' if default else '') + ': ')
-    return value if value else default
-    
-# # Google Sheets Stuff
-
-# @click.command('pull-sheet')
-# def pull_sheet_command():
-#     """Pull data from the Google Sheet and update vods.csv"""
-#     import gspread
-#     from google.oauth2.service_account import Credentials
-#     import csv
-#     import os
-
-#     # Authenticate w/ Google Sheets
-#     scope = ['https://www.googleapis.com/auth/spreadsheets']
-#     credentials = Credentials.from_service_account_file('google_service_account.json', scopes=scope)
-#     client = gspread.authorize(credentials)
-
-#     sheet_id = '1RRblTHe9hmlQDmOw05dglEXmnuH0fcB7f-ZqHjBOyT4'
-#     sheet = client.open_by_key(sheet_id).worksheet('vods')
-    
-#     # Get data from the sheet
-#     all_values = sheet.get_all_values()
-#     if not all_values:
-#         click.echo('Sheet is empty!')
-#         return
-    
-#     # Skip header row
-#     data_rows = all_values[1:]
-    
-#     # Write to vods.csv
-#     csv_path = './data/vods.csv'
-#     try:
-#         with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-#             writer = csv.writer(csvfile)
-#             for row in data_rows:
-#                 # Only write non-empty rows
-#                 if any(row):
-#                     writer.writerow(row)
-        
-#         click.echo(f'Successfully synced {len(data_rows)} rows from Google Sheet to {csv_path}')
-#     except Exception as e:
-#         click.echo(f'Error writing to CSV: {e}')
-
-# @click.command('push-sheet')
-# def push_sheet_command():
-#     """Push vods.csv data to Google Sheet"""
-#     import gspread
-#     from google.oauth2.service_account import Credentials
-#     import csv
-    
-#     # Read vods.csv
-#     csv_path = './data/vods.csv'
-#     try:
-#         with open(csv_path, 'r', encoding='utf-8') as csvfile:
-#             reader = csv.reader(csvfile)
-#             csv_data = list(reader)
-#     except FileNotFoundError:
-#         click.echo(f'Error: {csv_path} not found!')
-#         return
-#     except Exception as e:
-#         click.echo(f'Error reading CSV: {e}')
-#         return
-    
-#     if not csv_data:
-#         click.echo('CSV is empty!')
-#         return
-    
-#     # Authenticate with Google Sheets
-#     scope = ['https://www.googleapis.com/auth/spreadsheets']
-#     creds = Credentials.from_service_account_file('google_service_account.json', scopes=scope)
-#     client = gspread.authorize(creds)
-    
-#     # Open the sheet
-#     sheet_id = '1RRblTHe9hmlQDmOw05dglEXmnuH0fcB7f-ZqHjBOyT4'
-#     try:
-#         sheet = client.open_by_key(sheet_id).worksheet('vods')
-#     except Exception as e:
-#         click.echo(f'Error opening sheet: {e}')
-#         return
-    
-#     try:
-#         # Clear all cells except the header (row 1)
-#         # Get current data to see how many rows we need to clear
-#         current_values = sheet.get_all_values()
-        
-#         if len(current_values) > 1:
-#             # Clear rows 2 onwards using batch_clear instead of delete_rows
-#             sheet.batch_clear([f'A2:H{len(current_values)}'])
-        
-#         # Append the CSV data
-#         if len(csv_data) > 0:
-#             sheet.append_rows(csv_data, value_input_option='RAW')
-        
-#         click.echo(f'Successfully synced {len(csv_data)} rows from {csv_path} to Google Sheet')
-#     except Exception as e:
-#         click.echo(f'Error updating sheet: {e}')
+    """The patches in data/patches.txt, newest first. Parsed once and reloaded when the file changes."""
+    return reference_data.get('patches')
 
 sqlite3.register_converter(
     "timestamp", lambda v: datetime.fromisoformat(v.decode().replace('Z', '+00:00'))
@@ -1267,15 +732,4 @@ sqlite3.register_converter(
 
 def init_app(app):
     app.teardown_appcontext(close_db)
-    app.cli.add_command(init_db_command)
-    app.cli.add_command(review_submissions_command)
-    app.cli.add_command(ingest_channel_command)
-    app.cli.add_command(ingest_csv_command)
-    app.cli.add_command(export_vods_command)
-    app.cli.add_command(ingest_sheet_command)
-    app.cli.add_command(export_sheet_command)
-    app.cli.add_command(ingest_multi_vod_command)
-    app.cli.add_command(ingest_playlist_command)
-    app.cli.add_command(extract_vods_v1_command)
-    # app.cli.add_command(pull_sheet_command)
-    # app.cli.add_command(push_sheet_command)
\ No newline at end of file
+    cli.init_app(app)
@@ -0,0 +1,7 @@
+"""Indexes for looking up VODs by URL and players and events by name."""
+
+
+def upgrade(m):
+    m.create_index('idx_vod_url', 'vod (url)')
+    m.create_index('idx_player_tag', 'player (tag)')
+    m.create_index('idx_event_name', 'event (name)')
@@ -0,0 +1,27 @@
+"""ingest_staging: VODs found by the ingest commands, waiting to be promoted into vod."""
+
+
+def upgrade(m):
+    m.script("""
+    CREATE TABLE IF NOT EXISTS ingest_staging (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        confidence REAL NOT NULL,
+        title TEXT,
+        url TEXT NOT NULL,
+        p1 TEXT NOT NULL,
+        c1_id INTEGER NOT NULL,
+        p2 TEXT NOT NULL,
+        c2_id INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        round TEXT,
+        vod_date TEXT,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (c1_id) REFERENCES game_character (id),
+        FOREIGN KEY (c2_id) REFERENCES game_character (id)
+    );
+    """)
+    m.create_index('idx_ingest_staging_batch', 'ingest_staging (batch_id, status)')
+    m.create_index('idx_ingest_staging_url', 'ingest_staging (url)')
@@ -0,0 +1,11 @@
+"""vod.vod_ts: vod_date normalized to a UTC epoch, for ordering and filtering."""
+
+
+def upgrade(m):
+    m.add_column('vod', 'vod_ts', 'INTEGER')
+    m.backfill('vod.vod_ts', """
+    UPDATE vod SET vod_ts = vod_epoch(vod_date)
+    WHERE id BETWEEN :first AND :last AND vod_ts IS NULL;
+    """)
+    # After the backfill, so it isn't updated row by row.
+    m.create_index('idx_vod_ts', 'vod (vod_ts)')
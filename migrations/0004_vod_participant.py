@@ -0,0 +1,61 @@
+"""vod_participant: one row per player in a VOD, for indexed any-slot searches.
+
+Kept up to date by triggers on vod; existing VODs are backfilled.
+"""
+
+
+def upgrade(m):
+    m.script("""
+    CREATE TABLE IF NOT EXISTS vod_participant (
+      vod_id INTEGER NOT NULL,
+      slot INTEGER NOT NULL,
+      player_id INTEGER NOT NULL,
+      character_id INTEGER,
+      PRIMARY KEY (vod_id, slot),
+      FOREIGN KEY (vod_id) REFERENCES vod (id),
+      FOREIGN KEY (player_id) REFERENCES player (id),
+      FOREIGN KEY (character_id) REFERENCES game_character (id)
+    );
+
+    DROP TRIGGER IF EXISTS vod_participant_insert;
+    CREATE TRIGGER vod_participant_insert AFTER INSERT ON vod BEGIN
+      INSERT INTO vod_participant (vod_id, slot, player_id, character_id)
+      SELECT NEW.id, slot, player_id, character_id FROM (
+        SELECT 1 AS slot, NEW.p1_id AS player_id, NEW.c1_id AS character_id
+        UNION ALL SELECT 2, NEW.p2_id, NEW.c2_id
+        UNION ALL SELECT 3, NEW.p3_id, NEW.c3_id
+        UNION ALL SELECT 4, NEW.p4_id, NEW.c4_id
+      )
+      WHERE player_id IS NOT NULL;
+    END;
+
+    DROP TRIGGER IF EXISTS vod_participant_update;
+    CREATE TRIGGER vod_participant_update AFTER UPDATE OF p1_id, c1_id, p2_id, c2_id, p3_id, c3_id, p4_id, c4_id ON vod BEGIN
+      DELETE FROM vod_participant WHERE vod_id = OLD.id;
+      INSERT INTO vod_participant (vod_id, slot, player_id, character_id)
+      SELECT NEW.id, slot, player_id, character_id FROM (
+        SELECT 1 AS slot, NEW.p1_id AS player_id, NEW.c1_id AS character_id
+        UNION ALL SELECT 2, NEW.p2_id, NEW.c2_id
+        UNION ALL SELECT 3, NEW.p3_id, NEW.c3_id
+        UNION ALL SELECT 4, NEW.p4_id, NEW.c4_id
+      )
+      WHERE player_id IS NOT NULL;
+    END;
+
+    DROP TRIGGER IF EXISTS vod_participant_delete;
+    CREATE TRIGGER vod_participant_delete AFTER DELETE ON vod BEGIN
+      DELETE FROM vod_participant WHERE vod_id = OLD.id;
+    END;
+    """)
+    m.backfill('vod_participant', """
+    INSERT OR IGNORE INTO vod_participant (vod_id, slot, player_id, character_id)
+    SELECT id, slot, player_id, character_id FROM (
+        SELECT id, 1 AS slot, p1_id AS player_id, c1_id AS character_id FROM vod WHERE id BETWEEN :first AND :last
+        UNION ALL SELECT id, 2, p2_id, c2_id FROM vod WHERE id BETWEEN :first AND :last
+        UNION ALL SELECT id, 3, p3_id, c3_id FROM vod WHERE id BETWEEN :first AND :last
+        UNION ALL SELECT id, 4, p4_id, c4_id FROM vod WHERE id BETWEEN :first AND :last
+    )
+    WHERE player_id IS NOT NULL;
+    """)
+    m.create_index('idx_vod_participant_player', 'vod_participant (player_id, vod_id)')
+    m.create_index('idx_vod_participant_character', 'vod_participant (character_id, vod_id)')
@@ -0,0 +1,67 @@
+"""vod_matchup and matchup_count: VODs keyed on their unordered character
+pair, and the number of VODs per pair, for matchup searches.
+
+Kept up to date by triggers on vod; existing VODs are backfilled and the
+counts recomputed.
+"""
+
+
+def upgrade(m):
+    m.script("""
+    CREATE TABLE IF NOT EXISTS vod_matchup (
+      vod_id INTEGER PRIMARY KEY,
+      char_lo INTEGER NOT NULL,
+      char_hi INTEGER NOT NULL,
+      vod_ts INTEGER,
+      flipped INTEGER NOT NULL,
+      FOREIGN KEY (vod_id) REFERENCES vod (id),
+      FOREIGN KEY (char_lo) REFERENCES game_character (id),
+      FOREIGN KEY (char_hi) REFERENCES game_character (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS matchup_count (
+      char_lo INTEGER NOT NULL,
+      char_hi INTEGER NOT NULL,
+      vods INTEGER NOT NULL,
+      PRIMARY KEY (char_lo, char_hi)
+    );
+
+    DROP TRIGGER IF EXISTS vod_matchup_insert;
+    CREATE TRIGGER vod_matchup_insert AFTER INSERT ON vod BEGIN
+      INSERT INTO vod_matchup (vod_id, char_lo, char_hi, vod_ts, flipped)
+      VALUES (NEW.id, MIN(NEW.c1_id, NEW.c2_id), MAX(NEW.c1_id, NEW.c2_id), NEW.vod_ts, NEW.c1_id > NEW.c2_id);
+      INSERT INTO matchup_count (char_lo, char_hi, vods)
+      VALUES (MIN(NEW.c1_id, NEW.c2_id), MAX(NEW.c1_id, NEW.c2_id), 1)
+      ON CONFLICT (char_lo, char_hi) DO UPDATE SET vods = vods + 1;
+    END;
+
+    DROP TRIGGER IF EXISTS vod_matchup_update;
+    CREATE TRIGGER vod_matchup_update AFTER UPDATE OF c1_id, c2_id, vod_ts ON vod BEGIN
+      UPDATE matchup_count SET vods = vods - 1
+      WHERE char_lo = MIN(OLD.c1_id, OLD.c2_id) AND char_hi = MAX(OLD.c1_id, OLD.c2_id);
+      INSERT OR REPLACE INTO vod_matchup (vod_id, char_lo, char_hi, vod_ts, flipped)
+      VALUES (NEW.id, MIN(NEW.c1_id, NEW.c2_id), MAX(NEW.c1_id, NEW.c2_id), NEW.vod_ts, NEW.c1_id > NEW.c2_id);
+      INSERT INTO matchup_count (char_lo, char_hi, vods)
+      VALUES (MIN(NEW.c1_id, NEW.c2_id), MAX(NEW.c1_id, NEW.c2_id), 1)
+      ON CONFLICT (char_lo, char_hi) DO UPDATE SET vods = vods + 1;
+    END;
+
+    DROP TRIGGER IF EXISTS vod_matchup_delete;
+    CREATE TRIGGER vod_matchup_delete AFTER DELETE ON vod BEGIN
+      DELETE FROM vod_matchup WHERE vod_id = OLD.id;
+      UPDATE matchup_count SET vods = vods - 1
+      WHERE char_lo = MIN(OLD.c1_id, OLD.c2_id) AND char_hi = MAX(OLD.c1_id, OLD.c2_id);
+    END;
+    """)
+    m.backfill('vod_matchup', """
+    INSERT OR IGNORE INTO vod_matchup (vod_id, char_lo, char_hi, vod_ts, flipped)
+    SELECT id, MIN(c1_id, c2_id), MAX(c1_id, c2_id), vod_ts, c1_id > c2_id
+    FROM vod WHERE id BETWEEN :first AND :last;
+    """)
+    m.create_index('idx_vod_matchup', 'vod_matchup (char_lo, char_hi, vod_ts DESC, vod_id DESC)')
+    with m.transaction():
+        m.execute("DELETE FROM matchup_count;")
+        m.execute("""
+        INSERT INTO matchup_count (char_lo, char_hi, vods)
+        SELECT char_lo, char_hi, COUNT(*) FROM vod_matchup GROUP BY char_lo, char_hi;
+        """)
@@ -0,0 +1,190 @@
+"""The patch table and the stats tables behind the stats, player and event pages.
+
+Kept up to date by triggers on vod and vod_participant. The stats are
+aggregates, so they're recomputed in one transaction rather than backfilled
+in chunks, like `flask rebuild-stats`.
+"""
+from db import load_patches
+
+
+def upgrade(m):
+    m.script("""
+    CREATE TABLE IF NOT EXISTS patch (
+      name TEXT PRIMARY KEY,
+      start_ts INTEGER NOT NULL,
+      url TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS stat_character (
+      character_id INTEGER PRIMARY KEY,
+      picks INTEGER NOT NULL,
+      FOREIGN KEY (character_id) REFERENCES game_character (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS stat_player (
+      player_id INTEGER PRIMARY KEY,
+      vods INTEGER NOT NULL,
+      first_ts INTEGER,
+      last_ts INTEGER,
+      FOREIGN KEY (player_id) REFERENCES player (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS stat_event (
+      event_id INTEGER PRIMARY KEY,
+      vods INTEGER NOT NULL,
+      first_ts INTEGER,
+      last_ts INTEGER,
+      FOREIGN KEY (event_id) REFERENCES event (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS stat_patch_event (
+      patch_name TEXT NOT NULL,
+      event_id INTEGER NOT NULL,
+      vods INTEGER NOT NULL,
+      PRIMARY KEY (patch_name, event_id),
+      FOREIGN KEY (event_id) REFERENCES event (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS stat_player_character (
+      player_id INTEGER NOT NULL,
+      character_id INTEGER NOT NULL,
+      vods INTEGER NOT NULL,
+      PRIMARY KEY (player_id, character_id),
+      FOREIGN KEY (player_id) REFERENCES player (id),
+      FOREIGN KEY (character_id) REFERENCES game_character (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS stat_event_character (
+      event_id INTEGER NOT NULL,
+      character_id INTEGER NOT NULL,
+      picks INTEGER NOT NULL,
+      PRIMARY KEY (event_id, character_id),
+      FOREIGN KEY (event_id) REFERENCES event (id),
+      FOREIGN KEY (character_id) REFERENCES game_character (id)
+    );
+
+    DROP TRIGGER IF EXISTS stat_participant_insert;
+    CREATE TRIGGER stat_participant_insert AFTER INSERT ON vod_participant BEGIN
+      INSERT INTO stat_character (character_id, picks)
+      SELECT NEW.character_id, 1 WHERE NEW.character_id IS NOT NULL
+      ON CONFLICT (character_id) DO UPDATE SET picks = picks + 1;
+      INSERT INTO stat_player (player_id, vods, first_ts, last_ts)
+      SELECT NEW.player_id, 1, vod_ts, vod_ts FROM vod WHERE id = NEW.vod_id
+      ON CONFLICT (player_id) DO UPDATE SET
+        vods = vods + 1,
+        first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+        last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+      INSERT INTO stat_player_character (player_id, character_id, vods)
+      SELECT NEW.player_id, NEW.character_id, 1 WHERE NEW.character_id IS NOT NULL
+      ON CONFLICT (player_id, character_id) DO UPDATE SET vods = vods + 1;
+    END;
+
+    DROP TRIGGER IF EXISTS stat_participant_delete;
+    CREATE TRIGGER stat_participant_delete AFTER DELETE ON vod_participant BEGIN
+      UPDATE stat_character SET picks = picks - 1 WHERE character_id = OLD.character_id;
+      UPDATE stat_player SET vods = vods - 1 WHERE player_id = OLD.player_id;
+      UPDATE stat_player_character SET vods = vods - 1
+      WHERE player_id = OLD.player_id AND character_id = OLD.character_id;
+    END;
+
+    DROP TRIGGER IF EXISTS stat_vod_insert;
+    CREATE TRIGGER stat_vod_insert AFTER INSERT ON vod BEGIN
+      INSERT INTO stat_event (event_id, vods, first_ts, last_ts)
+      VALUES (NEW.event_id, 1, NEW.vod_ts, NEW.vod_ts)
+      ON CONFLICT (event_id) DO UPDATE SET
+        vods = vods + 1,
+        first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+        last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+      INSERT INTO stat_patch_event (patch_name, event_id, vods)
+      SELECT name, NEW.event_id, 1 FROM patch WHERE start_ts <= NEW.vod_ts ORDER BY start_ts DESC LIMIT 1
+      ON CONFLICT (patch_name, event_id) DO UPDATE SET vods = vods + 1;
+      INSERT INTO stat_event_character (event_id, character_id, picks)
+      SELECT NEW.event_id, character_id, COUNT(*) FROM (
+        SELECT NEW.c1_id AS character_id
+        UNION ALL SELECT NEW.c2_id
+        UNION ALL SELECT NEW.c3_id
+        UNION ALL SELECT NEW.c4_id
+      )
+      WHERE character_id IS NOT NULL
+      GROUP BY character_id
+      ON CONFLICT (event_id, character_id) DO UPDATE SET picks = picks + excluded.picks;
+    END;
+
+    DROP TRIGGER IF EXISTS stat_vod_character_update;
+    CREATE TRIGGER stat_vod_character_update AFTER UPDATE OF event_id, c1_id, c2_id, c3_id, c4_id ON vod BEGIN
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c1_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c2_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c3_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c4_id;
+      INSERT INTO stat_event_character (event_id, character_id, picks)
+      SELECT NEW.event_id, character_id, COUNT(*) FROM (
+        SELECT NEW.c1_id AS character_id
+        UNION ALL SELECT NEW.c2_id
+        UNION ALL SELECT NEW.c3_id
+        UNION ALL SELECT NEW.c4_id
+      )
+      WHERE character_id IS NOT NULL
+      GROUP BY character_id
+      ON CONFLICT (event_id, character_id) DO UPDATE SET picks = picks + excluded.picks;
+    END;
+
+    DROP TRIGGER IF EXISTS stat_vod_delete;
+    CREATE TRIGGER stat_vod_delete AFTER DELETE ON vod BEGIN
+      UPDATE stat_event SET vods = vods - 1 WHERE event_id = OLD.event_id;
+      UPDATE stat_patch_event SET vods = vods - 1
+      WHERE event_id = OLD.event_id
+        AND patch_name = (SELECT name FROM patch WHERE start_ts <= OLD.vod_ts ORDER BY start_ts DESC LIMIT 1);
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c1_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c2_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c3_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c4_id;
+    END;
+    """)
+    m.create_index('idx_patch_start', 'patch (start_ts)')
+    m.create_index('idx_stat_player_vods', 'stat_player (vods DESC)')
+
+    with m.transaction():
+        m.execute("DELETE FROM patch;")
+        m.connection.executemany("INSERT INTO patch (name, start_ts, url) VALUES (?, ?, ?);",
+                                 [(p.name, int(p.date.timestamp()), p.url) for p in load_patches()])
+        for table in ['stat_character', 'stat_player', 'stat_event', 'stat_patch_event', 'stat_player_character', 'stat_event_character']:
+            m.execute(f"DELETE FROM {table};")
+        m.execute("""
+        INSERT INTO stat_character (character_id, picks)
+        SELECT character_id, COUNT(*) FROM vod_participant WHERE character_id IS NOT NULL GROUP BY character_id;
+        """)
+        m.execute("""
+        INSERT INTO stat_player (player_id, vods, first_ts, last_ts)
+        SELECT vp.player_id, COUNT(DISTINCT vp.vod_id), MIN(vod.vod_ts), MAX(vod.vod_ts)
+        FROM vod_participant vp
+            INNER JOIN vod ON vod.id = vp.vod_id
+        GROUP BY vp.player_id;
+        """)
+        m.execute("""
+        INSERT INTO stat_player_character (player_id, character_id, vods)
+        SELECT player_id, character_id, COUNT(*) FROM vod_participant
+        WHERE character_id IS NOT NULL
+        GROUP BY player_id, character_id;
+        """)
+        m.execute("""
+        INSERT INTO stat_event (event_id, vods, first_ts, last_ts)
+        SELECT event_id, COUNT(*), MIN(vod_ts), MAX(vod_ts) FROM vod GROUP BY event_id;
+        """)
+        m.execute("""
+        INSERT INTO stat_event_character (event_id, character_id, picks)
+        SELECT vod.event_id, vp.character_id, COUNT(*)
+        FROM vod_participant vp
+            INNER JOIN vod ON vod.id = vp.vod_id
+        WHERE vp.character_id IS NOT NULL
+        GROUP BY vod.event_id, vp.character_id;
+        """)
+        m.execute("""
+        INSERT INTO stat_patch_event (patch_name, event_id, vods)
+        SELECT patch_name, event_id, COUNT(*) FROM (
+            SELECT vod.event_id,
+                   (SELECT name FROM patch WHERE start_ts <= vod.vod_ts ORDER BY start_ts DESC LIMIT 1) AS patch_name
+            FROM vod
+        )
+        WHERE patch_name IS NOT NULL
+        GROUP BY patch_name, event_id;
+        """)
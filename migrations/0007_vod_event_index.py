@@ -0,0 +1,5 @@
+"""An index for an event's VODs in date order, for the event pages."""
+
+
+def upgrade(m):
+    m.create_index('idx_vod_event', 'vod (event_id, vod_ts)')
@@ -0,0 +1,39 @@
+"""metadata's data_generation and data_updated_at, and the triggers that
+bump them whenever the VODs, player tags or event names change."""
+
+
+def upgrade(m):
+    m.script("""
+    INSERT OR IGNORE INTO metadata (key, value) VALUES ('data_generation', 0);
+    INSERT OR IGNORE INTO metadata (key, value) VALUES ('data_updated_at', strftime('%s', 'now'));
+
+    DROP TRIGGER IF EXISTS data_generation_vod_insert;
+    CREATE TRIGGER data_generation_vod_insert AFTER INSERT ON vod BEGIN
+      UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+      UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+    END;
+
+    DROP TRIGGER IF EXISTS data_generation_vod_update;
+    CREATE TRIGGER data_generation_vod_update AFTER UPDATE ON vod BEGIN
+      UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+      UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+    END;
+
+    DROP TRIGGER IF EXISTS data_generation_vod_delete;
+    CREATE TRIGGER data_generation_vod_delete AFTER DELETE ON vod BEGIN
+      UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+      UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+    END;
+
+    DROP TRIGGER IF EXISTS data_generation_player_update;
+    CREATE TRIGGER data_generation_player_update AFTER UPDATE OF tag ON player BEGIN
+      UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+      UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+    END;
+
+    DROP TRIGGER IF EXISTS data_generation_event_update;
+    CREATE TRIGGER data_generation_event_update AFTER UPDATE OF name ON event BEGIN
+      UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+      UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+    END;
+    """)
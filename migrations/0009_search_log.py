@@ -0,0 +1,12 @@
+"""search_log: sampled daily request counts for search, player and event pages."""
+
+
+def upgrade(m):
+    m.script("""
+    CREATE TABLE IF NOT EXISTS search_log (
+      day INTEGER NOT NULL,
+      path TEXT NOT NULL,
+      hits INTEGER NOT NULL,
+      PRIMARY KEY (day, path)
+    );
+    """)
@@ -0,0 +1,101 @@
+"""Count each VOD once in stat_player.vods, even if a player is in two slots.
+
+The triggers used to count every vod_participant row, unlike rebuild-stats.
+stat_player is recomputed, in one transaction like rebuild-stats.
+"""
+
+
+def upgrade(m):
+    m.script("""
+    DROP TRIGGER IF EXISTS stat_participant_insert;
+    CREATE TRIGGER stat_participant_insert AFTER INSERT ON vod_participant BEGIN
+      INSERT INTO stat_character (character_id, picks)
+      SELECT NEW.character_id, 1 WHERE NEW.character_id IS NOT NULL
+      ON CONFLICT (character_id) DO UPDATE SET picks = picks + 1;
+      INSERT INTO stat_player_character (player_id, character_id, vods)
+      SELECT NEW.player_id, NEW.character_id, 1 WHERE NEW.character_id IS NOT NULL
+      ON CONFLICT (player_id, character_id) DO UPDATE SET vods = vods + 1;
+    END;
+
+    DROP TRIGGER IF EXISTS stat_participant_delete;
+    CREATE TRIGGER stat_participant_delete AFTER DELETE ON vod_participant BEGIN
+      UPDATE stat_character SET picks = picks - 1 WHERE character_id = OLD.character_id;
+      UPDATE stat_player_character SET vods = vods - 1
+      WHERE player_id = OLD.player_id AND character_id = OLD.character_id;
+    END;
+
+    DROP TRIGGER IF EXISTS stat_vod_insert;
+    CREATE TRIGGER stat_vod_insert AFTER INSERT ON vod BEGIN
+      INSERT INTO stat_event (event_id, vods, first_ts, last_ts)
+      VALUES (NEW.event_id, 1, NEW.vod_ts, NEW.vod_ts)
+      ON CONFLICT (event_id) DO UPDATE SET
+        vods = vods + 1,
+        first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+        last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+      INSERT INTO stat_patch_event (patch_name, event_id, vods)
+      SELECT name, NEW.event_id, 1 FROM patch WHERE start_ts <= NEW.vod_ts ORDER BY start_ts DESC LIMIT 1
+      ON CONFLICT (patch_name, event_id) DO UPDATE SET vods = vods + 1;
+      -- Per VOD rather than per vod_participant row, so a player in two slots is counted once.
+      INSERT INTO stat_player (player_id, vods, first_ts, last_ts)
+      SELECT player_id, 1, NEW.vod_ts, NEW.vod_ts FROM (
+        SELECT NEW.p1_id AS player_id
+        UNION SELECT NEW.p2_id
+        UNION SELECT NEW.p3_id
+        UNION SELECT NEW.p4_id
+      )
+      WHERE player_id IS NOT NULL
+      ON CONFLICT (player_id) DO UPDATE SET
+        vods = vods + 1,
+        first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+        last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+      INSERT INTO stat_event_character (event_id, character_id, picks)
+      SELECT NEW.event_id, character_id, COUNT(*) FROM (
+        SELECT NEW.c1_id AS character_id
+        UNION ALL SELECT NEW.c2_id
+        UNION ALL SELECT NEW.c3_id
+        UNION ALL SELECT NEW.c4_id
+      )
+      WHERE character_id IS NOT NULL
+      GROUP BY character_id
+      ON CONFLICT (event_id, character_id) DO UPDATE SET picks = picks + excluded.picks;
+    END;
+
+    DROP TRIGGER IF EXISTS stat_vod_player_update;
+    CREATE TRIGGER stat_vod_player_update AFTER UPDATE OF p1_id, p2_id, p3_id, p4_id ON vod BEGIN
+      UPDATE stat_player SET vods = vods - 1 WHERE player_id IN (OLD.p1_id, OLD.p2_id, OLD.p3_id, OLD.p4_id);
+      INSERT INTO stat_player (player_id, vods, first_ts, last_ts)
+      SELECT player_id, 1, NEW.vod_ts, NEW.vod_ts FROM (
+        SELECT NEW.p1_id AS player_id
+        UNION SELECT NEW.p2_id
+        UNION SELECT NEW.p3_id
+        UNION SELECT NEW.p4_id
+      )
+      WHERE player_id IS NOT NULL
+      ON CONFLICT (player_id) DO UPDATE SET
+        vods = vods + 1,
+        first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+        last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+    END;
+
+    DROP TRIGGER IF EXISTS stat_vod_delete;
+    CREATE TRIGGER stat_vod_delete AFTER DELETE ON vod BEGIN
+      UPDATE stat_event SET vods = vods - 1 WHERE event_id = OLD.event_id;
+      UPDATE stat_player SET vods = vods - 1 WHERE player_id IN (OLD.p1_id, OLD.p2_id, OLD.p3_id, OLD.p4_id);
+      UPDATE stat_patch_event SET vods = vods - 1
+      WHERE event_id = OLD.event_id
+        AND patch_name = (SELECT name FROM patch WHERE start_ts <= OLD.vod_ts ORDER BY start_ts DESC LIMIT 1);
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c1_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c2_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c3_id;
+      UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c4_id;
+    END;
+    """)
+    with m.transaction():
+        m.execute("DELETE FROM stat_player;")
+        m.execute("""
+        INSERT INTO stat_player (player_id, vods, first_ts, last_ts)
+        SELECT vp.player_id, COUNT(DISTINCT vp.vod_id), MIN(vod.vod_ts), MAX(vod.vod_ts)
+        FROM vod_participant vp
+            INNER JOIN vod ON vod.id = vp.vod_id
+        GROUP BY vp.player_id;
+        """)
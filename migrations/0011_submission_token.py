@@ -0,0 +1,8 @@
+"""submission.token: the id the submission queue gives each submission, so
+a batch replayed from the spool isn't inserted twice. Existing submissions
+don't have one."""
+
+
+def upgrade(m):
+    m.add_column('submission', 'token', 'TEXT')
+    m.create_index('idx_submission_token', 'submission (token)', unique=True)
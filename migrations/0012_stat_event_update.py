@@ -0,0 +1,48 @@
+"""Keep stat_event and stat_patch_event up to date when a VOD's event or
+date changes, e.g. from backfill-vod-ts.
+
+Both were only updated on insert and delete, so they're recomputed, in one
+transaction like rebuild-stats.
+"""
+
+
+def upgrade(m):
+    m.script("""
+    DROP TRIGGER IF EXISTS stat_vod_event_update;
+    CREATE TRIGGER stat_vod_event_update AFTER UPDATE OF event_id, vod_ts ON vod BEGIN
+      UPDATE stat_event SET vods = vods - 1 WHERE event_id = OLD.event_id;
+      UPDATE stat_patch_event SET vods = vods - 1
+      WHERE event_id = OLD.event_id
+        AND patch_name = (SELECT name FROM patch WHERE start_ts <= OLD.vod_ts ORDER BY start_ts DESC LIMIT 1);
+      INSERT INTO stat_event (event_id, vods, first_ts, last_ts)
+      VALUES (NEW.event_id, 1, NEW.vod_ts, NEW.vod_ts)
+      ON CONFLICT (event_id) DO UPDATE SET
+        vods = vods + 1,
+        first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+        last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+      INSERT INTO stat_patch_event (patch_name, event_id, vods)
+      SELECT name, NEW.event_id, 1 FROM patch WHERE start_ts <= NEW.vod_ts ORDER BY start_ts DESC LIMIT 1
+      ON CONFLICT (patch_name, event_id) DO UPDATE SET vods = vods + 1;
+      UPDATE stat_player SET
+        first_ts = MIN(COALESCE(first_ts, NEW.vod_ts), NEW.vod_ts),
+        last_ts = MAX(COALESCE(last_ts, NEW.vod_ts), NEW.vod_ts)
+      WHERE NEW.vod_ts IS NOT NULL AND player_id IN (NEW.p1_id, NEW.p2_id, NEW.p3_id, NEW.p4_id);
+    END;
+    """)
+    with m.transaction():
+        m.execute("DELETE FROM stat_event;")
+        m.execute("""
+        INSERT INTO stat_event (event_id, vods, first_ts, last_ts)
+        SELECT event_id, COUNT(*), MIN(vod_ts), MAX(vod_ts) FROM vod GROUP BY event_id;
+        """)
+        m.execute("DELETE FROM stat_patch_event;")
+        m.execute("""
+        INSERT INTO stat_patch_event (patch_name, event_id, vods)
+        SELECT patch_name, event_id, COUNT(*) FROM (
+            SELECT vod.event_id,
+                   (SELECT name FROM patch WHERE start_ts <= vod.vod_ts ORDER BY start_ts DESC LIMIT 1) AS patch_name
+            FROM vod
+        )
+        WHERE patch_name IS NOT NULL
+        GROUP BY patch_name, event_id;
+        """)
@@ -1,41 +1,56 @@
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import NamedTuple
 
-@dataclass
-class Vod:
+class Vod(NamedTuple):
+    """A VOD as listed in a table, built straight from a row of db.vod_select.
+
+    It's a tuple with the fields in the same order as the SELECT's columns
+    (then the patch), so making one per row is cheap, it's no bigger than the
+    row, and it can't be modified after it's built.
+    """
     url: str
-    event_name: str
     p1_tag: str
-    c1_icon_url: str
     p2_tag: str
+    c1_icon_url: str
     c2_icon_url: str
-    round: str
-    vod_date: datetime
+    event_name: str
+    round: str | None
+    vod_ts: int | None
+    # Teammates of p1 and p2 in doubles VODs.
+    p3_tag: str | None = None
+    p4_tag: str | None = None
+    # For links to the player and event pages.
+    p1_id: int | None = None
+    p2_id: int | None = None
+    event_id: int | None = None
+    # For the JSON API.
+    c1_name: str | None = None
+    c2_name: str | None = None
+    vod_id: int | None = None
+    # For the character sprites.
+    c1_id: int | None = None
+    c2_id: int | None = None
+    # The patch that was live when the VOD was uploaded, if it was looked up.
+    patch_name: str | None = None
+    patch_url: str | None = None
 
-@dataclass
+    @property
+    def vod_date(self) -> datetime | None:
+        # Only built for the rows that get rendered.
+        return datetime.fromtimestamp(self.vod_ts, timezone.utc) if self.vod_ts is not None else None
+
+@dataclass(frozen=True)
 class Channel:
     url: str
     name: str
 
-@dataclass
+@dataclass(frozen=True)
 class Patch:
     name: str
     date: datetime
     url: str
 
-@dataclass
-class VodAndPatch:
-    url: str
-    event_name: str
-    p1_tag: str
-    c1_icon_url: str
-    p2_tag: str
-    c2_icon_url: str
-    round: str
-    vod_date: datetime
-    patch_name: str
-    patch_url: str
-
 @dataclass
 class ParsedVodTitle:
     p1: str
@@ -49,3 +64,17 @@ class ParsedVodTitle:
     event: str
     event_id: int
     round: str
+    confidence: float = 1.0
+
+@dataclass
+class StagedVod:
+    url: str
+    title: str
+    p1: str
+    c1_id: int
+    p2: str
+    c2_id: int
+    event: str
+    round: str
+    vod_date: str
+    confidence: float
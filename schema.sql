@@ -7,6 +7,18 @@ DROP TABLE IF EXISTS player;
 DROP TABLE IF EXISTS vod;
 DROP TABLE IF EXISTS submission;
 DROP TABLE IF EXISTS metadata;
+DROP TABLE IF EXISTS ingest_staging;
+DROP TABLE IF EXISTS vod_participant;
+DROP TABLE IF EXISTS vod_matchup;
+DROP TABLE IF EXISTS matchup_count;
+DROP TABLE IF EXISTS patch;
+DROP TABLE IF EXISTS stat_character;
+DROP TABLE IF EXISTS stat_player;
+DROP TABLE IF EXISTS stat_event;
+DROP TABLE IF EXISTS stat_patch_event;
+DROP TABLE IF EXISTS stat_player_character;
+DROP TABLE IF EXISTS stat_event_character;
+DROP TABLE IF EXISTS search_log;
 
 CREATE TABLE mod (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -48,6 +60,9 @@ CREATE TABLE submission (
     round TEXT,
     event TEXT,
     date TEXT,
+    -- Set by the submission queue when the form is submitted, so a batch
+    -- replayed from the spool isn't inserted twice.
+    token TEXT,
     FOREIGN KEY (game_id) REFERENCES game (id)
 );
 
@@ -72,6 +87,8 @@ CREATE TABLE vod (
   c4_id INTEGER,
   submission_id INTEGER,
   vod_date TIMESTAMP,
+  -- vod_date normalized to a UTC epoch. Use this for ordering and filtering.
+  vod_ts INTEGER,
   round TEXT,
   FOREIGN KEY (game_id) REFERENCES game (id),
   FOREIGN KEY (event_id) REFERENCES event (id),
@@ -86,16 +103,355 @@ CREATE TABLE vod (
   FOREIGN KEY (submission_id) REFERENCES submission (id)
 );
 
+-- One row per player in a VOD, so "player/character in any slot" searches can
+-- use an index. In doubles, slots 1 and 3 are a team against slots 2 and 4.
+-- Maintained by the triggers below.
+CREATE TABLE vod_participant (
+  vod_id INTEGER NOT NULL,
+  slot INTEGER NOT NULL,
+  player_id INTEGER NOT NULL,
+  character_id INTEGER,
+  PRIMARY KEY (vod_id, slot),
+  FOREIGN KEY (vod_id) REFERENCES vod (id),
+  FOREIGN KEY (player_id) REFERENCES player (id),
+  FOREIGN KEY (character_id) REFERENCES game_character (id)
+);
+
+-- Every VOD keyed on its unordered character pair, so a matchup search is one
+-- index range scan. `flipped` is 1 when p1 played char_hi.
+-- Maintained by the triggers below.
+CREATE TABLE vod_matchup (
+  vod_id INTEGER PRIMARY KEY,
+  char_lo INTEGER NOT NULL,
+  char_hi INTEGER NOT NULL,
+  vod_ts INTEGER,
+  flipped INTEGER NOT NULL,
+  FOREIGN KEY (vod_id) REFERENCES vod (id),
+  FOREIGN KEY (char_lo) REFERENCES game_character (id),
+  FOREIGN KEY (char_hi) REFERENCES game_character (id)
+);
+
+-- Number of VODs per matchup, for search totals without a COUNT.
+CREATE TABLE matchup_count (
+  char_lo INTEGER NOT NULL,
+  char_hi INTEGER NOT NULL,
+  vods INTEGER NOT NULL,
+  PRIMARY KEY (char_lo, char_hi)
+);
+
+-- A copy of data/patches.txt, see sync_patches in db.py.
+CREATE TABLE patch (
+  name TEXT PRIMARY KEY,
+  start_ts INTEGER NOT NULL,
+  url TEXT
+);
+
+-- Aggregates for the stats page, maintained by the triggers below and
+-- recomputed by `flask rebuild-stats`. Matchup counts are in matchup_count.
+CREATE TABLE stat_character (
+  character_id INTEGER PRIMARY KEY,
+  picks INTEGER NOT NULL,
+  FOREIGN KEY (character_id) REFERENCES game_character (id)
+);
+
+CREATE TABLE stat_player (
+  player_id INTEGER PRIMARY KEY,
+  vods INTEGER NOT NULL,
+  first_ts INTEGER,
+  last_ts INTEGER,
+  FOREIGN KEY (player_id) REFERENCES player (id)
+);
+
+CREATE TABLE stat_event (
+  event_id INTEGER PRIMARY KEY,
+  vods INTEGER NOT NULL,
+  first_ts INTEGER,
+  last_ts INTEGER,
+  FOREIGN KEY (event_id) REFERENCES event (id)
+);
+
+-- Picks per character for each player and each event, for the profile pages.
+CREATE TABLE stat_player_character (
+  player_id INTEGER NOT NULL,
+  character_id INTEGER NOT NULL,
+  vods INTEGER NOT NULL,
+  PRIMARY KEY (player_id, character_id),
+  FOREIGN KEY (player_id) REFERENCES player (id),
+  FOREIGN KEY (character_id) REFERENCES game_character (id)
+);
+
+CREATE TABLE stat_event_character (
+  event_id INTEGER NOT NULL,
+  character_id INTEGER NOT NULL,
+  picks INTEGER NOT NULL,
+  PRIMARY KEY (event_id, character_id),
+  FOREIGN KEY (event_id) REFERENCES event (id),
+  FOREIGN KEY (character_id) REFERENCES game_character (id)
+);
+
+CREATE TABLE stat_patch_event (
+  patch_name TEXT NOT NULL,
+  event_id INTEGER NOT NULL,
+  vods INTEGER NOT NULL,
+  PRIMARY KEY (patch_name, event_id),
+  FOREIGN KEY (event_id) REFERENCES event (id)
+);
+
 CREATE TABLE metadata (
     key TEXT PRIMARY KEY,
     value TEXT
 );
 
+-- VODs found by the ingest commands, waiting to be promoted into vod.
+CREATE TABLE ingest_staging (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    -- The command that found the VOD: channel, playlist, multi-vod or gemini.
+    source TEXT NOT NULL,
+    -- 0-1, how much to trust the parse.
+    confidence REAL NOT NULL,
+    title TEXT,
+    url TEXT NOT NULL,
+    p1 TEXT NOT NULL,
+    c1_id INTEGER NOT NULL,
+    p2 TEXT NOT NULL,
+    c2_id INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    round TEXT,
+    vod_date TEXT,
+    created_at TEXT NOT NULL,
+    FOREIGN KEY (c1_id) REFERENCES game_character (id),
+    FOREIGN KEY (c2_id) REFERENCES game_character (id)
+);
+
+-- Sampled requests for search, player and event pages per UTC day, by
+-- canonical path without the page number (see utils/search_log.py).
+CREATE TABLE search_log (
+  -- Days since the epoch.
+  day INTEGER NOT NULL,
+  path TEXT NOT NULL,
+  hits INTEGER NOT NULL,
+  PRIMARY KEY (day, path)
+);
+
 CREATE INDEX idx_submission_status ON submission (status);
+CREATE UNIQUE INDEX idx_submission_token ON submission (token);
 CREATE INDEX idx_vod_c1 ON vod (c1_id);
 CREATE INDEX idx_vod_c2 ON vod (c2_id);
 CREATE INDEX idx_vod_p1 ON vod (p1_id);
 CREATE INDEX idx_vod_p2 ON vod (p2_id);
+CREATE INDEX idx_vod_url ON vod (url);
+CREATE INDEX idx_vod_ts ON vod (vod_ts);
+CREATE INDEX idx_vod_event ON vod (event_id, vod_ts);
+CREATE INDEX idx_player_tag ON player (tag);
+CREATE INDEX idx_event_name ON event (name);
+CREATE INDEX idx_vod_participant_player ON vod_participant (player_id, vod_id);
+CREATE INDEX idx_vod_participant_character ON vod_participant (character_id, vod_id);
+CREATE INDEX idx_vod_matchup ON vod_matchup (char_lo, char_hi, vod_ts DESC, vod_id DESC);
+CREATE INDEX idx_patch_start ON patch (start_ts);
+CREATE INDEX idx_stat_player_vods ON stat_player (vods DESC);
+CREATE INDEX idx_ingest_staging_batch ON ingest_staging (batch_id, status);
+CREATE INDEX idx_ingest_staging_url ON ingest_staging (url);
+
+CREATE TRIGGER vod_participant_insert AFTER INSERT ON vod BEGIN
+  INSERT INTO vod_participant (vod_id, slot, player_id, character_id)
+  SELECT NEW.id, slot, player_id, character_id FROM (
+    SELECT 1 AS slot, NEW.p1_id AS player_id, NEW.c1_id AS character_id
+    UNION ALL SELECT 2, NEW.p2_id, NEW.c2_id
+    UNION ALL SELECT 3, NEW.p3_id, NEW.c3_id
+    UNION ALL SELECT 4, NEW.p4_id, NEW.c4_id
+  )
+  WHERE player_id IS NOT NULL;
+END;
+
+CREATE TRIGGER vod_participant_update AFTER UPDATE OF p1_id, c1_id, p2_id, c2_id, p3_id, c3_id, p4_id, c4_id ON vod BEGIN
+  DELETE FROM vod_participant WHERE vod_id = OLD.id;
+  INSERT INTO vod_participant (vod_id, slot, player_id, character_id)
+  SELECT NEW.id, slot, player_id, character_id FROM (
+    SELECT 1 AS slot, NEW.p1_id AS player_id, NEW.c1_id AS character_id
+    UNION ALL SELECT 2, NEW.p2_id, NEW.c2_id
+    UNION ALL SELECT 3, NEW.p3_id, NEW.c3_id
+    UNION ALL SELECT 4, NEW.p4_id, NEW.c4_id
+  )
+  WHERE player_id IS NOT NULL;
+END;
+
+CREATE TRIGGER vod_participant_delete AFTER DELETE ON vod BEGIN
+  DELETE FROM vod_participant WHERE vod_id = OLD.id;
+END;
+
+CREATE TRIGGER vod_matchup_insert AFTER INSERT ON vod BEGIN
+  INSERT INTO vod_matchup (vod_id, char_lo, char_hi, vod_ts, flipped)
+  VALUES (NEW.id, MIN(NEW.c1_id, NEW.c2_id), MAX(NEW.c1_id, NEW.c2_id), NEW.vod_ts, NEW.c1_id > NEW.c2_id);
+  INSERT INTO matchup_count (char_lo, char_hi, vods)
+  VALUES (MIN(NEW.c1_id, NEW.c2_id), MAX(NEW.c1_id, NEW.c2_id), 1)
+  ON CONFLICT (char_lo, char_hi) DO UPDATE SET vods = vods + 1;
+END;
+
+CREATE TRIGGER vod_matchup_update AFTER UPDATE OF c1_id, c2_id, vod_ts ON vod BEGIN
+  UPDATE matchup_count SET vods = vods - 1
+  WHERE char_lo = MIN(OLD.c1_id, OLD.c2_id) AND char_hi = MAX(OLD.c1_id, OLD.c2_id);
+  INSERT OR REPLACE INTO vod_matchup (vod_id, char_lo, char_hi, vod_ts, flipped)
+  VALUES (NEW.id, MIN(NEW.c1_id, NEW.c2_id), MAX(NEW.c1_id, NEW.c2_id), NEW.vod_ts, NEW.c1_id > NEW.c2_id);
+  INSERT INTO matchup_count (char_lo, char_hi, vods)
+  VALUES (MIN(NEW.c1_id, NEW.c2_id), MAX(NEW.c1_id, NEW.c2_id), 1)
+  ON CONFLICT (char_lo, char_hi) DO UPDATE SET vods = vods + 1;
+END;
+
+CREATE TRIGGER vod_matchup_delete AFTER DELETE ON vod BEGIN
+  DELETE FROM vod_matchup WHERE vod_id = OLD.id;
+  UPDATE matchup_count SET vods = vods - 1
+  WHERE char_lo = MIN(OLD.c1_id, OLD.c2_id) AND char_hi = MAX(OLD.c1_id, OLD.c2_id);
+END;
+
+CREATE TRIGGER stat_participant_insert AFTER INSERT ON vod_participant BEGIN
+  INSERT INTO stat_character (character_id, picks)
+  SELECT NEW.character_id, 1 WHERE NEW.character_id IS NOT NULL
+  ON CONFLICT (character_id) DO UPDATE SET picks = picks + 1;
+  INSERT INTO stat_player_character (player_id, character_id, vods)
+  SELECT NEW.player_id, NEW.character_id, 1 WHERE NEW.character_id IS NOT NULL
+  ON CONFLICT (player_id, character_id) DO UPDATE SET vods = vods + 1;
+END;
+
+CREATE TRIGGER stat_participant_delete AFTER DELETE ON vod_participant BEGIN
+  UPDATE stat_character SET picks = picks - 1 WHERE character_id = OLD.character_id;
+  UPDATE stat_player_character SET vods = vods - 1
+  WHERE player_id = OLD.player_id AND character_id = OLD.character_id;
+END;
+
+CREATE TRIGGER stat_vod_insert AFTER INSERT ON vod BEGIN
+  INSERT INTO stat_event (event_id, vods, first_ts, last_ts)
+  VALUES (NEW.event_id, 1, NEW.vod_ts, NEW.vod_ts)
+  ON CONFLICT (event_id) DO UPDATE SET
+    vods = vods + 1,
+    first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+    last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+  INSERT INTO stat_patch_event (patch_name, event_id, vods)
+  SELECT name, NEW.event_id, 1 FROM patch WHERE start_ts <= NEW.vod_ts ORDER BY start_ts DESC LIMIT 1
+  ON CONFLICT (patch_name, event_id) DO UPDATE SET vods = vods + 1;
+  -- Per VOD rather than per vod_participant row, so a player in two slots is counted once.
+  INSERT INTO stat_player (player_id, vods, first_ts, last_ts)
+  SELECT player_id, 1, NEW.vod_ts, NEW.vod_ts FROM (
+    SELECT NEW.p1_id AS player_id
+    UNION SELECT NEW.p2_id
+    UNION SELECT NEW.p3_id
+    UNION SELECT NEW.p4_id
+  )
+  WHERE player_id IS NOT NULL
+  ON CONFLICT (player_id) DO UPDATE SET
+    vods = vods + 1,
+    first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+    last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+  INSERT INTO stat_event_character (event_id, character_id, picks)
+  SELECT NEW.event_id, character_id, COUNT(*) FROM (
+    SELECT NEW.c1_id AS character_id
+    UNION ALL SELECT NEW.c2_id
+    UNION ALL SELECT NEW.c3_id
+    UNION ALL SELECT NEW.c4_id
+  )
+  WHERE character_id IS NOT NULL
+  GROUP BY character_id
+  ON CONFLICT (event_id, character_id) DO UPDATE SET picks = picks + excluded.picks;
+END;
+
+CREATE TRIGGER stat_vod_character_update AFTER UPDATE OF event_id, c1_id, c2_id, c3_id, c4_id ON vod BEGIN
+  UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c1_id;
+  UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c2_id;
+  UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c3_id;
+  UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c4_id;
+  INSERT INTO stat_event_character (event_id, character_id, picks)
+  SELECT NEW.event_id, character_id, COUNT(*) FROM (
+    SELECT NEW.c1_id AS character_id
+    UNION ALL SELECT NEW.c2_id
+    UNION ALL SELECT NEW.c3_id
+    UNION ALL SELECT NEW.c4_id
+  )
+  WHERE character_id IS NOT NULL
+  GROUP BY character_id
+  ON CONFLICT (event_id, character_id) DO UPDATE SET picks = picks + excluded.picks;
+END;
+
+CREATE TRIGGER stat_vod_player_update AFTER UPDATE OF p1_id, p2_id, p3_id, p4_id ON vod BEGIN
+  UPDATE stat_player SET vods = vods - 1 WHERE player_id IN (OLD.p1_id, OLD.p2_id, OLD.p3_id, OLD.p4_id);
+  INSERT INTO stat_player (player_id, vods, first_ts, last_ts)
+  SELECT player_id, 1, NEW.vod_ts, NEW.vod_ts FROM (
+    SELECT NEW.p1_id AS player_id
+    UNION SELECT NEW.p2_id
+    UNION SELECT NEW.p3_id
+    UNION SELECT NEW.p4_id
+  )
+  WHERE player_id IS NOT NULL
+  ON CONFLICT (player_id) DO UPDATE SET
+    vods = vods + 1,
+    first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+    last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+END;
+
+-- A VOD moved to another event or date (e.g. by backfill-vod-ts) is counted
+-- under the new ones instead.
+CREATE TRIGGER stat_vod_event_update AFTER UPDATE OF event_id, vod_ts ON vod BEGIN
+  UPDATE stat_event SET vods = vods - 1 WHERE event_id = OLD.event_id;
+  UPDATE stat_patch_event SET vods = vods - 1
+  WHERE event_id = OLD.event_id
+    AND patch_name = (SELECT name FROM patch WHERE start_ts <= OLD.vod_ts ORDER BY start_ts DESC LIMIT 1);
+  INSERT INTO stat_event (event_id, vods, first_ts, last_ts)
+  VALUES (NEW.event_id, 1, NEW.vod_ts, NEW.vod_ts)
+  ON CONFLICT (event_id) DO UPDATE SET
+    vods = vods + 1,
+    first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+    last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts));
+  INSERT INTO stat_patch_event (patch_name, event_id, vods)
+  SELECT name, NEW.event_id, 1 FROM patch WHERE start_ts <= NEW.vod_ts ORDER BY start_ts DESC LIMIT 1
+  ON CONFLICT (patch_name, event_id) DO UPDATE SET vods = vods + 1;
+  UPDATE stat_player SET
+    first_ts = MIN(COALESCE(first_ts, NEW.vod_ts), NEW.vod_ts),
+    last_ts = MAX(COALESCE(last_ts, NEW.vod_ts), NEW.vod_ts)
+  WHERE NEW.vod_ts IS NOT NULL AND player_id IN (NEW.p1_id, NEW.p2_id, NEW.p3_id, NEW.p4_id);
+END;
+
+CREATE TRIGGER stat_vod_delete AFTER DELETE ON vod BEGIN
+  UPDATE stat_event SET vods = vods - 1 WHERE event_id = OLD.event_id;
+  UPDATE stat_player SET vods = vods - 1 WHERE player_id IN (OLD.p1_id, OLD.p2_id, OLD.p3_id, OLD.p4_id);
+  UPDATE stat_patch_event SET vods = vods - 1
+  WHERE event_id = OLD.event_id
+    AND patch_name = (SELECT name FROM patch WHERE start_ts <= OLD.vod_ts ORDER BY start_ts DESC LIMIT 1);
+  UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c1_id;
+  UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c2_id;
+  UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c3_id;
+  UPDATE stat_event_character SET picks = picks - 1 WHERE event_id = OLD.event_id AND character_id = OLD.c4_id;
+END;
+
+-- data_generation is bumped whenever the VODs, player tags or event names
+-- change, so in-memory indexes and HTTP caches know when they're stale.
+-- data_updated_at is the epoch time of the last change.
+CREATE TRIGGER data_generation_vod_insert AFTER INSERT ON vod BEGIN
+  UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+  UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+END;
+
+CREATE TRIGGER data_generation_vod_update AFTER UPDATE ON vod BEGIN
+  UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+  UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+END;
+
+CREATE TRIGGER data_generation_vod_delete AFTER DELETE ON vod BEGIN
+  UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+  UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+END;
+
+CREATE TRIGGER data_generation_player_update AFTER UPDATE OF tag ON player BEGIN
+  UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+  UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+END;
+
+CREATE TRIGGER data_generation_event_update AFTER UPDATE OF name ON event BEGIN
+  UPDATE metadata SET value = value + 1 WHERE key = 'data_generation';
+  UPDATE metadata SET value = strftime('%s', 'now') WHERE key = 'data_updated_at';
+END;
+
+INSERT INTO metadata (key, value) VALUES ("data_generation", 0);
+INSERT INTO metadata (key, value) VALUES ("data_updated_at", strftime('%s', 'now'));
 
 INSERT INTO game (name) VALUES ("Rivals of Aether 2");
 
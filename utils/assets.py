@@ -0,0 +1,102 @@
+"""Content-hashed, precompressed copies of the stylesheets and static files.
+
+`flask build-assets` copies each source to static/assets/ under a name with a
+hash of its contents (e.g. styles.3f2a9c1e0b7d.css), writes a .gz next to
+the ones that compress, and records the names in a manifest. Templates link
+to them with `asset_url`, and they're served with far-future cache headers,
+since a changed file gets a new name.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+
+MANIFEST = 'manifest.json'
+
+# Logical name -> path relative to the app root, for the stylesheets that
+# otherwise get inlined from templates/.
+TEMPLATE_SOURCES = {
+    'styles.css': 'templates/styles.css',
+    'credits.css': 'templates/credits/credits.css',
+    'submit.css': 'templates/submit/submit.css',
+}
+
+# Directories under static/ that hold build output rather than sources.
+BUILD_DIRECTORIES = {'assets', 'sprites'}
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.ico', '.txt', '.json'}
+
+
+def sources(root, static_folder):
+    """Logical name -> source path for everything build-assets copies."""
+    found = {name: os.path.join(root, path) for (name, path) in TEMPLATE_SOURCES.items()}
+    for directory, subdirectories, names in os.walk(static_folder):
+        if directory == static_folder:
+            subdirectories[:] = [d for d in subdirectories if d not in BUILD_DIRECTORIES]
+        for name in names:
+            path = os.path.join(directory, name)
+            found[os.path.relpath(path, static_folder).replace(os.sep, '/')] = path
+    return found
+
+
+def hashed_name(name, data):
+    stem, extension = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+
+
+def _write_atomically(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def build(root, static_folder, output_directory):
+    """Writes the hashed files, their .gz versions and the manifest. Returns the manifest.
+
+    Files from the previous build are kept, so pages cached from before it
+    can still load them, and older ones are removed.
+    """
+    previous = load(output_directory)
+    manifest = {}
+    for name, path in sorted(sources(root, static_folder).items()):
+        with open(path, 'rb') as f:
+            data = f.read()
+        filename = hashed_name(name, data)
+        manifest[name] = filename
+
+        target = os.path.join(output_directory, filename)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not os.path.exists(target):
+            _write_atomically(target, data)
+        if os.path.splitext(name)[1] in COMPRESSIBLE_EXTENSIONS:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data) * 0.9:
+                _write_atomically(target + '.gz', compressed)
+
+    _write_atomically(os.path.join(output_directory, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+
+    keep = {MANIFEST} | set(manifest.values()) | set(previous.values())
+    for directory, _, names in os.walk(output_directory):
+        for name in names:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, output_directory).replace(os.sep, '/')
+            if relative.removesuffix('.gz') not in keep:
+                os.unlink(path)
+    return manifest
+
+
+def load(directory):
+    """The manifest from the last build in `directory`, or {} if it hasn't been built."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
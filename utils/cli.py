@@ -0,0 +1,57 @@
+"""Lazy registration of the `flask` commands.
+
+The commands live in commands.py, which imports the ingest code and its
+client libraries. Importing it with the app would make every web worker pay
+for that on startup, so `app.cli` only knows each command's name and where it
+is, and imports it the first time the CLI looks it up.
+"""
+import importlib
+
+from flask.cli import AppGroup
+
+
+COMMANDS = {
+    'init-db': 'commands:init_db_command',
+    'review-submissions': 'commands:review_submissions_command',
+    'ingest-channel': 'commands:ingest_channel_command',
+    'ingest-csv': 'commands:ingest_csv_command',
+    'export-csv': 'commands:export_vods_command',
+    'ingest-sheet': 'commands:ingest_sheet_command',
+    'export-sheet': 'commands:export_sheet_command',
+    'ingest-multi-vod': 'commands:ingest_multi_vod_command',
+    'ingest-playlist': 'commands:ingest_playlist_command',
+    'extract-vods': 'commands:extract_vods_v1_command',
+    'promote-staging': 'commands:promote_staging_command',
+    'backfill-vod-ts': 'commands:backfill_vod_ts_command',
+    'migrate': 'commands:migrate_command',
+    'rebuild-participants': 'commands:rebuild_participants_command',
+    'rebuild-matchups': 'commands:rebuild_matchups_command',
+    'rebuild-stats': 'commands:rebuild_stats_command',
+    'build-sprites': 'commands:build_sprites_command',
+    'build-assets': 'commands:build_assets_command',
+    'build-static': 'commands:build_static_command',
+    'warm-caches': 'commands:warm_caches_command',
+    'popular-searches': 'commands:popular_searches_command',
+}
+
+
+class LazyGroup(AppGroup):
+    """An AppGroup that also takes commands as "module:attribute" strings, and
+    imports each one the first time it's looked up."""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = dict(lazy_commands or {})
+
+    def list_commands(self, ctx):
+        return sorted({*super().list_commands(ctx), *self.lazy_commands})
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self.lazy_commands:
+            module_name, attribute = self.lazy_commands[name].split(':')
+            self.add_command(getattr(importlib.import_module(module_name), attribute), name)
+        return super().get_command(ctx, name)
+
+
+def init_app(app):
+    app.cli = LazyGroup(app.cli.name, commands=app.cli.commands, lazy_commands=COMMANDS)
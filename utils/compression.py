@@ -0,0 +1,57 @@
+"""Gzip for HTML and JSON responses, negotiated with Accept-Encoding.
+
+Responses with an ETag (the cacheable pages, see `http_cached`) tend to be
+requested again with the same body, so their compressed bodies are kept in a
+small LRU keyed on a hash of the body. Streamed responses and files (which
+have their own precompressed copies, see utils/assets.py) are left alone.
+"""
+import gzip
+import hashlib
+
+from flask import request
+
+from utils.fragment_cache import FragmentCache
+
+
+COMPRESSIBLE_TYPES = {'text/html', 'application/json'}
+
+enabled = False
+min_bytes = 500
+level = 6
+cache = None
+
+
+def init_app(app):
+    global enabled, min_bytes, level, cache
+    enabled = bool(app.config.get('COMPRESS_RESPONSES'))
+    if not enabled:
+        return
+    min_bytes = app.config.get('COMPRESS_MIN_BYTES', min_bytes)
+    level = app.config.get('COMPRESS_LEVEL', level)
+    cache = FragmentCache(app.config.get('COMPRESSED_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+    app.after_request(compress_response)
+
+
+def compress_response(response):
+    if (response.status_code != 200
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or response.is_streamed
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+
+    if response.get_etag()[0]:
+        key = hashlib.blake2b(body, digest_size=16).digest()
+        compressed = cache.get_or_render(key, lambda: gzip.compress(body, compresslevel=level, mtime=0))
+    else:
+        compressed = gzip.compress(body, compresslevel=level, mtime=0)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,284 @@
+"""Prometheus metrics in the text exposition format, without the client library.
+
+The web app serves its registry at /metrics. Values are per process, so with
+several workers each one reports its own (scrape them separately, or sum them).
+Ingest commands are short-lived, so `ingest_run` writes their run metrics to a
+file for node_exporter's textfile collector instead.
+"""
+import contextlib
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+from flask import g, request
+
+
+logger = logging.getLogger(__name__)
+
+enabled = False
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for (name, value) in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for (name, value) in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        lines += self.samples()
+        return '\n'.join(lines)
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for (labels, value) in values]
+
+
+class Gauge(Metric):
+    """A value read when the metrics are scraped.
+
+    `collect()` returns a number, or for a gauge with labels, (labelvalues,
+    number) pairs. If it raises, the gauge is left out of that scrape. Use
+    type='counter' for values that only go up, like a cache's hit count.
+    """
+
+    def __init__(self, name, help, collect, labelnames=(), type='gauge'):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+        self.type = type
+
+    def samples(self):
+        try:
+            collected = self.collect()
+        except Exception:
+            logger.exception('Could not collect %s.', self.name)
+            return []
+        if not self.labelnames:
+            collected = [((), collected)]
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for (labels, value) in collected]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # labelvalues -> [per-bucket counts, sum, count]
+        self._values = {}
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total, count))
+                            for (labels, (counts, total, count)) in self._values.items())
+        lines = []
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, [('le', _format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_str} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_str} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, collect, labelnames=(), type='gauge'):
+        return self.register(Gauge(name, help, collect, labelnames, type))
+
+    def histogram(self, name, help, buckets, labelnames=()):
+        return self.register(Histogram(name, help, buckets, labelnames))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+registry = Registry()
+
+request_seconds = registry.histogram(
+    'vods_http_request_duration_seconds',
+    'Time to handle a request, until the response starts streaming.',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    labelnames=('route', 'method'))
+requests_total = registry.counter(
+    'vods_http_requests_total',
+    'Requests handled, by route and status code.',
+    labelnames=('route', 'method', 'status'))
+search_results = registry.histogram(
+    'vods_search_results',
+    'Number of VODs matching a search.',
+    buckets=(0, 1, 10, 80, 250, 1000, 2500, 5000, 10000))
+sqlite_queries = registry.counter(
+    'vods_sqlite_queries_total',
+    'SQLite statements executed, by statement type.',
+    labelnames=('statement',))
+sqlite_seconds = registry.counter(
+    'vods_sqlite_query_seconds_total',
+    'Time spent executing SQLite statements and fetching their rows, by statement type.',
+    labelnames=('statement',))
+
+
+def init_app(app):
+    global enabled
+    enabled = bool(app.config.get('METRICS'))
+    if not enabled:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def statement_type(sql):
+    """The first keyword of a statement, e.g. SELECT, for the statement label."""
+    words = sql.split(None, 1)
+    return words[0].upper() if words else ''
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+
+
+def _finish_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        route = _route()
+        request_seconds.observe(time.perf_counter() - start, route, request.method)
+        requests_total.inc(route, request.method, str(response.status_code))
+    return response
+
+
+class IngestRun:
+    """Run-level metrics for one ingest command.
+
+    Counts are added with `inc` while the command runs. When the run ends,
+    every count is written as a `vods_ingest_<name>` gauge labelled with the
+    command, along with the wall time, whether it succeeded, and when it
+    finished. Only the last run of each command is kept, which is what the
+    textfile collector expects.
+    """
+
+    def __init__(self, command, directory, names=()):
+        self.command = command
+        self.directory = directory
+        # Counts listed in `names` are written even if they stay at 0.
+        self.counts = dict.fromkeys(names, 0)
+        self.start = time.monotonic()
+
+    def inc(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def render(self, success):
+        values = dict(self.counts)
+        values['duration_seconds'] = round(time.monotonic() - self.start, 3)
+        values['success'] = 1 if success else 0
+        values['last_run_timestamp_seconds'] = int(time.time())
+        labels = _format_labels(('command',), (self.command,))
+        lines = []
+        for name, value in sorted(values.items()):
+            lines.append(f'# TYPE vods_ingest_{name} gauge')
+            lines.append(f'vods_ingest_{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def path(self):
+        return os.path.join(self.directory, f"vods_{self.command.replace('-', '_')}.prom")
+
+    def write(self, success):
+        """Writes the file atomically, so the collector never reads half of it."""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.vods_', suffix='.prom.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.render(success))
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.path())
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(temp_path)
+            raise
+
+
+@contextlib.contextmanager
+def ingest_run(command, directory, names=()):
+    """Yields an IngestRun, and writes it to `directory` when the block ends,
+    even if it fails. Nothing is written if `directory` is None."""
+    run = IngestRun(command, directory, names)
+    success = False
+    try:
+        yield run
+        success = True
+    finally:
+        if directory:
+            try:
+                run.write(success)
+            except OSError:
+                logger.exception('Could not write the metrics for %s to %s.', command, directory)
@@ -0,0 +1,173 @@
+"""Versioned schema migrations for databases created before the current schema.sql.
+
+`init-db` creates the latest schema from schema.sql and drops everything
+that was there. `flask migrate` instead brings an existing database up to
+date in place: the files in migrations/ are numbered, and each one whose
+number is above the database's schema_version (in metadata, 0 if it's never
+been migrated) is applied in order, then schema_version is set to it.
+
+Every migration is written to be safe to run against a database that already
+has some of its changes, since databases from before schema_version can be in
+any state between the original schema and the current one.
+
+The site keeps serving while a migration runs: backfills commit every
+`chunk_size` rows and each index is built in its own transaction, so readers
+only wait on short commits. Tables that got new indexes are analyzed
+afterwards, and `PRAGMA optimize` runs at the end.
+"""
+import contextlib
+import importlib.util
+import os
+import re
+import sqlite3
+import time
+from collections import namedtuple
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+FILENAME = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+MigrationFile = namedtuple('MigrationFile', ['version', 'name', 'path'])
+
+
+def available():
+    """The migrations in migrations/, in the order they're applied."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = FILENAME.match(filename)
+        if match:
+            migrations.append(MigrationFile(int(match.group(1)), match.group(2),
+                                            os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+def latest_version():
+    return max((m.version for m in available()), default=0)
+
+
+def get_version(connection):
+    row = connection.execute("SELECT value FROM metadata WHERE key = 'schema_version';").fetchone()
+    return int(row[0]) if row else 0
+
+
+def set_version(connection, version):
+    connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('schema_version', ?);", (version,))
+
+
+def pending(connection):
+    version = get_version(connection)
+    return [m for m in available() if m.version > version]
+
+
+def load(migration):
+    spec = importlib.util.spec_from_file_location(f'migrations.{migration.name}', migration.path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def connect(database, busy_timeout=30.0):
+    """A connection that leaves transactions to the caller, as the migrations expect."""
+    # db imports this module, so it's imported when a migration runs.
+    from db import vod_date_to_epoch
+
+    connection = sqlite3.connect(database, timeout=busy_timeout, isolation_level=None)
+    connection.create_function('vod_epoch', 1, vod_date_to_epoch, deterministic=True)
+    return connection
+
+
+class Migration:
+    """What a migration's `upgrade(m)` works with: the connection, and
+    helpers for the changes that have to be idempotent or chunked."""
+
+    def __init__(self, connection, chunk_size=1000, echo=print):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.echo = echo
+        self.indexed_tables = set()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE;")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK;")
+            raise
+        self.connection.execute("COMMIT;")
+
+    def execute(self, sql, params=()):
+        return self.connection.execute(sql, params)
+
+    def script(self, sql):
+        """Runs a script of statements (e.g. CREATE TRIGGERs) in one transaction."""
+        try:
+            self.connection.executescript(f'BEGIN IMMEDIATE;\n{sql}\nCOMMIT;')
+        except BaseException:
+            if self.connection.in_transaction:
+                self.connection.execute("ROLLBACK;")
+            raise
+
+    def columns(self, table):
+        return [row[1] for row in self.connection.execute(f"PRAGMA table_info({table});")]
+
+    def add_column(self, table, column, definition):
+        if column not in self.columns(table):
+            with self.transaction():
+                self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+
+    def create_index(self, name, definition, unique=False):
+        """CREATE [UNIQUE] INDEX name ON definition, e.g. create_index('idx_vod_ts', 'vod (vod_ts)'),
+        if there's no index called `name` yet."""
+        if self.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?;", (name,)).fetchone():
+            return
+        start = time.perf_counter()
+        with self.transaction():
+            self.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {definition};")
+        self.indexed_tables.add(definition.split('(')[0].strip())
+        self.echo(f'  Built {name} in {time.perf_counter() - start:.1f}s.')
+
+    def backfill(self, description, sql, table='vod'):
+        """Runs `sql` for each chunk of `chunk_size` rows of `table`, by id,
+        committing after each. `sql` gets the chunk's first and last id as
+        :first and :last, and should skip rows that are already filled in."""
+        rows = 0
+        last_id = 0
+        start = time.perf_counter()
+        while True:
+            ids = self.execute(f"SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?;",
+                               (last_id, self.chunk_size)).fetchall()
+            if not ids:
+                break
+            first_id, last_id = ids[0][0], ids[-1][0]
+            with self.transaction():
+                rows += self.execute(sql, {'first': first_id, 'last': last_id}).rowcount
+        self.echo(f'  Backfilled {description} for {rows} rows in {time.perf_counter() - start:.1f}s.')
+        return rows
+
+
+def migrate(database, chunk_size=1000, echo=print, target=None):
+    """Applies the pending migrations to `database`, up to version `target`
+    if it's given. Returns the ones applied."""
+    connection = connect(database)
+    try:
+        applied = []
+        indexed_tables = set()
+        for migration in pending(connection):
+            if target is not None and migration.version > target:
+                break
+            echo(f'Applying {migration.version:04d}_{migration.name}...')
+            m = Migration(connection, chunk_size, echo)
+            load(migration).upgrade(m)
+            with m.transaction():
+                set_version(connection, migration.version)
+            indexed_tables |= m.indexed_tables
+            applied.append(migration)
+
+        for table in sorted(indexed_tables):
+            connection.execute(f"ANALYZE {table};")
+        if applied:
+            connection.execute("PRAGMA optimize;")
+        return applied
+    finally:
+        connection.close()
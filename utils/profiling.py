@@ -0,0 +1,263 @@
+"""Opt-in request profiling: SQL timings, phase timers and a Server-Timing header.
+
+Enable with PROFILING=True (FLASK_PROFILING=true). When it's off, `phase`
+returns a shared no-op context manager, so the cost is one flag check, and
+unless metrics are on too, connections are plain sqlite3 connections.
+"""
+import contextlib
+import json
+import logging
+import re
+import sqlite3
+import time
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+from utils import metrics
+
+
+logger = logging.getLogger(__name__)
+
+enabled = False
+slow_request_ms = 200.0
+slow_query_ms = 50.0
+log_path = None
+
+_NOOP = contextlib.nullcontext()
+
+
+def init_app(app):
+    global enabled, slow_request_ms, slow_query_ms, log_path
+    enabled = bool(app.config.get('PROFILING'))
+    if not enabled:
+        return
+    slow_request_ms = float(app.config.get('PROFILING_SLOW_REQUEST_MS', slow_request_ms))
+    slow_query_ms = float(app.config.get('PROFILING_SLOW_QUERY_MS', slow_query_ms))
+    log_path = app.config.get('PROFILING_LOG_PATH')
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_finish_render, app)
+
+
+def connect(database, **kwargs):
+    """sqlite3.connect, with timed cursors when profiling or metrics are on."""
+    if enabled or metrics.enabled:
+        kwargs['factory'] = ProfiledConnection
+    return sqlite3.connect(database, **kwargs)
+
+
+def phase(name):
+    """Times a block as part of the current request, e.g. `with profiling.phase('search_vods'):`."""
+    if not enabled or not has_request_context() or 'profile' not in g:
+        return _NOOP
+    return g.profile.phase(name)
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+_LIKE_LISTS = re.compile(r'(tag LIKE \?)(?:\s+OR\s+tag LIKE \?)+')
+
+
+def fingerprint(sql):
+    """The shape of a statement: literals replaced with ?, lists of ? collapsed, whitespace normalized."""
+    sql = _LITERALS.sub('?', sql)
+    sql = _PLACEHOLDER_LISTS.sub('?, ...', sql)
+    sql = _LIKE_LISTS.sub(r'\1 OR ...', sql)
+    return ' '.join(sql.split())
+
+
+class Query:
+    __slots__ = ('sql', 'params', 'connection', 'ms', 'rows', 'statement')
+
+    def __init__(self, sql, params, connection):
+        self.sql = sql
+        self.params = params
+        self.connection = connection
+        self.ms = 0.0
+        self.rows = 0
+        self.statement = metrics.statement_type(sql)
+
+    def add_time(self, ms):
+        self.ms += ms
+        if metrics.enabled:
+            metrics.sqlite_seconds.inc(self.statement, amount=ms / 1000)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.queries = []
+        self.render_start = None
+
+    def add(self, name, ms):
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def sql_ms(self):
+        return sum(q.ms for q in self.queries)
+
+
+def _current_profile():
+    if has_request_context():
+        return g.get('profile')
+    return None
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Records each statement's text, parameters, rows fetched and time spent
+    executing and fetching on the current request's profile, and in the
+    SQLite metrics."""
+
+    _query = None
+
+    def _start_query(self, sql, params):
+        profile = _current_profile()
+        if profile is None and not metrics.enabled:
+            self._query = None
+            return None
+        query = self._query = Query(sql, params, self.connection)
+        if profile is not None:
+            profile.queries.append(query)
+        if metrics.enabled:
+            metrics.sqlite_queries.inc(query.statement)
+        return query
+
+    def execute(self, sql, params=()):
+        query = self._start_query(sql, params)
+        if query is None:
+            return super().execute(sql, params)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            query.add_time((time.perf_counter() - start) * 1000)
+
+    def executemany(self, sql, seq_of_params):
+        query = self._start_query(sql, None)
+        if query is None:
+            return super().executemany(sql, seq_of_params)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            query.add_time((time.perf_counter() - start) * 1000)
+            query.rows = self.rowcount
+
+    def _timed_fetch(self, fetch, *args):
+        if self._query is None:
+            return fetch(*args)
+        start = time.perf_counter()
+        try:
+            result = fetch(*args)
+        finally:
+            self._query.add_time((time.perf_counter() - start) * 1000)
+        if isinstance(result, list):
+            self._query.rows += len(result)
+        elif result is not None:
+            self._query.rows += 1
+        return result
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, *(() if size is None else (size,)))
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def __next__(self):
+        return self._timed_fetch(super().__next__)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def _start_request():
+    g.profile = RequestProfile()
+
+
+def _start_render(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None:
+        profile.render_start = time.perf_counter()
+
+
+def _finish_render(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None and profile.render_start is not None:
+        profile.add('render', (time.perf_counter() - profile.render_start) * 1000)
+        profile.render_start = None
+
+
+def _finish_request(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    total_ms = (time.perf_counter() - profile.start) * 1000
+    timings = [f'{name};dur={ms:.2f}' for (name, ms) in profile.phases.items()]
+    timings.append(f'sql;dur={profile.sql_ms():.2f};desc="{len(profile.queries)} queries"')
+    # For streamed responses this only covers the time until streaming starts.
+    timings.append(f'total;dur={total_ms:.2f}')
+    response.headers['Server-Timing'] = ', '.join(timings)
+
+    if total_ms >= slow_request_ms:
+        _log_slow_request(profile, total_ms, response.status_code)
+    return response
+
+
+def _log_slow_request(profile, total_ms, status):
+    queries = []
+    for query in profile.queries:
+        entry = {"sql": fingerprint(query.sql), "ms": round(query.ms, 2), "rows": query.rows}
+        if query.ms >= slow_query_ms and query.params is not None:
+            entry["plan"] = _query_plan(query)
+        queries.append(entry)
+
+    record = {
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "path": request.full_path,
+        "status": status,
+        "ms": round(total_ms, 2),
+        "phases": {name: round(ms, 2) for (name, ms) in profile.phases.items()},
+        "queries": queries,
+    }
+    line = json.dumps(record)
+    if log_path:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    else:
+        logger.warning('Slow request: %s', line)
+
+
+def _query_plan(query):
+    stripped = query.sql.lstrip()
+    if not stripped.upper().startswith(('SELECT', 'WITH')):
+        return None
+    try:
+        # A plain cursor, so the EXPLAIN isn't recorded itself. This fails if
+        # the connection was already closed (e.g. the updates bar's).
+        cursor = sqlite3.Cursor(query.connection)
+        rows = cursor.execute('EXPLAIN QUERY PLAN ' + stripped, query.params).fetchall()
+        return [row[3] for row in rows]
+    except sqlite3.Error as e:
+        return [f'error: {e}']
@@ -0,0 +1,138 @@
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from models import Channel, Patch
+
+
+logger = logging.getLogger(__name__)
+
+data_path = Path(__file__).parent.parent / "data"
+
+
+def data_lines(path):
+    """The non-empty, non-comment lines of a data/*.txt file, stripped."""
+    with open(path, encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def parse_channels(path):
+    channels = []
+    for line in data_lines(path):
+        url, rest = line.split(': ')
+        name = ' '.join(rest.split(' ')[1:])
+        channels.append(Channel(url=url, name=name))
+    return tuple(channels)
+
+
+def parse_patches(path):
+    patches = []
+    for line in data_lines(path):
+        name, date, url = line.split(',')
+        patches.append(Patch(
+            name=name,
+            date=datetime.strptime(date, "%m/%d/%y").astimezone(timezone.utc),
+            url=url))
+    return tuple(patches)
+
+
+def parse_rank_list(path):
+    """Lowercased player tags from a rank list."""
+    return tuple(line.lower() for line in data_lines(path))
+
+
+def parse_names(path):
+    return frozenset(data_lines(path))
+
+
+class ReferenceData:
+    """The data/*.txt files, each parsed once into an immutable value.
+
+    `get` doesn't touch the filesystem. At most every `check_interval` seconds
+    (or on the next `get` after `request_reload`, e.g. from SIGHUP) it stats
+    the files and re-parses the ones that changed. The new value replaces the
+    old one in a single assignment, so readers see one or the other. If a file
+    fails to parse (e.g. it's half-written), the old value is kept.
+    """
+
+    def __init__(self, check_interval=5.0):
+        self.check_interval = check_interval
+        self._files = {}
+        # name -> (value, mtime)
+        self._loaded = {}
+        self._next_check = 0.0
+        self._reload_requested = False
+        self._lock = threading.Lock()
+
+    def register(self, name, path, parse):
+        self._files[name] = (path, parse)
+        self._loaded.pop(name, None)
+
+    def get(self, name):
+        self._maybe_check()
+        loaded = self._loaded.get(name)
+        if loaded is None:
+            with self._lock:
+                loaded = self._loaded.get(name) or self._load(name)
+        return loaded[0]
+
+    def version(self):
+        """The newest mtime of the files, for cache keys."""
+        return max((int(self.mtime(name)) for name in self._files), default=0)
+
+    def mtime(self, name):
+        self.get(name)
+        return self._loaded[name][1]
+
+    def request_reload(self):
+        self._reload_requested = True
+
+    def install_sighup_handler(self):
+        """Makes SIGHUP reload the files. Only works from the main thread."""
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
+
+    def _maybe_check(self):
+        if not self._reload_requested and time.monotonic() < self._next_check:
+            return
+        if not self._lock.acquire(blocking=False):
+            # Another thread is checking, keep using the current values.
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            self._reload_requested = False
+            for name in list(self._loaded):
+                path, _ = self._files[name]
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if mtime != self._loaded[name][1]:
+                    self._load(name)
+        finally:
+            self._lock.release()
+
+    def _load(self, name):
+        path, parse = self._files[name]
+        mtime = os.path.getmtime(path)
+        try:
+            loaded = (parse(path), mtime)
+        except Exception:
+            if name not in self._loaded:
+                raise
+            logger.exception('Could not reload %s, keeping the previous version.', path)
+            return self._loaded[name]
+        self._loaded[name] = loaded
+        return loaded
+
+
+reference_data = ReferenceData()
+reference_data.register('channels', data_path / 'channel_ids.txt', parse_channels)
+reference_data.register('patches', data_path / 'patches.txt', parse_patches)
+reference_data.register('lunarank', data_path / 'lunarank.txt', parse_rank_list)
+reference_data.register('alexrank', data_path / 'alexrank.txt', parse_rank_list)
+reference_data.register('online_events', data_path / 'online_events.txt', parse_names)
@@ -0,0 +1,116 @@
+"""Sampled counts of the pages people search for, to warm the caches after an ingest.
+
+Each worker counts a sample of the search, player and event pages it serves
+(by canonical path, without the page number) in memory, and a background
+thread adds the counts to the search_log table, one row per path per UTC day,
+dropping days older than the retention period. `flask warm-caches` requests
+the most popular paths, and `flask popular-searches` lists them.
+"""
+import atexit
+import collections
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Sent by warm-caches so its own requests aren't counted as searches.
+SKIP_HEADER = 'X-Skip-Search-Log'
+
+# Also in schema.sql; created here too for databases from before the table.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_log (
+  day INTEGER NOT NULL,
+  path TEXT NOT NULL,
+  hits INTEGER NOT NULL,
+  PRIMARY KEY (day, path)
+);
+"""
+
+
+def today():
+    """Days since the epoch, in UTC."""
+    return int(time.time() // 86400)
+
+
+class SearchLog:
+    """Sampled request counts for one worker. `database` is a function
+    returning the database's path, so it follows config changes."""
+
+    def __init__(self, database, sample_rate=0.1, flush_interval=30.0, retention_days=14, busy_timeout=5.0):
+        self.database = database
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.busy_timeout = busy_timeout
+
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._created = False
+
+    def record(self, path):
+        """Counts a request for `path`, if it's sampled."""
+        if random.random() >= self.sample_rate:
+            return
+        with self._lock:
+            self._counts[path] += 1
+        self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='search-log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, collections.Counter()
+        if not counts:
+            return
+        day = today()
+        try:
+            conn = sqlite3.connect(self.database(), timeout=self.busy_timeout)
+            try:
+                with conn:
+                    if not self._created:
+                        conn.executescript(SCHEMA)
+                        self._created = True
+                    conn.executemany("""
+                    INSERT INTO search_log (day, path, hits) VALUES (?, ?, ?)
+                    ON CONFLICT (day, path) DO UPDATE SET hits = hits + excluded.hits;
+                    """, [(day, path, hits) for (path, hits) in counts.items()])
+                    conn.execute("DELETE FROM search_log WHERE day < ?;", (day - self.retention_days,))
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as e:
+            # Keep the counts for the next flush.
+            logger.warning('Could not write the search log (%s), retrying later.', e)
+            with self._lock:
+                self._counts.update(counts)
+
+
+def popular_paths(cursor, limit, days):
+    """(path, hits, last day seen) for the most requested paths in the last `days` days."""
+    try:
+        return cursor.execute("""
+        SELECT path, SUM(hits), MAX(day)
+        FROM search_log
+        WHERE day > ?
+        GROUP BY path
+        ORDER BY SUM(hits) DESC, path
+        LIMIT ?;
+        """, (today() - days, limit)).fetchall()
+    except sqlite3.OperationalError:
+        # No search_log table yet.
+        return []
@@ -0,0 +1,123 @@
+"""Character icons bundled into one fingerprinted stylesheet.
+
+`flask build-sprites` reads every character's icon once and writes
+static/sprites/characters.<hash>.css, with a `.char-<id>` class per character
+whose background is the icon as a data URI, plus a manifest naming the file.
+The VOD table renders `<span class="char char-<id>">` for the characters in
+the manifest, so a page needs one stylesheet request instead of an image
+per row, and falls back to `<img>` for any that are missing.
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import urllib.request
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+
+MANIFEST = 'manifest.json'
+# How many builds' stylesheets to keep, counting the current one.
+KEEP_BUILDS = 10
+
+IMAGE_TYPES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'RIFF', 'image/webp'),
+]
+
+
+@dataclass(frozen=True)
+class CharacterSprites:
+    css_url: str | None = None
+    ids: frozenset = field(default_factory=frozenset)
+
+
+def image_type(data):
+    for magic, mime_type in IMAGE_TYPES:
+        if data.startswith(magic):
+            return mime_type
+    raise ValueError('not a PNG, JPEG, GIF or WebP image')
+
+
+def read_icon(icon_url, root, icons_dir=None, timeout=10):
+    """The bytes of a character icon.
+
+    If `icons_dir` has a file with the same name as the icon URL's, that's
+    used. Otherwise http(s) URLs are downloaded and anything else is read as
+    a path relative to `root`.
+    """
+    name = os.path.basename(urlparse(icon_url).path)
+    if icons_dir and os.path.isfile(os.path.join(icons_dir, name)):
+        path = os.path.join(icons_dir, name)
+    elif urlparse(icon_url).scheme in ('http', 'https'):
+        with urllib.request.urlopen(icon_url, timeout=timeout) as response:
+            return response.read()
+    else:
+        path = os.path.join(root, icon_url)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def build_css(icons):
+    """A stylesheet with a `.char-<id>` rule per (id, image bytes) pair."""
+    rules = []
+    for character_id, data in icons:
+        encoded = base64.b64encode(data).decode('ascii')
+        rules.append(f'.char-{character_id}{{background-image:url(data:{image_type(data)};base64,{encoded})}}')
+    return '\n'.join(rules) + '\n'
+
+
+def _write_atomically(path, content):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write(directory, icons):
+    """Writes the stylesheet and manifest to `directory`. Returns the stylesheet's file name.
+
+    Stylesheets from the last KEEP_BUILDS builds are kept, since running
+    workers, pre-rendered pages and cached HTML still link to them, and older
+    ones are removed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    css = build_css(icons)
+    filename = f"characters.{hashlib.sha256(css.encode('utf-8')).hexdigest()[:12]}.css"
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            previous = json.load(f)
+        builds = [previous['css']] + previous.get('previous', [])
+    except FileNotFoundError:
+        builds = []
+    builds = [name for name in builds if name != filename][:KEEP_BUILDS - 1]
+
+    _write_atomically(os.path.join(directory, filename), css)
+    _write_atomically(os.path.join(directory, MANIFEST), json.dumps({
+        "css": filename,
+        "characters": sorted(character_id for (character_id, _) in icons),
+        "previous": builds,
+    }, indent=2))
+
+    for name in os.listdir(directory):
+        if name.startswith('characters.') and name.endswith('.css') and name != filename and name not in builds:
+            os.unlink(os.path.join(directory, name))
+    return filename
+
+
+def load(directory, url_prefix):
+    """The sprites from the last build in `directory`, or none if it hasn't been built."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return CharacterSprites()
+    return CharacterSprites(css_url=f"{url_prefix}/{manifest['css']}", ids=frozenset(manifest['characters']))
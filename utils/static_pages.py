@@ -0,0 +1,115 @@
+"""Pre-rendered copies of the most requested pages, for a front proxy to serve as files.
+
+`flask build-static` renders each page through the app's test client and
+writes it under the output directory at a path derived from its URL (see
+`file_path`), so a proxy can look the file up from the request and fall
+back to the site when it's missing. A manifest records a signature of the
+data behind each page, and a page is only rendered again when that changes.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import tempfile
+from urllib.parse import urlsplit
+
+from flask.cli import locate_app
+
+
+MANIFEST = 'build-static.json'
+
+# Set in the WSGI environ of the requests that render pages, which then leave
+# an SSI include of UPDATES_PATH in place of the "last updated" bar.
+STATIC_BUILD = 'vods.static_build'
+UPDATES_PATH = '/updates-bar'
+
+
+def file_path(path):
+    """Where a page is written, relative to the output directory.
+
+    "/event/12" -> "event/12/index.html", and a query string is appended to
+    the file name: "/?c1=ranno&c2=wrastor" -> "index.html?c1=ranno&c2=wrastor".
+    """
+    url = urlsplit(path)
+    name = 'index.html' + ('?' + url.query if url.query else '')
+    return '/'.join([*filter(None, url.path.split('/')), name])
+
+
+def signature(*data):
+    """A digest of the data a page is rendered from."""
+    return hashlib.sha256(repr(data).encode('utf-8')).hexdigest()[:16]
+
+
+def _write_atomically(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def load(directory):
+    """path -> signature for the pages from the last build in `directory`."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# Each worker process renders with its own copy of the app.
+_client = None
+_base_url = None
+
+def _init_worker(import_name, base_url):
+    global _client, _base_url
+    _client = locate_app(import_name, None).test_client()
+    _base_url = base_url
+
+def _render(path):
+    response = _client.get(path, base_url=_base_url, environ_overrides={STATIC_BUILD: True})
+    return path, response.status_code, response.get_data()
+
+
+def build(import_name, directory, pages, base_url, jobs=None, force=False):
+    """Renders the pages (path -> signature) whose signatures changed since the
+    last build into `directory`, using `jobs` processes, and removes pages
+    that are no longer listed.
+
+    Returns (rendered paths, unchanged paths, failures as (path, status)).
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = load(directory)
+    stale = [path for (path, page_signature) in pages.items()
+             if force or previous.get(path) != page_signature
+             or not os.path.exists(os.path.join(directory, file_path(path)))]
+
+    built = {path: previous[path] for path in pages if path in previous and path not in stale}
+    rendered, failures = [], []
+    if stale:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs, initializer=_init_worker, initargs=(import_name, base_url)) as executor:
+            for path, status, body in executor.map(_render, stale, chunksize=8):
+                target = os.path.join(directory, file_path(path))
+                if status != 200:
+                    # Leave it to the site rather than serve an outdated copy.
+                    if os.path.exists(target):
+                        os.unlink(target)
+                    failures.append((path, status))
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _write_atomically(target, body)
+                built[path] = pages[path]
+                rendered.append(path)
+
+    for path in previous.keys() - pages.keys():
+        try:
+            os.unlink(os.path.join(directory, file_path(path)))
+        except FileNotFoundError:
+            pass
+    _write_atomically(os.path.join(directory, MANIFEST), json.dumps(built, indent=2, sort_keys=True).encode('utf-8'))
+    return rendered, [path for path in built if path not in rendered], failures
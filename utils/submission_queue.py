@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import db
+
+try:
+    import fcntl
+except ImportError:
+    # Windows.
+    fcntl = None
+    import msvcrt
+
+
+logger = logging.getLogger(__name__)
+
+
+def lock_file(f, shared=False):
+    """Locks an open file until it's closed, so workers sharing a spool take turns."""
+    if fcntl:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    else:
+        # msvcrt only has exclusive locks, on a byte range from the current position.
+        position = f.tell()
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        f.seek(position)
+
+
+def parse_spool_line(line):
+    """A submission tuple from a line of the spool. Lines spooled before
+    submissions had tokens get one from a hash of the line, so they're still
+    only inserted once."""
+    submission = tuple(json.loads(line))
+    if len(submission) == 8:
+        submission = (hashlib.sha1(line.strip().encode('utf-8')).hexdigest(),) + submission
+    return submission
+
+
+def is_busy(error):
+    """Whether a database error is another connection holding the lock, which is worth retrying."""
+    message = str(error)
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+class SubmissionQueue:
+    """Buffers form submissions in memory and writes them from a background thread.
+
+    The web request only has to put the submission on the queue, so it never
+    waits on the SQLite write lock (for example while an ingest command holds
+    it). The writer drains the queue in batches and inserts each batch in a
+    single transaction, retrying with backoff while the database is locked.
+
+    If `spool_path` is set, every submission is also appended to that file and
+    fsync'd before the request returns, and anything still in the spool is
+    replayed when the queue starts, so submissions survive a worker restart.
+    Each submission gets a random token when it's queued, and the submission
+    table's unique index on it keeps a replayed submission from being
+    inserted twice. Two people submitting the same VOD still get two rows.
+
+    Any other error writing a batch (e.g. a missing table) won't go away by
+    retrying, so the batch's submissions are written one at a time and the
+    ones that fail are logged and dropped. With a spool, they're moved to
+    `spool_path` + ".rejected" instead of being replayed.
+    """
+
+    def __init__(self, database, spool_path=None, batch_size=50,
+                 flush_interval=0.5, busy_timeout=5.0, max_backoff=30.0):
+        self.database = database
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.busy_timeout = busy_timeout
+        self.max_backoff = max_backoff
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, submission):
+        """Queues a submission tuple in the same order as `db.create_submission`'s arguments."""
+        submission = (uuid.uuid4().hex,) + tuple(str(v) if v is not None else None for v in submission)
+        self.start()
+        if self.spool_path:
+            self._append_to_spool(submission)
+        self._queue.put(submission)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if self.spool_path:
+                for submission in self._read_spool():
+                    self._queue.put(submission)
+            self._thread = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        rejected = []
+        try:
+            self._write(batch)
+        except Exception:
+            for submission in batch:
+                try:
+                    self._write([submission])
+                except Exception as e:
+                    logger.error('Dropping submission %r, it could not be written: %s', submission, e)
+                    rejected.append(submission)
+
+        if self.spool_path:
+            self._compact_spool(rejected)
+
+    def _write(self, batch):
+        """Inserts a batch, retrying with backoff while the database is locked."""
+        backoff = 0.1
+        while True:
+            try:
+                conn = sqlite3.connect(self.database, timeout=self.busy_timeout)
+                try:
+                    with conn:
+                        db.insert_submissions(conn, batch)
+                finally:
+                    conn.close()
+                return
+            except sqlite3.OperationalError as e:
+                if not is_busy(e):
+                    raise
+                logger.warning('Could not write %d submissions (%s), retrying in %.1fs.', len(batch), e, backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _append_to_spool(self, submission):
+        with open(self.spool_path, 'a', encoding='utf-8') as f:
+            lock_file(f)
+            f.write(json.dumps(submission) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_spool(self):
+        try:
+            with open(self.spool_path, encoding='utf-8') as f:
+                lock_file(f, shared=True)
+                return [parse_spool_line(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _compact_spool(self, rejected=()):
+        """Drops spooled submissions that are now in the database, and moves
+        the `rejected` ones to the rejected file.
+
+        Other workers may share the spool, so rather than truncating it we only
+        remove the entries that are already committed.
+        """
+        if rejected:
+            with open(self.spool_path + '.rejected', 'a', encoding='utf-8') as f:
+                lock_file(f)
+                f.writelines(json.dumps(submission) + '\n' for submission in rejected)
+                f.flush()
+                os.fsync(f.fileno())
+        rejected = set(rejected)
+
+        try:
+            f = open(self.spool_path, 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            return
+
+        with f:
+            lock_file(f)
+            spooled = [parse_spool_line(line) for line in f if line.strip()]
+            pending = [s for s in spooled if s not in rejected]
+            if not spooled:
+                return
+
+            if pending:
+                conn = sqlite3.connect(self.database, timeout=self.busy_timeout)
+                try:
+                    pending = [s for s in pending if not db.submission_exists(conn, s[0])]
+                except sqlite3.OperationalError:
+                    # Try again after the next flush.
+                    if len(pending) == len(spooled):
+                        return
+                finally:
+                    conn.close()
+
+            f.seek(0)
+            f.truncate()
+            for submission in pending:
+                f.write(json.dumps(submission) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,126 @@
+import bisect
+import heapq
+import threading
+from collections import defaultdict
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    """Typeahead over a fixed list of (name, VOD count) pairs.
+
+    Lookups are a binary search over the sorted, normalized names, so they
+    don't touch the database. Prefixes of one or two characters match a large
+    share of the names, so their top results are computed up front. If a prefix
+    matches too few names, the rest are filled in from names that share the
+    most trigrams with the query, which catches most misspellings.
+    """
+
+    def __init__(self, entries, limit=10, precomputed_prefix_length=2, min_fuzzy_length=4):
+        self.limit = limit
+        self.precomputed_prefix_length = precomputed_prefix_length
+        self.min_fuzzy_length = min_fuzzy_length
+
+        # Names that only differ in case or spacing are merged, and shown the
+        # way the one with the most VODs is written.
+        merged = {}
+        for name, vods in entries:
+            if not name or not name.strip():
+                continue
+            key = normalize(name)
+            if key in merged:
+                best_name, best_vods, total = merged[key]
+                merged[key] = (name, vods, total + vods) if vods > best_vods else (best_name, best_vods, total + vods)
+            else:
+                merged[key] = (name, vods, vods)
+
+        # Sorted by normalized name, with the display name and VOD count alongside.
+        rows = sorted((key, name, total) for (key, (name, _, total)) in merged.items())
+        self.keys = [key for (key, _, _) in rows]
+        self.names = [name for (_, name, _) in rows]
+        self.vods = [vods for (_, _, vods) in rows]
+
+        self.by_trigram = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            for trigram in trigrams(key):
+                self.by_trigram[trigram].append(i)
+
+        self.top_for_prefix = {}
+        for i, key in enumerate(self.keys):
+            for length in range(1, min(len(key), precomputed_prefix_length) + 1):
+                self.top_for_prefix.setdefault(key[:length], []).append(i)
+        for prefix, indexes in self.top_for_prefix.items():
+            self.top_for_prefix[prefix] = self._top(indexes, limit)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def suggest(self, query, limit=None):
+        """Returns up to `limit` (name, vods) pairs, prefix matches first, each group by VOD count."""
+        limit = max(1, min(limit or self.limit, self.limit))
+        query = normalize(query)
+        if not query:
+            return []
+
+        if len(query) <= self.precomputed_prefix_length:
+            matches = self.top_for_prefix.get(query, [])[:limit]
+        else:
+            start = bisect.bisect_left(self.keys, query)
+            end = bisect.bisect_left(self.keys, query + '\uffff', lo=start)
+            matches = self._top(range(start, end), limit)
+
+        if len(matches) < limit and len(query) >= self.min_fuzzy_length:
+            seen = set(matches)
+            matches += [i for i in self._fuzzy(query, limit + len(matches)) if i not in seen][:limit - len(matches)]
+
+        return [(self.names[i], self.vods[i]) for i in matches]
+
+    def _top(self, indexes, limit):
+        return heapq.nlargest(limit, indexes, key=lambda i: (self.vods[i], -i))
+
+    def _fuzzy(self, query, limit):
+        query_trigrams = trigrams(query)
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for i in self.by_trigram.get(trigram, ()):
+                shared[i] += 1
+
+        # Require at least half of the query's trigrams, so short queries don't
+        # match everything.
+        threshold = max(1, len(query_trigrams) // 2)
+        candidates = [i for (i, count) in shared.items() if count >= threshold]
+        return heapq.nlargest(limit, candidates, key=lambda i: (shared[i], self.vods[i], -i))
+
+
+class SuggestIndexes:
+    """Per-field SuggestIndex instances, rebuilt when the data generation changes.
+
+    `load_entries(field)` returns the (name, vods) pairs for a field. The
+    indexes are swapped in whole, so readers never see one half-built.
+    """
+
+    def __init__(self, load_entries, **index_options):
+        self.load_entries = load_entries
+        self.index_options = index_options
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, field, generation):
+        built = self._indexes.get(field)
+        if built and built[0] == generation:
+            return built[1]
+
+        with self._lock:
+            built = self._indexes.get(field)
+            if built and built[0] == generation:
+                return built[1]
+            index = SuggestIndex(self.load_entries(field), **self.index_options)
+            self._indexes[field] = (generation, index)
+            return index
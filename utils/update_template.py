@@ -1,24 +1,26 @@
-import sqlite3
 import urllib.parse
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import TypedDict
 
+from utils import profiling
+
 
 db_path = Path(__file__).parent.parent / "database.db"
 
 
 class RecentEvent(TypedDict):
+    id: int
     name: str
     url: str
 
 
 def get_recent_events(num_events: int = 5) -> list[RecentEvent]:
-    conn = sqlite3.connect(db_path)
+    conn = profiling.connect(db_path)
     cursor = conn.cursor()
 
     cursor.execute("""
-        SELECT name
+        SELECT id, name
         FROM event
         ORDER BY id DESC
         LIMIT ?
@@ -31,9 +33,10 @@ def get_recent_events(num_events: int = 5) -> list[RecentEvent]:
     events: list[RecentEvent] = []
 
     for row in rows:
-        event_name = row[0]
+        event_id, event_name = row
 
         events.append({
+            "id": event_id,
             "name": event_name,
             "url": urllib.parse.quote_plus(event_name),
         })
@@ -41,7 +44,7 @@ def get_recent_events(num_events: int = 5) -> list[RecentEvent]:
     return events
 
 def get_last_updated_date() -> str:
-    conn = sqlite3.connect(db_path)
+    conn = profiling.connect(db_path)
     cursor = conn.cursor()
 
     # 1. Try metadata first
@@ -57,15 +60,15 @@ def get_last_updated_date() -> str:
     # 2. Fallback to latest VOD date
     if not date_str:
         cursor.execute("""
-            SELECT vod_date
+            SELECT vod_ts
             FROM vod
-            WHERE vod_date IS NOT NULL
-            ORDER BY vod_date DESC
+            WHERE vod_ts IS NOT NULL
+            ORDER BY vod_ts DESC
             LIMIT 1
         """)
 
         row = cursor.fetchone()
-        date_str = row[0] if row and row[0] else None
+        date_str = datetime.fromtimestamp(row[0], timezone.utc).isoformat() if row else None
 
     conn.close()
 